@@ -1,21 +1,131 @@
-from sqlalchemy.orm import Session
-from app.models import Document
-
-
-def create_document(db: Session, title: str, file_path: str) -> Document:
-    """
-    Create a new document record.
-
-    Args:
-        db (Session): The database session.
-        title (str): The title of the document.
-        file_path (str): The file path of the uploaded document.
-
-    Returns:
-        Document: The created document object.
-    """
-    document = Document(title=title, file_path=file_path, is_processed=False)
-    db.add(document)
-    db.commit()
-    db.refresh(document)
-    return document
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models import Document
+
+
+def create_document(db: Session, title: str, file_path: str, content_hash: str = None) -> Document:
+    """
+    Create a new document record.
+
+    Args:
+        db (Session): The database session.
+        title (str): The title of the document.
+        file_path (str): The file path of the uploaded document.
+        content_hash (str): SHA-256 of the uploaded file.
+
+    Returns:
+        Document: The created document object.
+    """
+    document = Document(title=title, file_path=file_path, is_processed=False, content_hash=content_hash)
+    db.add(document)
+    db.commit()
+    db.refresh(document)
+    return document
+
+
+async def acreate_document(db: AsyncSession, title: str, file_path: str, content_hash: str = None) -> Document:
+    """
+    Async variant of `create_document`.
+    """
+    document = Document(title=title, file_path=file_path, is_processed=False, content_hash=content_hash)
+    db.add(document)
+    await db.commit()
+    await db.refresh(document)
+    return document
+
+
+def get_document(db: Session, document_id: int) -> Document:
+    """
+    Retrieve a document record by ID.
+
+    Args:
+        db (Session): The database session.
+        document_id (int): The ID of the document.
+
+    Returns:
+        Document: The document object, or None if it does not exist.
+    """
+    return db.query(Document).filter(Document.id == document_id).first()
+
+
+async def aget_document(db: AsyncSession, document_id: int) -> Document:
+    """
+    Async variant of `get_document`.
+    """
+    return await db.get(Document, document_id)
+
+
+def get_document_by_hash(db: Session, content_hash: str) -> Document:
+    """
+    Retrieve a document record by the hash of its file.
+
+    Args:
+        db (Session): The database session.
+        content_hash (str): SHA-256 of the file.
+
+    Returns:
+        Document: The document object, or None if no document has this content.
+    """
+    return db.query(Document).filter(Document.content_hash == content_hash).first()
+
+
+async def aget_document_by_hash(db: AsyncSession, content_hash: str) -> Document:
+    """
+    Async variant of `get_document_by_hash`.
+    """
+    return (await db.scalars(select(Document).where(Document.content_hash == content_hash).limit(1))).first()
+
+
+def update_document_file(db: Session, document: Document, file_path: str, content_hash: str) -> Document:
+    """
+    Point a document at a new revision of its file and mark it for reprocessing.
+
+    Args:
+        db (Session): The database session.
+        document (Document): The document to update.
+        file_path (str): The file path of the new revision.
+        content_hash (str): SHA-256 of the new revision.
+
+    Returns:
+        Document: The updated document object.
+    """
+    document.file_path = file_path
+    document.content_hash = content_hash
+    document.is_processed = False
+    db.commit()
+    db.refresh(document)
+    return document
+
+
+async def aupdate_document_file(db: AsyncSession, document: Document, file_path: str, content_hash: str) -> Document:
+    """
+    Async variant of `update_document_file`.
+    """
+    document.file_path = file_path
+    document.content_hash = content_hash
+    document.is_processed = False
+    await db.commit()
+    await db.refresh(document)
+    return document
+
+
+def mark_document_as_processed(db: Session, document_id: int, embedding_version: str = None) -> Document:
+    """
+    Mark a document as processed.
+
+    Args:
+        db (Session): The database session.
+        document_id (int): The ID of the document.
+        embedding_version (str): Embedding provider version the document was processed with.
+
+    Returns:
+        Document: The updated document object.
+    """
+    document = get_document(db, document_id)
+    if document:
+        document.is_processed = True
+        document.embedding_version = embedding_version
+        db.commit()
+        db.refresh(document)
+    return document
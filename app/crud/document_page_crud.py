@@ -1,46 +1,220 @@
-from sqlalchemy.orm import Session
-from app.models import DocumentPage
-
-
-def create_document_page(db: Session, document_id: int, page_number: int, content: str) -> DocumentPage:
-    """
-    Create a new document page record.
-
-    Args:
-        db (Session): The database session.
-        document_id (int): The ID of the parent document.
-        page_number (int): The page number of the document.
-        content (str): The content of the page.
-
-    Returns:
-        DocumentPage: The created document page object.
-    """
-    page = DocumentPage(
-        document_id=document_id,
-        page_number=page_number,
-        content=content,
-        is_processed=False
-    )
-    db.add(page)
-    db.commit()
-    db.refresh(page)
-    return page
-
-
-def mark_page_as_processed(db: Session, page_id: int) -> DocumentPage:
-    """
-    Mark a document page as processed.
-
-    Args:
-        db (Session): The database session.
-        page_id (int): The ID of the document page.
-
-    Returns:
-        DocumentPage: The updated document page object.
-    """
-    page = db.query(DocumentPage).filter(DocumentPage.id == page_id).first()
-    if page:
-        page.is_processed = True
-        db.commit()
-        db.refresh(page)
-    return page
\ No newline at end of file
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models import DocumentPage
+
+
+def create_document_page(db: Session, document_id: int, page_number: int, content: str) -> DocumentPage:
+    """
+    Create a new document page record.
+
+    Args:
+        db (Session): The database session.
+        document_id (int): The ID of the parent document.
+        page_number (int): The page number of the document.
+        content (str): The content of the page.
+
+    Returns:
+        DocumentPage: The created document page object.
+    """
+    page = DocumentPage(
+        document_id=document_id,
+        page_number=page_number,
+        content=content,
+        is_processed=False
+    )
+    db.add(page)
+    db.commit()
+    db.refresh(page)
+    return page
+
+
+def create_document_pages(db: Session, document_id: int, pages: list, is_processed: bool = False) -> list[int]:
+    """
+    Create the page records of a document in a single transaction.
+
+    All rows are written with one executemany insert, with the processed flag
+    set in the same statement, instead of a commit and refresh per page.
+
+    Args:
+        db (Session): The database session.
+        document_id (int): The ID of the parent document.
+        pages (list): Dictionaries with "page_number", "content" and, optionally,
+            "content_hash", "embedding_version" and "is_processed" to override the
+            default for that page.
+        is_processed (bool): The processed flag for pages that do not set one.
+
+    Returns:
+        list[int]: The IDs of the created pages, in the order of `pages`.
+    """
+    if not pages:
+        return []
+    rows = [
+        {
+            "document_id": document_id,
+            "page_number": page["page_number"],
+            "content": page["content"],
+            "is_processed": page.get("is_processed", is_processed),
+            "content_hash": page.get("content_hash"),
+            "embedding_version": page.get("embedding_version"),
+        }
+        for page in pages
+    ]
+    page_ids = db.scalars(
+        insert(DocumentPage).returning(DocumentPage.id, sort_by_parameter_order=True),
+        rows
+    ).all()
+    db.commit()
+    return list(page_ids)
+
+
+def get_page_states(db: Session, document_id: int) -> dict[int, tuple[str, bool, str]]:
+    """
+    Retrieve the content hash, processed flag and embedding version of every page of a document.
+
+    Args:
+        db (Session): The database session.
+        document_id (int): The ID of the parent document.
+
+    Returns:
+        dict[int, tuple[str, bool, str]]: (content_hash, is_processed, embedding_version)
+            keyed by page number.
+    """
+    rows = db.query(
+        DocumentPage.page_number, DocumentPage.content_hash, DocumentPage.is_processed, DocumentPage.embedding_version
+    ).filter(DocumentPage.document_id == document_id)
+    return {
+        page_number: (content_hash, bool(is_processed), embedding_version)
+        for page_number, content_hash, is_processed, embedding_version in rows
+    }
+
+
+def update_document_pages(db: Session, document_id: int, pages: list) -> None:
+    """
+    Replace the content of existing pages of a document in a single transaction.
+
+    Args:
+        db (Session): The database session.
+        document_id (int): The ID of the parent document.
+        pages (list): Dictionaries with "page_number", "content", "content_hash",
+            "is_processed" and, optionally, "embedding_version".
+    """
+    if not pages:
+        return
+    table = DocumentPage.__table__
+    db.execute(
+        update(table)
+        .where(table.c.document_id == bindparam("b_document_id"), table.c.page_number == bindparam("b_page_number"))
+        .values(content=bindparam("b_content"), content_hash=bindparam("b_content_hash"),
+                is_processed=bindparam("b_is_processed"), embedding_version=bindparam("b_embedding_version")),
+        [
+            {
+                "b_document_id": document_id,
+                "b_page_number": page["page_number"],
+                "b_content": page["content"],
+                "b_content_hash": page["content_hash"],
+                "b_is_processed": page["is_processed"],
+                "b_embedding_version": page.get("embedding_version"),
+            }
+            for page in pages
+        ]
+    )
+    db.commit()
+
+
+def delete_pages_after(db: Session, document_id: int, last_page: int) -> int:
+    """
+    Delete the pages of a document that come after a given page number.
+
+    Args:
+        db (Session): The database session.
+        document_id (int): The ID of the parent document.
+        last_page (int): The last page number to keep.
+
+    Returns:
+        int: The number of pages deleted.
+    """
+    result = db.execute(
+        delete(DocumentPage)
+        .where(DocumentPage.document_id == document_id, DocumentPage.page_number > last_page)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def mark_page_as_processed(db: Session, page_id: int) -> DocumentPage:
+    """
+    Mark a document page as processed.
+
+    Args:
+        db (Session): The database session.
+        page_id (int): The ID of the document page.
+
+    Returns:
+        DocumentPage: The updated document page object.
+    """
+    page = db.query(DocumentPage).filter(DocumentPage.id == page_id).first()
+    if page:
+        page.is_processed = True
+        db.commit()
+        db.refresh(page)
+    return page
+
+
+def mark_page_range_as_processed(db: Session, document_id: int, first_page: int, last_page: int,
+                                 embedding_version: str = None) -> int:
+    """
+    Mark a range of pages of a document as processed with a single update.
+
+    Args:
+        db (Session): The database session.
+        document_id (int): The ID of the parent document.
+        first_page (int): The first page number of the range.
+        last_page (int): The last page number of the range, inclusive.
+        embedding_version (str): Embedding provider version the pages were processed with.
+
+    Returns:
+        int: The number of pages updated.
+    """
+    result = db.execute(
+        update(DocumentPage)
+        .where(
+            DocumentPage.document_id == document_id,
+            DocumentPage.page_number.between(first_page, last_page)
+        )
+        .values(is_processed=True, embedding_version=embedding_version)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def count_document_pages(db: Session, document_id: int) -> tuple[int, int]:
+    """
+    Count the pages of a document and how many of them are processed.
+
+    Args:
+        db (Session): The database session.
+        document_id (int): The ID of the parent document.
+
+    Returns:
+        tuple[int, int]: The total number of pages and the number of processed pages.
+    """
+    total, processed = db.execute(_count_pages_query(document_id)).one()
+    return total, int(processed)
+
+
+async def acount_document_pages(db: AsyncSession, document_id: int) -> tuple[int, int]:
+    """
+    Async variant of `count_document_pages`.
+    """
+    total, processed = (await db.execute(_count_pages_query(document_id))).one()
+    return total, int(processed)
+
+
+def _count_pages_query(document_id: int):
+    return select(
+        func.count(DocumentPage.id),
+        func.coalesce(func.sum(case((DocumentPage.is_processed.is_(True), 1), else_=0)), 0)
+    ).where(DocumentPage.document_id == document_id)
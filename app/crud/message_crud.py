@@ -1,33 +1,298 @@
-from sqlalchemy.orm import Session
-from app.models import Message
-
-def create_message(db: Session, content: str, is_ai: bool) -> Message:
-    """
-    Create a new message record.
-
-    Args:
-        db (Session): The database session.
-        content (str): The content of the message.
-        is_ai (bool): Indicates whether the message is from the AI or the user.
-
-    Returns:
-        Message: The created message object.
-    """
-    message = Message(content=content, is_ai=is_ai)
-    db.add(message)
-    db.commit()
-    db.refresh(message)
-    return message
-
-
-def get_all_messages(db: Session) -> list[Message]:
-    """
-    Retrieve all messages from the database.
-
-    Args:
-        db (Session): The database session.
-
-    Returns:
-        list[Message]: A list of all message objects.
-    """
-    return db.query(Message).all()
+from datetime import datetime
+from sqlalchemy import DateTime, String, and_, insert, literal, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.types import TypeDecorator
+from app.models import Message
+
+# Columns a message listing may project
+MESSAGE_FIELDS = ["id", "is_ai", "content", "timestamp", "classification", "classification_source"]
+
+def create_message(db: Session, content: str, is_ai: bool, classification: str = None,
+                   classification_source: str = None) -> Message:
+    """
+    Create a new message record.
+
+    Args:
+        db (Session): The database session.
+        content (str): The content of the message.
+        is_ai (bool): Indicates whether the message is from the AI or the user.
+        classification (str): The label of a user message, if known.
+        classification_source (str): The stage that produced the label.
+
+    Returns:
+        Message: The created message object.
+    """
+    message = Message(content=content, is_ai=is_ai, classification=classification,
+                      classification_source=classification_source)
+    db.add(message)
+    db.commit()
+    db.refresh(message)
+    return message
+
+
+async def acreate_message(db: AsyncSession, content: str, is_ai: bool, classification: str = None,
+                          classification_source: str = None) -> Message:
+    """
+    Async variant of `create_message`.
+    """
+    message = Message(content=content, is_ai=is_ai, classification=classification,
+                      classification_source=classification_source)
+    db.add(message)
+    await db.commit()
+    await db.refresh(message)
+    return message
+
+
+def create_messages(db: Session, messages: list) -> list[dict]:
+    """
+    Create several message records in a single transaction.
+
+    The rows are written with one INSERT ... RETURNING, which also returns the
+    server-generated IDs and timestamps, so no refresh query is needed.
+
+    Args:
+        db (Session): The database session.
+        messages (list): Dictionaries with "content", "is_ai" and, optionally,
+            "classification" and "classification_source".
+
+    Returns:
+        list[dict]: The stored messages with "id", "is_ai", "content" and
+            "timestamp", in the order of `messages`.
+    """
+    result = db.execute(*_insert_messages(messages))
+    stored = [row._asdict() for row in result]
+    db.commit()
+    return stored
+
+
+async def acreate_messages(db: AsyncSession, messages: list) -> list[dict]:
+    """
+    Async variant of `create_messages`.
+    """
+    result = await db.execute(*_insert_messages(messages))
+    stored = [row._asdict() for row in result]
+    await db.commit()
+    return stored
+
+
+def _insert_messages(messages: list) -> tuple:
+    rows = [
+        {
+            "content": message["content"],
+            "is_ai": message["is_ai"],
+            "classification": message.get("classification"),
+            "classification_source": message.get("classification_source"),
+        }
+        for message in messages
+    ]
+    statement = insert(Message).returning(
+        Message.id, Message.is_ai, Message.content, Message.timestamp, sort_by_parameter_order=True
+    )
+    return statement, rows
+
+
+def conversation_turn_rows(user_content: str, ai_content: str, classification: str = None,
+                           classification_source: str = None) -> list[dict]:
+    """
+    Build the rows of a conversation turn for `create_messages`.
+    """
+    return [
+        {"content": user_content, "is_ai": False, "classification": classification,
+         "classification_source": classification_source},
+        {"content": ai_content, "is_ai": True},
+    ]
+
+
+def create_conversation_turn(db: Session, user_content: str, ai_content: str, classification: str = None,
+                             classification_source: str = None) -> tuple[dict, dict]:
+    """
+    Store a user message and the AI response to it in a single transaction.
+
+    Args:
+        db (Session): The database session.
+        user_content (str): The content of the user message.
+        ai_content (str): The content of the AI response.
+        classification (str): The label of the user message.
+        classification_source (str): The stage that produced the label.
+
+    Returns:
+        tuple[dict, dict]: The stored user message and AI response.
+    """
+    user_message, ai_message = create_messages(
+        db, conversation_turn_rows(user_content, ai_content, classification, classification_source)
+    )
+    return user_message, ai_message
+
+
+async def acreate_conversation_turn(db: AsyncSession, user_content: str, ai_content: str, classification: str = None,
+                                    classification_source: str = None) -> tuple[dict, dict]:
+    """
+    Async variant of `create_conversation_turn`.
+    """
+    user_message, ai_message = await acreate_messages(
+        db, conversation_turn_rows(user_content, ai_content, classification, classification_source)
+    )
+    return user_message, ai_message
+
+
+def get_all_messages(db: Session) -> list[Message]:
+    """
+    Retrieve all messages from the database.
+
+    Args:
+        db (Session): The database session.
+
+    Returns:
+        list[Message]: A list of all message objects.
+    """
+    return db.query(Message).all()
+
+
+def get_messages_page(db: Session, limit: int = 100, after_id: int = None, is_ai: bool = None,
+                      since: datetime = None, until: datetime = None,
+                      fields: list = None) -> tuple[list[dict], int]:
+    """
+    Retrieve one page of messages in (timestamp, id) order using keyset pagination.
+
+    Only the requested columns are selected and rows are returned as plain
+    dictionaries, without loading ORM objects. Each page is an index range scan
+    on (timestamp, id), so its cost does not depend on how deep it is.
+
+    Args:
+        db (Session): The database session.
+        limit (int): Maximum number of messages to return.
+        after_id (int): Cursor: the ID of the last message of the previous page. If
+            that message has since been deleted, the page continues after its ID.
+        is_ai (bool): Only return AI (True) or user (False) messages.
+        since (datetime): Only return messages created at or after this time (UTC).
+        until (datetime): Only return messages created before this time (UTC).
+        fields (list): Columns to return, from MESSAGE_FIELDS. "id" is always included.
+
+    Returns:
+        tuple[list[dict], int]: The messages, and the cursor for the next page
+            or None if this is the last page.
+    """
+    rows = db.execute(_messages_page_query(limit, after_id, is_ai, since, until, fields)).all()
+    return _split_page(rows, limit)
+
+
+async def aget_messages_page(db: AsyncSession, limit: int = 100, after_id: int = None, is_ai: bool = None,
+                             since: datetime = None, until: datetime = None,
+                             fields: list = None) -> tuple[list[dict], int]:
+    """
+    Async variant of `get_messages_page`.
+    """
+    rows = (await db.execute(_messages_page_query(limit, after_id, is_ai, since, until, fields))).all()
+    return _split_page(rows, limit)
+
+
+class _StoredTimestamp(TypeDecorator):
+    """
+    Binds a datetime in the format the database stores message timestamps in.
+
+    SQLite stores timestamps as text: CURRENT_TIMESTAMP with whole seconds, and
+    SQLAlchemy with six fractional digits. SQLAlchemy binds datetimes with
+    fractional digits, so a bound whole second compares as text after a stored
+    whole second. On SQLite the bound value is therefore formatted with a
+    fraction only when it has one, which orders correctly against both stored
+    forms. The column itself is left bare so the (timestamp, id) index still
+    serves the range.
+    """
+    impl = DateTime
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        return dialect.type_descriptor(String() if dialect.name == "sqlite" else DateTime())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "sqlite":
+            return value
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f" if value.microsecond else "%Y-%m-%d %H:%M:%S")
+
+
+def _messages_page_query(limit: int, after_id: int, is_ai: bool, since: datetime, until: datetime, fields: list):
+    fields = fields or ["id", "is_ai", "content", "timestamp"]
+    columns = [getattr(Message, field) for field in dict.fromkeys(["id"] + fields)]
+    query = select(*columns)
+
+    if after_id is not None:
+        # Compare against the stored timestamp of the cursor row, not a re-bound value
+        after_timestamp = select(Message.timestamp).where(Message.id == after_id).scalar_subquery()
+        query = query.where(or_(
+            Message.timestamp > after_timestamp,
+            and_(Message.timestamp == after_timestamp, Message.id > after_id),
+            # The cursor row was deleted; IDs grow with timestamps, so continue after its ID
+            and_(after_timestamp.is_(None), Message.id > after_id)
+        ))
+    if is_ai is not None:
+        query = query.where(Message.is_ai.is_(is_ai))
+    if since is not None:
+        query = query.where(Message.timestamp >= literal(since, _StoredTimestamp()))
+    if until is not None:
+        query = query.where(Message.timestamp < literal(until, _StoredTimestamp()))
+
+    return query.order_by(Message.timestamp, Message.id).limit(limit + 1)
+
+
+def _split_page(rows: list, limit: int) -> tuple[list[dict], int]:
+    # One extra row is fetched to tell whether another page follows
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return [row._asdict() for row in rows[:limit]], next_cursor
+
+
+def iter_messages(db: Session, after_id: int = 0, chunk_size: int = 1000, fields: list = None):
+    """
+    Stream messages in ID order, one chunk per short read transaction.
+
+    Each chunk is a separate keyset query (`id > last_id ... LIMIT chunk_size`),
+    so at most one chunk is in memory at a time. The transaction is ended after
+    every chunk so a long export never holds a SQLite lock for its whole duration.
+
+    Args:
+        db (Session): The database session.
+        after_id (int): Only return messages with a greater ID; used to resume an export.
+        chunk_size (int): Messages read per transaction.
+        fields (list): Columns to return, from MESSAGE_FIELDS. "id" is always included.
+
+    Yields:
+        list[dict]: Chunks of messages.
+    """
+    fields = fields or MESSAGE_FIELDS
+    columns = [getattr(Message, field) for field in dict.fromkeys(["id"] + fields)]
+    last_id = after_id or 0
+    while True:
+        result = db.execute(
+            select(*columns)
+            .where(Message.id > last_id)
+            .order_by(Message.id)
+            .limit(chunk_size)
+        )
+        chunk = [row._asdict() for row in result]
+        db.commit()
+        if not chunk:
+            return
+        last_id = chunk[-1]["id"]
+        yield chunk
+
+
+def get_labeled_messages(db: Session, sources: list, limit: int = None) -> list[tuple[str, str]]:
+    """
+    Retrieve the most recent user messages whose label came from one of the given sources.
+
+    Args:
+        db (Session): The database session.
+        sources (list): Accepted values of `classification_source`.
+        limit (int): Maximum number of messages to return.
+
+    Returns:
+        list[tuple[str, str]]: (content, classification) pairs.
+    """
+    query = (
+        db.query(Message.content, Message.classification)
+        .filter(Message.is_ai.is_(False), Message.classification_source.in_(sources))
+        .order_by(Message.id.desc())
+    )
+    if limit:
+        query = query.limit(limit)
+    return [(content, classification) for content, classification in query]
@@ -1,12 +1,157 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 
-DATABASE_URL = "sqlite:///./test.db"  # SQLite database file in the project root
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")  # SQLite database file in the project root by default
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Seconds; -1 disables recycling
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Let migrate_schema delete duplicate rows that block a new unique index
+MIGRATE_DEDUPLICATE = os.getenv("MIGRATE_DEDUPLICATE", "false").lower() == "true"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Async drivers used when ASYNC_DATABASE_URL is not set and is derived from DATABASE_URL
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "mysql": "aiomysql"}
+
+
+def _set_sqlite_pragmas(engine: Engine, journal_mode: str, synchronous: str, busy_timeout_ms: int):
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cursor.close()
+
+
+def _is_memory_database(url) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+
+def _create_engine(factory, queue_pool, url: str, journal_mode: str, synchronous: str, busy_timeout_ms: int,
+                   pool_size: int, max_overflow: int):
+    # Shared by the sync and async factories so their pools and pragmas cannot drift
+    if make_url(url).get_backend_name() != "sqlite":
+        return factory(
+            url, pool_size=pool_size, max_overflow=max_overflow, pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=True
+        )
+
+    connect_args = {"check_same_thread": False, "timeout": busy_timeout_ms / 1000}
+    if _is_memory_database(url):
+        # Every connection to an in-memory database is a separate database
+        engine = factory(url, connect_args=connect_args, poolclass=StaticPool)
+    else:
+        engine = factory(
+            url, connect_args=connect_args, poolclass=queue_pool, pool_size=pool_size,
+            max_overflow=max_overflow, pool_timeout=DB_POOL_TIMEOUT
+        )
+    _set_sqlite_pragmas(getattr(engine, "sync_engine", engine), journal_mode, synchronous, busy_timeout_ms)
+    return engine
+
+
+def create_db_engine(url: str = DATABASE_URL, journal_mode: str = SQLITE_JOURNAL_MODE,
+                     synchronous: str = SQLITE_SYNCHRONOUS, busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS,
+                     pool_size: int = DB_POOL_SIZE, max_overflow: int = DB_MAX_OVERFLOW) -> Engine:
+    """
+    Create the database engine for a URL.
+
+    SQLite files get a connection pool and per-connection pragmas: write-ahead
+    logging lets readers run alongside a writer, `synchronous=NORMAL` only syncs
+    at checkpoints in WAL mode, and the busy timeout makes concurrent writers
+    wait for the lock instead of failing. Other backends (e.g. PostgreSQL) get a
+    bounded pool with pre-ping and connection recycling.
+
+    Args:
+        url (str): The database URL.
+        journal_mode (str): SQLite journal mode (e.g. "WAL", "DELETE").
+        synchronous (str): SQLite synchronous setting (e.g. "NORMAL", "FULL").
+        busy_timeout_ms (int): How long SQLite waits for a lock, in milliseconds.
+        pool_size (int): Connections kept open in the pool.
+        max_overflow (int): Extra connections allowed above `pool_size` under load.
+
+    Returns:
+        Engine: The configured engine.
+    """
+    return _create_engine(create_engine, QueuePool, url, journal_mode, synchronous, busy_timeout_ms,
+                          pool_size, max_overflow)
+
+
+def to_async_url(url: str) -> str:
+    """
+    Derive the URL of the async driver for a database URL, e.g.
+    "sqlite:///./test.db" -> "sqlite+aiosqlite:///./test.db".
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if url.get_driver_name() == ASYNC_DRIVERS.get(backend):
+        return url.render_as_string(hide_password=False)
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+
+def create_async_db_engine(url: str = ASYNC_DATABASE_URL, journal_mode: str = SQLITE_JOURNAL_MODE,
+                           synchronous: str = SQLITE_SYNCHRONOUS, busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS,
+                           pool_size: int = DB_POOL_SIZE, max_overflow: int = DB_MAX_OVERFLOW) -> AsyncEngine:
+    """
+    Create the async database engine for a URL, configured like `create_db_engine`.
+
+    Args:
+        url (str): The database URL, with an async driver (e.g. "sqlite+aiosqlite").
+        journal_mode (str): SQLite journal mode.
+        synchronous (str): SQLite synchronous setting.
+        busy_timeout_ms (int): How long SQLite waits for a lock, in milliseconds.
+        pool_size (int): Connections kept open in the pool.
+        max_overflow (int): Extra connections allowed above `pool_size` under load.
+
+    Returns:
+        AsyncEngine: The configured engine.
+    """
+    return _create_engine(create_async_engine, AsyncAdaptedQueuePool, url, journal_mode, synchronous,
+                          busy_timeout_ms, pool_size, max_overflow)
+
+
+def get_pool_stats(db_engine: Engine | AsyncEngine = None) -> dict:
+    """
+    Report the state of an engine's connection pool.
+
+    Args:
+        db_engine (Engine | AsyncEngine): The engine to inspect; the app's sync engine by default.
+
+    Returns:
+        dict: The backend, pool class and, for queue pools, the pool size and the
+            checked-in, checked-out and overflow connection counts.
+    """
+    db_engine = db_engine or engine
+    if isinstance(db_engine, AsyncEngine):
+        db_engine = db_engine.sync_engine
+    pool = db_engine.pool
+    stats = {"backend": db_engine.dialect.name, "pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        })
+    return stats
+
+
+engine = create_db_engine()
+async_engine = create_async_db_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -15,4 +160,63 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def migrate_schema(deduplicate: bool = MIGRATE_DEDUPLICATE):
+    """
+    Add nullable columns and indexes that were added to the models after their
+    tables were created.
+
+    `Base.metadata.create_all` only creates missing tables, so databases created by
+    an older version of the app are brought up to date here. A unique index that
+    existing rows violate is not created; startup fails instead, unless
+    `deduplicate` is set, in which case all but the newest row of each duplicate
+    group are deleted first.
+
+    Args:
+        deduplicate (bool): Delete duplicate rows that block a unique index.
+
+    Raises:
+        RuntimeError: If a unique index cannot be created because of duplicate rows.
+    """
+    inspector = inspect(engine)
+    missing_indexes = []
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            missing_indexes.extend(index for index in table.indexes if index.name not in existing_indexes)
+
+    for index in missing_indexes:
+        try:
+            with engine.begin() as connection:
+                index.create(bind=connection)
+            continue
+        except IntegrityError:
+            if not deduplicate:
+                columns = ", ".join(column.name for column in index.columns)
+                raise RuntimeError(
+                    f"Cannot create unique index {index.name}: {index.table.name} has duplicate rows for "
+                    f"({columns}). Back up the database and remove the duplicates, or restart with "
+                    f"MIGRATE_DEDUPLICATE=true to keep only the newest row of each duplicate group."
+                ) from None
+        with engine.begin() as connection:
+            table_name = index.table.name
+            columns = ", ".join(column.name for column in index.columns)
+            result = connection.execute(text(
+                f"DELETE FROM {table_name} WHERE id NOT IN (SELECT MAX(id) FROM {table_name} GROUP BY {columns})"
+            ))
+            print(f"Removed {result.rowcount} duplicate rows from {table_name} before adding {index.name}.")
+            index.create(bind=connection)
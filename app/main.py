@@ -1,17 +1,139 @@
-from fastapi import FastAPI
-from app.database import Base, engine
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from starlette.routing import Match
+from app.database import Base, SessionLocal, async_engine, engine, get_pool_stats, migrate_schema
 from app.models import Message, Document, DocumentPage
 from app.routers.messages import router as messages_router
-from app.routers.documents import router as documents_router
+from app.routers.documents import MAX_UPLOAD_BYTES, UPLOAD_FORM_OVERHEAD, router as documents_router
+from app.services.cache import get_cache_stats
+from app.services.classification import train_local_classifier
+from app.services.context_builder import get_prompt_stats
+from app.services.ingestion import shutdown_ingestion
+from app.services.message_writer import message_writer
+from app.services.metrics import (
+    METRICS_SLOW_REQUEST_MS, METRICS_TRACE_HEADER, REQUEST_SECONDS, StatsCollector, request_trace
+)
+from app.services.pdf_processing import shutdown_pdf_workers
+from app.services.providers import aclose_providers, get_provider_stats
+from app.services.vector_store import chroma_store
+from app.services.weather_service import aclose_weather_client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db = SessionLocal()
+    try:
+        print(f"Local classifier trained on {train_local_classifier(db)} labeled messages.")
+    finally:
+        db.close()
+    chroma_store.start()
+    if message_writer is not None:
+        message_writer.start()
+    yield
+    if message_writer is not None:
+        message_writer.stop()
+    shutdown_ingestion()
+    shutdown_pdf_workers()
+    chroma_store.close()
+    await aclose_weather_client()
+    await aclose_providers()
+    await async_engine.dispose()
+
 
 # Initialize the FastAPI application
-app = FastAPI(title="Conversational AI Platform", version="1.0")
+app = FastAPI(title="Conversational AI Platform", version="1.0", lifespan=lifespan)
 app.include_router(messages_router)
 app.include_router(documents_router)
 
 # Automatically create tables
 Base.metadata.create_all(bind=engine)
+migrate_schema()
+
+# Pool, cache, provider and prompt stats are read into gauges when /metrics is scraped
+REGISTRY.register(StatsCollector(
+    pools=lambda: {"sync": get_pool_stats(), "async": get_pool_stats(async_engine)},
+    caches=get_cache_stats,
+    providers=get_provider_stats,
+    prompts=get_prompt_stats,
+))
+
+
+def _route_path(request: Request) -> str:
+    # Label metrics with the route template, e.g. /documents/{document_id}/status
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """
+    Reject a document upload whose declared Content-Length exceeds the upload
+    limit before its body is received.
+
+    The form is parsed, spooling the whole file, before the upload handler runs,
+    so the handler's own check only covers bodies sent without a length.
+    """
+    if request.method == "POST" and request.url.path == "/documents/":
+        length = request.headers.get("content-length", "")
+        if length.isdigit() and int(length) > MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD:
+            return JSONResponse(status_code=413, content={"detail": "The uploaded file is too large."})
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    """
+    Time each request and its stages. Requests with the trace header get a
+    Server-Timing breakdown and an X-Trace-Id; slow requests are logged.
+
+    Stages of a streamed response that run after its headers are sent are
+    recorded in the metrics but not in its Server-Timing header.
+    """
+    route = _route_path(request)
+    with request_trace(route) as trace:
+        response = await call_next(request)
+    elapsed = trace.elapsed()
+    REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(elapsed)
+
+    if request.headers.get(METRICS_TRACE_HEADER):
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-Trace-Id"] = trace.trace_id
+        print(trace.summary())
+    elif METRICS_SLOW_REQUEST_MS is not None and elapsed * 1000 >= METRICS_SLOW_REQUEST_MS:
+        print(trace.summary())
+    return response
+
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Conversational AI Platform!"}
+
+
+@app.get("/cache/stats", summary="Cache statistics", description="Reports hit, miss and eviction counters for the in-process caches.")
+def read_cache_stats():
+    return get_cache_stats()
+
+
+@app.get("/db/stats", summary="Database pool statistics", description="Reports the database backend and the state of the sync and async connection pools.")
+def read_db_stats():
+    return {"sync": get_pool_stats(), "async": get_pool_stats(async_engine)}
+
+
+@app.get("/providers/stats", summary="Provider statistics", description="Reports circuit state, in-flight calls, errors, retries, hedged calls and rejections for each external API.")
+def read_provider_stats():
+    return get_provider_stats()
+
+
+@app.get("/prompts/stats", summary="Prompt size statistics", description="Reports the prompt and context token counts of the RAG generation requests.")
+def read_prompt_stats():
+    return get_prompt_stats()
+
+
+@app.get("/metrics", summary="Prometheus metrics", description="Exposes request, stage and provider latency histograms and gauges of the database pools, caches, providers and prompt sizes in the Prometheus text format.")
+def read_metrics():
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -13,13 +13,19 @@ class Message(Base):
         is_ai (bool): Indicates if the message is from AI.
         content (str): Message content.
         timestamp (datetime): Time when the message was created.
+        classification (str): Label of a user message ('food', 'weather' or 'unknown').
+        classification_source (str): Which stage produced the label ('llm', 'cache' or 'local').
     """
     __tablename__ = "messages"
+    # Keyset pagination walks messages in (timestamp, id) order
+    __table_args__ = (Index("ix_messages_timestamp_id", "timestamp", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     is_ai = Column(Boolean, default=False)
     content = Column(String, nullable=False)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    classification = Column(String, nullable=True)
+    classification_source = Column(String, nullable=True)
 
 
 # Document Model
@@ -32,6 +38,8 @@ class Document(Base):
         title (str): Document title.
         file_path (str): Path to the document file.
         is_processed (bool): Indicates if the document is fully processed.
+        content_hash (str): SHA-256 of the uploaded file.
+        embedding_version (str): Embedding provider version the document was processed with.
         pages (relationship): Relationship to associated document pages.
     """
     __tablename__ = "documents"
@@ -40,6 +48,8 @@ class Document(Base):
     title = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
     is_processed = Column(Boolean, default=False)
+    content_hash = Column(String, nullable=True, index=True)
+    embedding_version = Column(String, nullable=True)
 
     # Relationship with DocumentPage
     pages = relationship("DocumentPage", back_populates="document")
@@ -56,15 +66,21 @@ class DocumentPage(Base):
         page_number (int): Page number within the document.
         content (str): Text content of the page.
         is_processed (bool): Indicates if the page is processed.
+        content_hash (str): SHA-256 of the page text.
+        embedding_version (str): Embedding provider version the page was processed with.
         document (relationship): Relationship to the associated document.
     """
     __tablename__ = "document_pages"
+    # One row per page; ingestion jobs update pages in place
+    __table_args__ = (Index("uq_document_pages_document_page", "document_id", "page_number", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
     page_number = Column(Integer, nullable=False)
     content = Column(String, nullable=False)
     is_processed = Column(Boolean, default=False)
+    content_hash = Column(String, nullable=True)
+    embedding_version = Column(String, nullable=True)
 
     # Relationship with Document
     document = relationship("Document", back_populates="pages")
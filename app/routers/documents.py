@@ -1,80 +1,204 @@
+import hashlib
 import os
-from fastapi import APIRouter, UploadFile, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.crud.document_crud import create_document
-from app.crud.document_page_crud import create_document_page, mark_page_as_processed
-from app.services.pdf_processing import split_pdf_into_pages
-from app.services.vector_store import get_chromadb_client, store_embeddings
+import tempfile
+from fastapi import APIRouter, UploadFile, Depends, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
+from app.crud.document_crud import (
+    acreate_document, aget_document, aget_document_by_hash, aupdate_document_file
+)
+from app.crud.document_page_crud import acount_document_pages
+from app.services import embeddings
+from app.services.ingestion import get_document_job, is_job_active, submit_ingestion_job
+from app.services.metrics import stage
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Room for the multipart boundaries, part headers and form fields around the file
+UPLOAD_FORM_OVERHEAD = 64 * 1024
 
 router = APIRouter()
 
-@router.post("/documents/", summary="Upload and Process PDF Document", description="""
-Upload a PDF document, split it into pages, generate embeddings, and store the data in a vector database.
+# Documents whose revision upload is between its checks and its job submission
+_revisions_in_progress = set()
+# Content hashes of new uploads between their duplicate lookup and their job submission
+_hashes_in_progress = set()
+
+
+async def save_upload(file: UploadFile, upload_dir: str = UPLOAD_DIR) -> tuple[str, str]:
+    """
+    Stream an uploaded file to disk in chunks, hashing it on the way.
+
+    Only one chunk is held in memory at a time. The file is written under a
+    temporary name and moved to a content-addressed path once complete.
+
+    Args:
+        file (UploadFile): The uploaded file.
+        upload_dir (str): Directory to store the file in.
+
+    Returns:
+        tuple[str, str]: The path of the stored file and its SHA-256 hex digest.
+
+    Raises:
+        HTTPException: 413 if the file is larger than MAX_UPLOAD_BYTES.
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=upload_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail="The uploaded file is too large.")
+                digest.update(chunk)
+                await run_in_threadpool(f.write, chunk)
+        content_hash = digest.hexdigest()
+        file_path = os.path.join(upload_dir, f"{content_hash}.pdf")
+        os.replace(temp_path, file_path)
+        return file_path, content_hash
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _is_current(document) -> bool:
+    # Processed with the embedding provider in use, so its vectors are searchable
+    return document.is_processed and document.embedding_version == embeddings.embedding_provider.version
+
+
+async def _remove_if_unused(db: AsyncSession, file_path: str, content_hash: str):
+    # Files are content-addressed, so a file is still in use while a document has its hash
+    if await aget_document_by_hash(db, content_hash) is None and os.path.exists(file_path):
+        os.remove(file_path)
+
+
+@router.post("/documents/", status_code=202, summary="Upload and Process PDF Document", description="""
+Upload a PDF document and queue it for processing. The PDF is split into pages, embedded and stored in a vector database in the background; use the status endpoint to follow progress. Re-uploading an identical file returns the existing document, unless it was embedded with another embedding provider, in which case it is embedded again. To upload a new revision of a document, pass its `document_id`; only the pages that changed are re-embedded. Without `document_id` every upload with new content creates a new document, whatever its file name.
 """)
-async def upload_document(file: UploadFile, db: Session = Depends(get_db)):
+async def upload_document(file: UploadFile, document_id: int = Form(None), db: AsyncSession = Depends(get_async_db)):
     """
-    Upload and process a PDF document.
+    Upload a PDF document and start background processing.
 
     Steps:
     - Validate the file type.
-    - Save the uploaded file.
-    - Create a document record in the database.
-    - Split the PDF into pages and store them in the database.
-    - Generate embeddings for the content and store them in ChromaDB.
-    - Mark pages and the document as processed.
+    - Stream the uploaded file to disk, hashing it and enforcing the size limit.
+    - With `document_id`: update that document to the new revision, unless it is
+      still being processed (409).
+    - Otherwise: if a document with the same content exists, return it; else
+      create a document record. An identical file already being registered by
+      another request is rejected (409).
+    - Queue an ingestion job that splits the PDF into pages, stores them in the
+      database, generates embeddings for new and changed pages, stores them in
+      ChromaDB and marks pages and the document as processed.
+
+    Args:
+        file (UploadFile): The PDF file.
+        document_id (int): The document this file is a new revision of, if any.
+        db (AsyncSession): Database session dependency.
     """
     # Validate file type
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are supported.")
 
+    reserved = reserved_hash = None
     try:
-        upload_dir = "./uploads" # Save the uploaded file
-        os.makedirs(upload_dir, exist_ok=True)
-        file_path = os.path.join(upload_dir, file.filename)
+        if document_id is not None:
+            with stage("db_lookup"):
+                document = await aget_document(db, document_id)
+            if document is None:
+                raise HTTPException(status_code=404, detail="Document not found.")
+            # Checked before the upload is stored, and again before the record changes
+            if document_id in _revisions_in_progress or is_job_active(document_id):
+                raise HTTPException(status_code=409, detail="The document is still being processed; retry when its job has finished.")
 
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
+        with stage("save_upload"):
+            file_path, content_hash = await save_upload(file) # Save the uploaded file
         print(f"File saved at {file_path}.")
 
-        document = create_document(db=db, title=file.filename, file_path=file_path) # Create document record in the database
-        print(f"Document record created with ID: {document.id}.")
-
-        pages = split_pdf_into_pages(file_path)  # Split PDF into pages
-        if not pages:
-            raise HTTPException(status_code=400, detail="Failed to extract pages from the PDF.")
-        print(f"PDF split into {len(pages)} pages.")
-
-        # Store pages in the database and mark as processed
-        for page in pages: 
-            stored_page = create_document_page(
-                db=db,
-                document_id=document.id,
-                page_number=page["page_number"],
-                content=page["content"],
-            )
-            mark_page_as_processed(db, stored_page.id)
-        print(f"Pages stored and marked as processed for document ID: {document.id}.")
-
-        # Embed content and store in ChromaDB
-        client = get_chromadb_client()
-        documents_to_store = [
-            {"document_id": document.id, "page_number": p["page_number"], "content": p["content"]}
-            for p in pages
-        ]
-        store_embeddings(client, collection_name="documents", documents=documents_to_store)
-        print(f"Embeddings stored in ChromaDB for document ID: {document.id}.")
-
-        # Mark the document as processed
-        document.is_processed = True
-        db.commit()
-        print(f"Document ID: {document.id} marked as processed.")
-
-        return {"message": "Document uploaded and processed successfully.", "document_id": document.id}
+        if document_id is not None:
+            if document_id in _revisions_in_progress or is_job_active(document_id):
+                await _remove_if_unused(db, file_path, content_hash)
+                raise HTTPException(status_code=409, detail="The document is still being processed; retry when its job has finished.")
+            if document.content_hash == content_hash and _is_current(document):
+                print(f"File matches document ID: {document.id}; skipping ingestion.")
+                return {"message": "Document already uploaded.", "document_id": document.id, "job_id": None}
+
+            # No await between the check above and the reservation, so concurrent revisions cannot both pass
+            reserved = document_id
+            _revisions_in_progress.add(document_id)
+            previous_path, previous_hash = document.file_path, document.content_hash
+            with stage("db_write"):
+                document = await aupdate_document_file(db, document, file_path, content_hash)
+            if os.path.abspath(previous_path) != os.path.abspath(file_path):
+                await _remove_if_unused(db, previous_path, previous_hash)
+            print(f"Document record ID: {document.id} updated with a new revision.")
+        else:
+            # The file is shared with the other request, so it is not removed here
+            if content_hash in _hashes_in_progress:
+                raise HTTPException(status_code=409, detail="An identical file is being uploaded; retry shortly.")
+            # No await between the check above and the reservation, so concurrent uploads cannot both create a document
+            reserved_hash = content_hash
+            _hashes_in_progress.add(content_hash)
+            with stage("db_lookup"):
+                document = await aget_document_by_hash(db, content_hash)
+            if document is not None and (_is_current(document) or is_job_active(document.id)):
+                print(f"File matches document ID: {document.id}; skipping ingestion.")
+                return {"message": "Document already uploaded.", "document_id": document.id, "job_id": None}
+            if document is not None:
+                # Same content that never finished processing, or was embedded by
+                # another provider; process it again
+                print(f"Document record ID: {document.id} has this content; reprocessing it.")
+            else:
+                with stage("db_write"):
+                    document = await acreate_document(db=db, title=file.filename, file_path=file_path, content_hash=content_hash) # Create document record in the database
+                print(f"Document record created with ID: {document.id}.")
+
+        with stage("enqueue"):
+            job_id = submit_ingestion_job(document.id, file_path)
+        print(f"Ingestion job {job_id} queued for document ID: {document.id}.")
+
+        return {"message": "Document uploaded; processing has started.", "document_id": document.id, "job_id": job_id}
 
     except HTTPException as he:
-        print(f"HTTP error during document processing: {he.detail}")
+        print(f"HTTP error during document upload: {he.detail}")
         raise he
     except Exception as e:
-        print(f"Error processing document: {e}")
-        raise HTTPException(status_code=500, detail="An unexpected error occurred while processing the document.")
\ No newline at end of file
+        print(f"Error uploading document: {e}")
+        raise HTTPException(status_code=500, detail="An unexpected error occurred while uploading the document.")
+    finally:
+        if reserved is not None:
+            _revisions_in_progress.discard(reserved)
+        if reserved_hash is not None:
+            _hashes_in_progress.discard(reserved_hash)
+
+
+@router.get("/documents/{document_id}/status", summary="Get Document Processing Status", description="Reports ingestion progress for an uploaded document, based on the processed flags of the document and its pages.")
+async def get_document_status(document_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Report the processing status of a document.
+
+    Args:
+        document_id (int): The ID of the document.
+        db (AsyncSession): Database session dependency.
+
+    Returns:
+        dict: Document processing flags, page counts and the latest job state.
+    """
+    document = await aget_document(db, document_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+
+    pages_total, pages_processed = await acount_document_pages(db, document_id)
+    job = get_document_job(document_id)
+    return {
+        "document_id": document.id,
+        "title": document.title,
+        "is_processed": document.is_processed,
+        "pages_total": pages_total,
+        "pages_processed": pages_processed,
+        "job": job,
+    }
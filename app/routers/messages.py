@@ -1,21 +1,182 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.crud.message_crud import create_message, get_all_messages
-from app.services.classification import classify_message
-from app.services.vector_store import retrieve_relevant_documents
-from app.services.weather_service import get_weather_data, generate_weather_response
-from groq import Groq
-import os
-
-# Initialize the Groq client with the API key from environment variables
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import SessionLocal, get_async_db
+from app.crud.message_crud import MESSAGE_FIELDS, aget_messages_page, iter_messages
+from app.services.classification import aclassify_message_with_source
+from app.services.context_builder import CONTEXT_RETRIEVAL_K, build_context, record_prompt
+from app.services.message_writer import astore_conversation_turn
+from app.services.metrics import atimed, stage
+from app.services.providers import groq_provider
+from app.services.vector_store import aembed_query, aretrieve_relevant_chunks, build_where
+from app.services.weather_service import aget_weather_data, agenerate_weather_response, astream_weather_response
 
 router = APIRouter()
 
 
-@router.post("/messages/", summary="Classify and handle user messages", description="Classifies a user message as either 'food' or 'weather', generates an appropriate response using RAG or a weather API, and stores both the message and response in the database.")
-def handle_message(content: str, db: Session = Depends(get_db)):
+def _discard(task: asyncio.Task):
+    """
+    Cancel a speculative task whose result is no longer needed.
+    """
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()  # Mark a failure as retrieved so it is not logged
+
+
+NO_DOCUMENTS_RESPONSE = "I'm sorry, I couldn't find relevant information to answer your query."
+UNSUPPORTED_RESPONSE = "I'm sorry, I can only handle food or weather queries."
+
+
+def _format_event(event: str, data: dict) -> str:
+    """
+    Format a server-sent event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+async def _classify_and_gather(content: str, embedding_task: asyncio.Task, where: dict = None):
+    """
+    Classify a message and gather what its response needs.
+
+    The weather fetch starts speculatively only if classification has to go past
+    the exact-match cache and the local classifier, i.e. when it takes a network
+    round trip that the fetch can overlap with. A speculative fetch that misses
+    the weather cache still completes after its task is cancelled, because it is
+    shared with concurrent requests. A message that turns out not to be about the
+    weather then costs one WeatherAPI call, which refreshes the cached reading.
+
+    Args:
+        content (str): The content of the user message.
+        embedding_task (asyncio.Task): The speculative query embedding.
+        where (dict): Metadata filter for food retrieval, from `build_where`.
+
+    Returns:
+        tuple: The classification, its source, and the context for the response:
+            retrieved chunks for "food", weather data for "weather", else None.
+    """
+    weather_task = None
+
+    def speculate_weather():
+        nonlocal weather_task
+        weather_task = asyncio.create_task(atimed("weather", aget_weather_data))
+
+    try:
+        # The classifier reuses the speculative embedding for its semantic cache
+        with stage("classify"):
+            classification, classification_source = await aclassify_message_with_source(
+                content, embedding_task=embedding_task, on_remote=speculate_weather
+            )
+
+        if classification == "food":
+            try:
+                query_embedding = await embedding_task
+            except Exception as e:
+                print(f"Error embedding query: {e}")
+                query_embedding = None
+            with stage("vector_query"):
+                context = await aretrieve_relevant_chunks(content, collection_name="documents",
+                                                          top_k=CONTEXT_RETRIEVAL_K, where=where,
+                                                          query_embedding=query_embedding)
+        elif classification == "weather":
+            _discard(embedding_task)
+            context = await (weather_task or atimed("weather", aget_weather_data))
+        else:
+            _discard(embedding_task)
+            context = None
+        return classification, classification_source, context
+    finally:
+        if weather_task is not None:
+            _discard(weather_task)
+
+
+async def _stream_response(content: str, classification: str, context):
+    """
+    Yield the AI response in pieces as the model produces them.
+    """
+    if classification == "food":
+        if context:
+            async for token in astream_groq_response(content, context):
+                yield token
+        else:
+            yield NO_DOCUMENTS_RESPONSE
+    elif classification == "weather":
+        async for token in astream_weather_response(context):
+            yield token
+    else:
+        yield UNSUPPORTED_RESPONSE
+
+
+# Interrupted streams whose partial response is still being stored
+_pending_writes = set()
+
+
+async def _event_stream(content: str, embedding_task: asyncio.Task, where: dict = None):
+    """
+    Produce the server-sent events of a streamed message.
+
+    Events:
+        classification: Sent once the message is classified.
+        token: A piece of the AI response.
+        done: The stored user message and AI response.
+        error: Sent instead of "done" if the message could not be processed.
+    """
+    pieces = []
+    write_attempted = False
+    classification = classification_source = None
+    try:
+        classification, classification_source, context = await _classify_and_gather(content, embedding_task, where)
+        yield _format_event("classification", {"classification": classification})
+
+        with stage("generate"):
+            async for token in _stream_response(content, classification, context):
+                pieces.append(token)
+                yield _format_event("token", {"content": token})
+
+        write_attempted = True
+        with stage("db_write"):
+            user_message, ai_message = await astore_conversation_turn(
+                content, "".join(pieces), classification, classification_source
+            )
+        yield _format_event("done", {
+            "user_message": user_message,
+            "ai_response": ai_message,
+            "classification": classification
+        })
+    except Exception as e:
+        print(f"Error streaming message: {e}")
+        yield _format_event("error", {"detail": "An error occurred while processing the message."})
+    finally:
+        _discard(embedding_task)
+        if not write_attempted and pieces:
+            # The client went away mid-stream; keep what was generated so far. The
+            # write is shielded so a further cancellation cannot abandon it halfway
+            write = asyncio.ensure_future(
+                astore_conversation_turn(content, "".join(pieces), classification, classification_source)
+            )
+            _pending_writes.add(write)
+            write.add_done_callback(_pending_writes.discard)
+            try:
+                await asyncio.shield(write)
+            except Exception as e:
+                print(f"Error storing interrupted stream: {e}")
+
+
+@router.post("/messages/", summary="Classify and handle user messages", description="Classifies a user message as either 'food' or 'weather', generates an appropriate response using RAG or a weather API, and stores both the message and response in the database. With `stream=true` the response is sent as server-sent events while it is generated. `document_id`, `min_page` and `max_page` restrict the documents a food answer is based on.")
+async def handle_message(
+    content: str,
+    stream: bool = False,
+    document_id: int = Query(None, description="Only answer food questions from this document."),
+    min_page: int = Query(None, description="Only answer from pages from this page number on."),
+    max_page: int = Query(None, description="Only answer from pages up to this page number."),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Handle user messages by:
 
@@ -25,105 +186,284 @@ def handle_message(content: str, db: Session = Depends(get_db)):
        - For "weather": Fetch weather data and format a response.
     3. Storing the user message and AI response in the database.
 
+    The query embedding starts speculatively while the message is being
+    classified, and so does the weather fetch when classification needs the
+    network (see `_classify_and_gather`); what is not needed is cancelled.
+    Each stage is timed (see `app.services.metrics`).
+
     Args:
         content (str): The content of the user message.
-        db (Session): Database session dependency.
+        stream (bool): Stream the AI response as server-sent events.
+        document_id (int): Only retrieve chunks of this document.
+        min_page (int): Only retrieve chunks of pages from this page number on.
+        max_page (int): Only retrieve chunks of pages up to this page number.
+        db (AsyncSession): Database session dependency.
 
     Returns:
-        dict: Contains user message, AI response, and classification.
+        dict: Contains user message, AI response, and classification, or a
+            StreamingResponse of events when `stream` is set.
     """
+    where = build_where(document_id=document_id, min_page=min_page, max_page=max_page)
+    embedding_task = asyncio.create_task(atimed("embed", aembed_query, content))
+
+    if stream:
+        return StreamingResponse(
+            _event_stream(content, embedding_task, where),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
     try:
-        
-        classification = classify_message(content) # Classify the message
+        classification, classification_source, context = await _classify_and_gather(content, embedding_task, where)
 
         # Generate response based on classification
-        if classification == "food":
-            documents = retrieve_relevant_documents(content, collection_name="documents")
-            if documents:
-                response = generate_groq_response(content, documents)
+        with stage("generate"):
+            if classification == "food":
+                if context:
+                    response = await agenerate_groq_response(content, context)
+                else:
+                    response = NO_DOCUMENTS_RESPONSE
+            elif classification == "weather":
+                response = await agenerate_weather_response(context)
             else:
-                response = "I'm sorry, I couldn't find relevant information to answer your query."
-        elif classification == "weather":
-            weather_data = get_weather_data()
-            response = generate_weather_response(weather_data)
-        else:
-            response = "I'm sorry, I can only handle food or weather queries."
+                response = UNSUPPORTED_RESPONSE
 
-        # Save user message and AI response in the database
-        user_message = create_message(db=db, content=content, is_ai=False)
-        ai_message = create_message(db=db, content=response, is_ai=True)
+        # Save user message and AI response in the database in one transaction
+        with stage("db_write"):
+            user_message, ai_message = await astore_conversation_turn(
+                content, response, classification, classification_source, db=db
+            )
 
         # Return serialized response
         return {
-            "user_message": {
-                "id": user_message.id,
-                "is_ai": user_message.is_ai,
-                "content": user_message.content,
-                "timestamp": user_message.timestamp
-            },
-            "ai_response": {
-                "id": ai_message.id,
-                "is_ai": ai_message.is_ai,
-                "content": ai_message.content,
-                "timestamp": ai_message.timestamp
-            },
+            "user_message": user_message,
+            "ai_response": ai_message,
             "classification": classification
         }
 
     except Exception as e:
         print(f"Error handling message: {e}")
         raise HTTPException(status_code=500, detail="An error occurred while processing the message.")
+    finally:
+        _discard(embedding_task)
+
+
+def _to_utc(value: datetime) -> datetime:
+    # Timestamps are stored as naive UTC
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 
-@router.get("/messages/", summary="Retrieve all messages", description="Fetches all stored messages, including both user messages and AI responses, from the database.")
-def get_all_messages_endpoint(db: Session = Depends(get_db)):
+@router.get("/messages/", summary="Retrieve messages", description="Fetches stored messages, including both user messages and AI responses, one page at a time in creation order. Pass the `X-Next-Cursor` response header as `cursor` to fetch the next page; the header is absent on the last page.")
+async def get_all_messages_endpoint(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: int = Query(None, description="ID of the last message of the previous page."),
+    is_ai: bool = Query(None, description="Only return AI (true) or user (false) messages."),
+    since: datetime = Query(None, description="Only return messages created at or after this time."),
+    until: datetime = Query(None, description="Only return messages created before this time."),
+    fields: str = Query(None, description=f"Comma-separated columns to return, from: {', '.join(MESSAGE_FIELDS)}."),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Retrieve all messages from the database.
+    Retrieve a page of messages from the database.
 
     Args:
-        db (Session): Database session dependency.
+        response (Response): The response, used to set the next-page cursor header.
+        limit (int): Maximum number of messages to return.
+        cursor (int): The ID of the last message of the previous page.
+        is_ai (bool): Only return AI or user messages.
+        since (datetime): Only return messages created at or after this time.
+        until (datetime): Only return messages created before this time.
+        fields (str): Comma-separated columns to return.
+        db (AsyncSession): Database session dependency.
 
     Returns:
-        list: List of all messages stored in the database.
+        list: The messages of the page.
     """
+    selected = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    if selected and any(field not in MESSAGE_FIELDS for field in selected):
+        raise HTTPException(status_code=400, detail=f"Unknown field; allowed fields are: {', '.join(MESSAGE_FIELDS)}.")
+
     try:
-        return get_all_messages(db=db)
+        messages, next_cursor = await aget_messages_page(
+            db=db, limit=limit, after_id=cursor, is_ai=is_ai, since=_to_utc(since), until=_to_utc(until),
+            fields=selected
+        )
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = str(next_cursor)
+        return messages
     except Exception as e:
         print(f"Error retrieving messages: {e}")
         raise HTTPException(status_code=500, detail="An error occurred while retrieving messages.")
 
 
+def _export_rows(format: str, after_id: int, chunk_size: int, fields: list):
+    """
+    Yield an export of the messages table, one chunk of lines at a time.
+
+    Uses its own session because the stream outlives the request dependencies.
+    """
+    db = SessionLocal()
+    try:
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=list(dict.fromkeys(["id"] + fields)))
+            writer.writeheader()
+            yield buffer.getvalue()
+        for chunk in iter_messages(db, after_id=after_id, chunk_size=chunk_size, fields=fields):
+            if format == "csv":
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=list(chunk[0]))
+                writer.writerows(jsonable_encoder(chunk))
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(row) + "\n" for row in jsonable_encoder(chunk))
+    finally:
+        db.close()
+
+
+@router.get("/messages/export", summary="Export messages", description="Streams every stored message in ID order as NDJSON or CSV with constant memory. To resume an interrupted export, pass the ID of the last exported message as `after_id`.")
+def export_messages(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    after_id: int = Query(0, ge=0, description="Only export messages with a greater ID."),
+    chunk_size: int = Query(1000, ge=1, le=10000),
+    fields: str = Query(None, description=f"Comma-separated columns to export, from: {', '.join(MESSAGE_FIELDS)}."),
+):
+    """
+    Stream an export of all messages.
+
+    Args:
+        format (str): "ndjson" or "csv".
+        after_id (int): Only export messages with a greater ID.
+        chunk_size (int): Messages read per database transaction.
+        fields (str): Comma-separated columns to export.
+
+    Returns:
+        StreamingResponse: The export.
+    """
+    selected = [field.strip() for field in fields.split(",") if field.strip()] if fields else MESSAGE_FIELDS
+    if any(field not in MESSAGE_FIELDS for field in selected):
+        raise HTTPException(status_code=400, detail=f"Unknown field; allowed fields are: {', '.join(MESSAGE_FIELDS)}.")
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export_rows(format, after_id, chunk_size, selected),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="messages.{format}"'}
+    )
+
+
+def _build_groq_messages(query: str, documents: list) -> tuple[list, dict]:
+    # Packing the most relevant chunks into the context token budget
+    context, context_stats = build_context(documents)
+
+    # Constructing the prompt
+    prompt = f"User Query: {query}\n\nContext:\n{context}\n\nAnswer:"
+
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant for food-related queries."},
+        {"role": "user", "content": prompt}
+    ]
+    return messages, context_stats
+
+
+def _usage_prompt_tokens(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "prompt_tokens", None)
+
+
 def generate_groq_response(query: str, documents: list) -> str:
     """
     Generate a response using Groq's Llama-3.3-70b-versatile model.
 
     Args:
         query (str): The user's query.
-        documents (list): Retrieved documents for context.
+        documents (list): Retrieved chunks or documents for context.
 
     Returns:
         str: Generated response from the Groq model.
     """
     try:
-        # Combining documents into a single context string
-        context = "\n".join([doc["content"] for doc in documents if "content" in doc])
-
-        # Constructing the prompt
-        prompt = f"User Query: {query}\n\nContext:\n{context}\n\nAnswer:"
-
-        # Using the Groq client to generate a response
-        response = groq_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant for food-related queries."},
-                {"role": "user", "content": prompt}
-            ],
+        messages, context_stats = _build_groq_messages(query, documents)
+
+        # Using the pooled Groq client to generate a response
+        response = groq_provider.call(
+            groq_provider.client.chat.completions.create,
+            messages=messages,
             model="llama-3.3-70b-versatile",
             temperature=0.7,
             max_tokens=300
         )
 
+        record_prompt(messages, context_stats, _usage_prompt_tokens(response))
+
         # Extract and return the response
         return response.choices[0].message.content.strip()
     except Exception as e:
         print(f"Error generating response with Groq: {e}")
-        return "Unable to generate a response at the moment."
\ No newline at end of file
+        return "Unable to generate a response at the moment."
+
+
+async def agenerate_groq_response(query: str, documents: list) -> str:
+    """
+    Async variant of `generate_groq_response`.
+
+    Args:
+        query (str): The user's query.
+        documents (list): Retrieved chunks or documents for context.
+
+    Returns:
+        str: Generated response from the Groq model.
+    """
+    try:
+        messages, context_stats = _build_groq_messages(query, documents)
+        response = await groq_provider.acall(
+            groq_provider.async_client.chat.completions.create,
+            messages=messages,
+            model="llama-3.3-70b-versatile",
+            temperature=0.7,
+            max_tokens=300
+        )
+
+        record_prompt(messages, context_stats, _usage_prompt_tokens(response))
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"Error generating response with Groq: {e}")
+        return "Unable to generate a response at the moment."
+
+
+async def astream_groq_response(query: str, documents: list):
+    """
+    Stream a response from Groq's Llama-3.3-70b-versatile model.
+
+    Args:
+        query (str): The user's query.
+        documents (list): Retrieved chunks or documents for context.
+
+    Yields:
+        str: Pieces of the generated response as they arrive.
+    """
+    produced = False
+    try:
+        messages, context_stats = _build_groq_messages(query, documents)
+        # Streamed responses carry no usage, so the prompt is counted locally
+        record_prompt(messages, context_stats)
+        stream = groq_provider.astream(
+            groq_provider.async_client.chat.completions.create,
+            messages=messages,
+            model="llama-3.3-70b-versatile",
+            temperature=0.7,
+            max_tokens=300,
+            stream=True
+        )
+        async for chunk in stream:
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                produced = True
+                yield token
+    except Exception as e:
+        print(f"Error streaming response with Groq: {e}")
+        if not produced:
+            yield "Unable to generate a response at the moment."
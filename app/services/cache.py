@@ -0,0 +1,400 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows; a disk cache namespace then supports a single process only
+    fcntl = None
+
+# Every cache registers itself here so its counters can be reported together
+_caches = {}
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional time-to-live and memory bound.
+
+    Attributes:
+        name (str): Name the cache is reported under.
+        maxsize (int): Maximum number of entries before the least recently used is evicted.
+        ttl (float): Seconds an entry stays valid, or None for no expiry.
+        max_bytes (int): Maximum total size of the values, or None for no bound.
+        sizeof (callable): Returns the size in bytes of a value; required with `max_bytes`.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = None, max_bytes: int = None,
+                 sizeof=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        _caches[name] = self
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for a key, or `default` if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                self.bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Store a value, evicting the least recently used entries if the cache is full.
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self._data[key] = (value, expires_at, size)
+            self.bytes += size
+            while len(self._data) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """
+        Return the cache counters.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SimilarityCache:
+    """
+    Thread-safe nearest-neighbour cache that maps embeddings to values.
+
+    A lookup returns the value of the most similar stored embedding when its cosine
+    similarity reaches the threshold. Once full, the oldest entry is replaced.
+
+    Attributes:
+        name (str): Name the cache is reported under.
+        maxsize (int): Maximum number of stored embeddings.
+        threshold (float): Minimum cosine similarity for a hit.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, threshold: float = 0.95):
+        self.name = name
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._vectors = None
+        self._values = [None] * maxsize
+        self._count = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _caches[name] = self
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding, default=None):
+        """
+        Return the value of the nearest stored embedding, or `default` if none is similar enough.
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            if self._count and self._vectors.shape[1] == query.shape[0]:
+                similarities = self._vectors[:self._count] @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    return self._values[best]
+            self.misses += 1
+            return default
+
+    def set(self, embedding, value):
+        """
+        Store an embedding and its value, replacing the oldest entry if the cache is full.
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            elif self._vectors.shape[1] != vector.shape[0]:
+                return
+            if self._count == self.maxsize:
+                self.evictions += 1
+            self._vectors[self._next] = vector
+            self._values[self._next] = value
+            self._next = (self._next + 1) % self.maxsize
+            self._count = min(self._count + 1, self.maxsize)
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._values = [None] * self.maxsize
+            self._count = 0
+            self._next = 0
+
+    def __len__(self):
+        return self._count
+
+    def stats(self) -> dict:
+        """
+        Return the cache counters.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": self._count,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class DiskEmbeddingCache:
+    """
+    Persistent cache of text embeddings, keyed by the hash of the text.
+
+    Each namespace, normally an embedding model version, is a directory with
+    two append-only files: "vectors.f32" holds the float32 vectors row by row,
+    and "keys.bin" holds the SHA-1 digest of the text of each row. Vectors are
+    read through a memory map, so the cache costs no heap beyond its key index.
+    A vector is written before its key, so a crash can leave an orphan vector
+    but never a key without one.
+
+    Several processes, e.g. uvicorn workers, can share a namespace: appends hold
+    an exclusive lock on the "lock" file and number their rows from the file
+    sizes, and every lookup first indexes the rows other processes appended.
+    "meta.json" records a generation that changes whenever the namespace is
+    cleared and written again, so no process keeps using row numbers from before.
+
+    Attributes:
+        name (str): Name the cache is reported under.
+        path (str): Root directory of the cache.
+        namespace (str): Subdirectory, e.g. the embedding model version.
+    """
+
+    KEY_BYTES = 20
+
+    def __init__(self, name: str, path: str, namespace: str):
+        self.name = name
+        self.path = path
+        self.namespace = namespace
+        self.directory = os.path.join(path, re.sub(r"[^A-Za-z0-9._-]+", "-", namespace))
+        self.dimensions = None
+        self._generation = None
+        self._meta_stat = None
+        self._rows = {}
+        self._indexed = 0
+        self._map = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        _caches[name] = self
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.sha1(text.encode("utf-8")).digest()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _size(self, name: str) -> int:
+        try:
+            return os.path.getsize(self._file(name))
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def _file_lock(self):
+        # Serialise writers across processes; called with the thread lock held
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._file("lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield  # Closing the file releases the lock
+
+    def _complete_rows(self) -> int:
+        # Rows whose key and vector are both fully written
+        if self.dimensions is None:
+            return 0
+        return min(self._size("keys.bin") // self.KEY_BYTES, self._size("vectors.f32") // (4 * self.dimensions))
+
+    def _reset(self):
+        self._rows, self._indexed, self._map = {}, 0, None
+        self.dimensions = self._generation = self._meta_stat = None
+
+    def _sync(self):
+        # Index the rows appended since the last call, by any process; called with the lock held
+        try:
+            stat = os.stat(self._file("meta.json"))
+        except FileNotFoundError:
+            # Not written yet, or cleared by another process
+            if self._meta_stat is not None:
+                self._reset()
+            return
+        # meta.json is written once per generation, so it only changes when the namespace is recreated
+        if (stat.st_ino, stat.st_mtime_ns) != self._meta_stat:
+            with open(self._file("meta.json")) as meta_file:
+                meta = json.load(meta_file)
+            if meta.get("generation") != self._generation or self.dimensions is None:
+                self._reset()
+                self._generation = meta.get("generation")
+                self.dimensions = meta["dimensions"]
+            self._meta_stat = (stat.st_ino, stat.st_mtime_ns)
+        rows = self._complete_rows()
+        if rows > self._indexed:
+            with open(self._file("keys.bin"), "rb") as keys_file:
+                keys_file.seek(self._indexed * self.KEY_BYTES)
+                keys = keys_file.read((rows - self._indexed) * self.KEY_BYTES)
+            for row in range(rows - self._indexed):
+                self._rows[keys[row * self.KEY_BYTES:(row + 1) * self.KEY_BYTES]] = self._indexed + row
+            self._indexed = rows
+
+    def _vectors(self):
+        # Map the vector file, remapping after it has grown; called with the lock held
+        if self._map is None or len(self._map) < self._indexed:
+            self._map = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r").reshape(-1, self.dimensions)
+        return self._map
+
+    def get_many(self, texts: list) -> list:
+        """
+        Return the cached embedding of each text, or None where it is missing.
+        """
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            self._sync()
+            rows = [self._rows.get(key) for key in keys]
+            found = [row for row in rows if row is not None]
+            vectors = self._vectors() if found else None
+            result = [np.array(vectors[row]) if row is not None else None for row in rows]
+            self.hits += len(found)
+            self.misses += len(rows) - len(found)
+        return result
+
+    def set_many(self, texts: list, embeddings):
+        """
+        Append the embeddings of texts that are not cached yet.
+
+        Raises:
+            ValueError: If the embeddings do not have the dimensions of the cache.
+        """
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock, self._file_lock():
+            if not os.path.exists(self._file("meta.json")):
+                meta = {"namespace": self.namespace, "dimensions": int(vectors.shape[1]),
+                        "generation": uuid.uuid4().hex}
+                # Written whole under a temporary name, so readers never see a partial file
+                with open(self._file("meta.json.tmp"), "w") as meta_file:
+                    json.dump(meta, meta_file)
+                os.replace(self._file("meta.json.tmp"), self._file("meta.json"))
+            self._sync()
+            if vectors.shape[1] != self.dimensions:
+                raise ValueError(f"Embeddings have {vectors.shape[1]} dimensions; the cache "
+                                 f"'{self.namespace}' stores {self.dimensions}.")
+
+            new = {}
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                if key not in self._rows and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+            # No other writer holds the lock, so anything past the complete rows is
+            # the tail of an interrupted append; drop it so new rows line up
+            with open(self._file("vectors.f32"), "ab") as vectors_file:
+                vectors_file.truncate(self._indexed * 4 * self.dimensions)
+                vectors_file.write(np.stack(list(new.values())).tobytes())
+            with open(self._file("keys.bin"), "ab") as keys_file:
+                keys_file.truncate(self._indexed * self.KEY_BYTES)
+                keys_file.write(b"".join(new))
+            self._sync()
+            self.writes += len(new)
+
+    def clear(self):
+        """
+        Delete the stored embeddings of the namespace.
+        """
+        with self._lock, self._file_lock():
+            self._reset()
+            # Removed rather than truncated: maps other processes hold stay readable
+            for name in ("meta.json", "keys.bin", "vectors.f32"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+
+    def __len__(self):
+        with self._lock:
+            self._sync()
+            return len(self._rows)
+
+    def stats(self) -> dict:
+        """
+        Return the cache counters.
+        """
+        size = len(self)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "namespace": self.namespace,
+            "dimensions": self.dimensions,
+            "bytes": size * 4 * (self.dimensions or 0),
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def get_cache_stats() -> dict:
+    """
+    Return the counters of every registered cache, keyed by cache name.
+    """
+    return {name: cache.stats() for name, cache in _caches.items()}
@@ -0,0 +1,105 @@
+import os
+import re
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+# Words, numbers and individual punctuation marks; close to the token counts of
+# subword tokenizers for English prose without depending on one
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_END = re.compile(r"[.!?]$")
+
+
+def tokenize(text: str) -> list[tuple[int, int]]:
+    """
+    Split a text into tokens.
+
+    Args:
+        text (str): Text to tokenize.
+
+    Returns:
+        list[tuple[int, int]]: The (start, end) character offsets of each token.
+    """
+    return [match.span() for match in TOKEN_PATTERN.finditer(text)]
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of a text as `tokenize` splits them.
+    """
+    return sum(1 for _ in TOKEN_PATTERN.finditer(text))
+
+
+def _window_end(text: str, tokens: list, start: int, chunk_tokens: int) -> int:
+    """
+    Choose the end of a window starting at token `start`, preferring to end on a
+    sentence boundary within the last quarter of the window.
+    """
+    end = min(start + chunk_tokens, len(tokens))
+    if end == len(tokens):
+        return end
+    for boundary in range(end, start + (3 * chunk_tokens) // 4, -1):
+        if SENTENCE_END.search(text[tokens[boundary - 1][0]:tokens[boundary - 1][1]]):
+            return boundary
+    return end
+
+
+def chunk_page(document_id: int, page_number: int, content: str, chunk_tokens: int = CHUNK_TOKENS,
+               overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> list[dict]:
+    """
+    Split the text of a page into overlapping token windows.
+
+    Windows end on a sentence boundary when one falls in their last quarter, and
+    each window repeats the last `overlap_tokens` tokens of the previous one so a
+    passage that straddles two windows is whole in at least one of them.
+
+    Args:
+        document_id (int): The ID of the document.
+        page_number (int): The page number of the page.
+        content (str): The text of the page.
+        chunk_tokens (int): Maximum tokens per chunk.
+        overlap_tokens (int): Tokens shared by consecutive chunks.
+
+    Returns:
+        list[dict]: Chunks with "document_id", "page_number", "chunk_index",
+            "content", "char_start", "char_end" (offsets in the page text) and "tokens".
+    """
+    tokens = tokenize(content or "")
+    chunks = []
+    start = 0
+    while start < len(tokens):
+        end = _window_end(content, tokens, start, chunk_tokens)
+        char_start, char_end = tokens[start][0], tokens[end - 1][1]
+        chunks.append({
+            "document_id": document_id,
+            "page_number": page_number,
+            "chunk_index": len(chunks),
+            "content": content[char_start:char_end],
+            "char_start": char_start,
+            "char_end": char_end,
+            "tokens": end - start,
+        })
+        if end == len(tokens):
+            break
+        start = max(end - overlap_tokens, start + 1)
+    return chunks
+
+
+def chunk_documents(documents: list, chunk_tokens: int = CHUNK_TOKENS,
+                    overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> list[dict]:
+    """
+    Chunk a list of pages, keeping their order.
+
+    Args:
+        documents (list): Pages with "document_id", "page_number" and "content".
+        chunk_tokens (int): Maximum tokens per chunk.
+        overlap_tokens (int): Tokens shared by consecutive chunks.
+
+    Returns:
+        list[dict]: The chunks of every page, as returned by `chunk_page`.
+    """
+    return [
+        chunk
+        for doc in documents
+        for chunk in chunk_page(doc["document_id"], doc["page_number"], doc["content"], chunk_tokens, overlap_tokens)
+    ]
@@ -1,48 +1,273 @@
+import asyncio
+import re
 import openai
 import os
 from dotenv import load_dotenv
+from app.crud.message_crud import get_labeled_messages
+from app.services.cache import LRUCache, SimilarityCache
+from app.services.local_classifier import NaiveBayesClassifier
+from app.services.providers import openai_provider
+from app.services.vector_store import aembed_query, embed_query
 
 # Load environment variables
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+CLASSIFICATION_LABELS = ["food", "weather", "unknown"]
+
+CLASSIFICATION_CACHE_SIZE = int(os.getenv("CLASSIFICATION_CACHE_SIZE", "10000"))
+CLASSIFICATION_CACHE_TTL = float(os.getenv("CLASSIFICATION_CACHE_TTL", "86400"))
+# The semantic layer costs an embedding call, which is still far cheaper than GPT-4
+CLASSIFICATION_SEMANTIC_CACHE = os.getenv("CLASSIFICATION_SEMANTIC_CACHE", "true").lower() == "true"
+CLASSIFICATION_SEMANTIC_CACHE_SIZE = int(os.getenv("CLASSIFICATION_SEMANTIC_CACHE_SIZE", "5000"))
+CLASSIFICATION_SIMILARITY_THRESHOLD = float(os.getenv("CLASSIFICATION_SIMILARITY_THRESHOLD", "0.95"))
+
+LOCAL_CLASSIFIER = os.getenv("LOCAL_CLASSIFIER", "true").lower() == "true"
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+LOCAL_CLASSIFIER_TRAINING_LIMIT = int(os.getenv("LOCAL_CLASSIFIER_TRAINING_LIMIT", "50000"))
+# LLM-labeled messages of each label, "unknown" included, before the local stage answers
+LOCAL_CLASSIFIER_MIN_EXAMPLES = int(os.getenv("LOCAL_CLASSIFIER_MIN_EXAMPLES", "20"))
+
+# Sources whose labels are trusted as training data; local predictions are not
+# fed back to avoid reinforcing the classifier's own mistakes
+TRUSTED_LABEL_SOURCES = ["llm", "cache"]
+
+exact_cache = LRUCache("classification_exact", maxsize=CLASSIFICATION_CACHE_SIZE, ttl=CLASSIFICATION_CACHE_TTL)
+semantic_cache = SimilarityCache(
+    "classification_semantic",
+    maxsize=CLASSIFICATION_SEMANTIC_CACHE_SIZE,
+    threshold=CLASSIFICATION_SIMILARITY_THRESHOLD
+)
+
+# Any object with predict(text) -> (label, confidence) can be plugged in
+local_classifier = NaiveBayesClassifier(min_examples=LOCAL_CLASSIFIER_MIN_EXAMPLES) if LOCAL_CLASSIFIER else None
+
+
+def set_local_classifier(classifier):
+    """
+    Replace the local classifier stage, or disable it with None.
+
+    Args:
+        classifier: An object with `predict(text) -> (label, confidence)`, or None.
+    """
+    global local_classifier
+    local_classifier = classifier
+
+
+def train_local_classifier(db) -> int:
+    """
+    Train the local classifier on stored user messages labeled by the LLM.
+
+    Args:
+        db (Session): The database session.
+
+    Returns:
+        int: Number of training examples used.
+    """
+    if local_classifier is None or not hasattr(local_classifier, "fit"):
+        return 0
+    examples = get_labeled_messages(db, TRUSTED_LABEL_SOURCES, limit=LOCAL_CLASSIFIER_TRAINING_LIMIT)
+    local_classifier.fit(examples)
+    return len(examples)
+
+
+def normalize_message(content: str) -> str:
+    """
+    Normalize a message for cache lookups: lowercase, collapse whitespace and
+    drop surrounding punctuation.
+
+    Args:
+        content (str): User's message content.
+
+    Returns:
+        str: The normalized text.
+    """
+    return re.sub(r"\s+", " ", content.lower()).strip(" \t\n?!.,;:'\"")
+
+
+def _build_classification_messages(content: str) -> list:
+    return [
+        {"role": "system", "content": "You are an assistant that classifies user messages into categories. "
+                                      "The categories are:\n"
+                                      "1. 'food': If the message is related to food, recipes, or cooking.\n"
+                                      "2. 'weather': If the message is related to weather or forecasts.\n"
+                                      "3. 'unknown': If the message does not fit into the above categories."},
+        {"role": "user", "content": f"Classify this message: {content}\n"
+                                    "Respond with only one word: 'food', 'weather', or 'unknown'."}
+    ]
+
+
+def _parse_classification(response) -> str:
+    # Extract the classification
+    classification = response.choices[0].message['content'].strip().lower()
+
+    # Ensure valid classification
+    if classification in CLASSIFICATION_LABELS:
+        return classification
+    return "unknown"
+
+
+def _classify_with_llm(content: str) -> str:
+    """
+    Ask GPT-4 for the label of a message. Errors are raised to the caller.
+    """
+    response = openai_provider.call(
+        openai.ChatCompletion.create,
+        model="gpt-4",
+        messages=_build_classification_messages(content),
+        max_tokens=5,
+        temperature=0,  # Reduce randomness
+        request_timeout=openai_provider.timeout
+    )
+    return _parse_classification(response)
+
+
+async def _aclassify_with_llm(content: str) -> str:
+    """
+    Async variant of `_classify_with_llm`.
+    """
+    response = await openai_provider.acall(
+        openai.ChatCompletion.acreate,
+        model="gpt-4",
+        messages=_build_classification_messages(content),
+        max_tokens=5,
+        temperature=0,  # Reduce randomness
+        request_timeout=openai_provider.timeout,
+        hedge=True
+    )
+    return _parse_classification(response)
+
+
+def _classify_locally(content: str, key: str):
+    """
+    Run the in-process stages: the exact-match cache, then the local classifier.
+
+    Returns:
+        tuple[str, str]: The label and its source, or None if neither stage answered.
+    """
+    classification = exact_cache.get(key)
+    if classification:
+        return classification, "cache"
+
+    if local_classifier is not None:
+        classification, confidence = local_classifier.predict(content)
+        if confidence >= LOCAL_CLASSIFIER_THRESHOLD:
+            return classification, "local"
+    return None
+
+
+def _record_llm_label(content: str, key: str, embedding, classification: str):
+    """
+    Feed a label returned by the LLM to the caches and the local classifier.
+    """
+    exact_cache.set(key, classification)
+    if embedding is not None:
+        semantic_cache.set(embedding, classification)
+    if local_classifier is not None and hasattr(local_classifier, "update"):
+        local_classifier.update(content, classification)
+
+
+def classify_message_with_source(content: str) -> tuple[str, str]:
+    """
+    Classify a user message and report which stage produced the label.
+
+    Stages run from cheapest to most expensive: an exact-match cache on the
+    normalized text, the in-process local classifier (used only above its
+    confidence threshold), a semantic cache that reuses the label of the most
+    similar previously classified message, and finally GPT-4.
+
+    Args:
+        content (str): User's message content.
+
+    Returns:
+        tuple[str, str]: The label ('food', 'weather' or 'unknown') and its source
+            ('cache', 'local' or 'llm'), or None as the source when classification failed.
+    """
+    key = normalize_message(content)
+    result = _classify_locally(content, key)
+    if result:
+        return result
+
+    embedding = None
+    if CLASSIFICATION_SEMANTIC_CACHE and key:
+        try:
+            embedding = embed_query(content)
+            classification = semantic_cache.get(embedding)
+            if classification:
+                exact_cache.set(key, classification)
+                return classification, "cache"
+        except Exception as e:
+            print(f"Semantic classification cache lookup failed: {e}")
+
+    try:
+        classification = _classify_with_llm(content)
+    except Exception:
+        # Fallback for errors during classification; not cached
+        return "unknown", None
+
+    _record_llm_label(content, key, embedding, classification)
+    return classification, "llm"
+
+
+async def aclassify_message_with_source(content: str, embedding_task: asyncio.Task = None,
+                                        on_remote=None) -> tuple[str, str]:
+    """
+    Async variant of `classify_message_with_source`.
+
+    Args:
+        content (str): User's message content.
+        embedding_task (asyncio.Task): A task running `aembed_query(content)`, for
+            example one started speculatively by the caller. It is awaited only if
+            the semantic cache is reached; otherwise the embedding is computed here.
+        on_remote (callable): Called without arguments when the in-process stages
+            did not answer, before the stages that need the network run. Lets the
+            caller start work that only pays off when classification is slow.
+
+    Returns:
+        tuple[str, str]: The label and its source, as for `classify_message_with_source`.
+    """
+    key = normalize_message(content)
+    result = _classify_locally(content, key)
+    if result:
+        return result
+    if on_remote is not None:
+        on_remote()
+
+    embedding = None
+    if CLASSIFICATION_SEMANTIC_CACHE and key:
+        try:
+            if embedding_task is not None:
+                embedding = await asyncio.shield(embedding_task)
+            else:
+                embedding = await aembed_query(content)
+            classification = semantic_cache.get(embedding)
+            if classification:
+                exact_cache.set(key, classification)
+                return classification, "cache"
+        except Exception as e:
+            print(f"Semantic classification cache lookup failed: {e}")
+
+    try:
+        classification = await _aclassify_with_llm(content)
+    except Exception:
+        # Fallback for errors during classification; not cached
+        return "unknown", None
+
+    _record_llm_label(content, key, embedding, classification)
+    return classification, "llm"
+
 
 def classify_message(content: str) -> str:
     """
     Classify a user message as 'food', 'weather', or 'unknown' using OpenAI.
 
+    See `classify_message_with_source` for the cache and local classifier stages
+    tried before the model is called.
+
     Args:
         content (str): User's message content.
 
     Returns:
         str: One of 'food', 'weather', or 'unknown'.
     """
-    try:
-        messages = [
-            {"role": "system", "content": "You are an assistant that classifies user messages into categories. "
-                                          "The categories are:\n"
-                                          "1. 'food': If the message is related to food, recipes, or cooking.\n"
-                                          "2. 'weather': If the message is related to weather or forecasts.\n"
-                                          "3. 'unknown': If the message does not fit into the above categories."},
-            {"role": "user", "content": f"Classify this message: {content}\n"
-                                        "Respond with only one word: 'food', 'weather', or 'unknown'."}
-        ]
-
-        response = openai.ChatCompletion.create(
-            model="gpt-4", 
-            messages=messages,
-            max_tokens=5,
-            temperature=0  # Reduce randomness
-        )
-
-        # Extract the classification
-        classification = response.choices[0].message['content'].strip().lower()
-
-        # Ensure valid classification
-        if classification in ["food", "weather", "unknown"]:
-            return classification
-        return "unknown"
-    
-    except Exception:
-        # Fallback for errors during classification
-        return "unknown"
+    return classify_message_with_source(content)[0]
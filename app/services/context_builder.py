@@ -0,0 +1,183 @@
+import os
+import threading
+from collections import deque
+from app.services.chunking import count_tokens, tokenize
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Chunks retrieved per query; the budget decides how many of them are used
+CONTEXT_RETRIEVAL_K = int(os.getenv("CONTEXT_RETRIEVAL_K", "8"))
+# A chunk that does not fit is truncated only if at least this many tokens remain
+CONTEXT_MIN_PARTIAL_TOKENS = int(os.getenv("CONTEXT_MIN_PARTIAL_TOKENS", "48"))
+# Marks a truncated chunk; its tokens count against the budget
+TRUNCATION_MARK = " ..."
+
+
+def _as_chunk(document) -> dict:
+    # Retrieval returns chunk dictionaries; plain strings are accepted too
+    if isinstance(document, str):
+        return {"content": document, "score": None}
+    return document
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def _trim_overlap(chunk: dict, covered: dict) -> tuple:
+    """
+    Remove the parts of a chunk whose page offsets are already in the context.
+
+    Returns:
+        tuple: The remaining text, and its (start, end) page offsets or None if the
+            chunk has no offsets. The text is empty if the chunk is fully covered.
+    """
+    start, end = chunk.get("char_start"), chunk.get("char_end")
+    text = chunk["content"]
+    if start is None or end is None:
+        return text, None
+    for covered_start, covered_end in covered.get((chunk.get("document_id"), chunk.get("page_number")), []):
+        if covered_start <= start and end <= covered_end:
+            return "", None
+        if covered_start <= start < covered_end:
+            # Overlapping windows: keep the part after the covered range
+            text, start = text[covered_end - start:], covered_end
+        elif covered_start < end <= covered_end:
+            text, end = text[:covered_start - start], covered_start
+    return text.strip(), (start, end)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    tokens = tokenize(text)
+    if len(tokens) <= max_tokens:
+        return text
+    keep = max_tokens - count_tokens(TRUNCATION_MARK)
+    if keep <= 0:
+        return ""
+    return text[:tokens[keep - 1][1]] + TRUNCATION_MARK
+
+
+def build_context(documents: list, budget: int = CONTEXT_TOKEN_BUDGET) -> tuple[str, dict]:
+    """
+    Assemble retrieved text into a prompt context that fits a token budget.
+
+    Chunks are taken in order of relevance. Text already in the context is
+    skipped: exact duplicates, and the overlapping part of windows from the same
+    page. Chunks are added while they fit. The first chunk that does not fit is
+    truncated if enough of the budget remains, and packing stops there.
+
+    Args:
+        documents (list): Chunks as returned by `retrieve_relevant_chunks`, or plain strings.
+        budget (int): Maximum context tokens.
+
+    Returns:
+        tuple[str, dict]: The context, and counts of the chunks "retrieved",
+            "used" and "duplicates", and the "context_tokens".
+    """
+    chunks = [_as_chunk(document) for document in documents]
+    # Stable sort: chunks without a score keep their retrieval order
+    ranked = sorted(enumerate(chunks), key=lambda item: (-(item[1].get("score") or 0), item[0]))
+
+    sections = []
+    seen = set()
+    covered = {}
+    duplicates = 0
+    used_tokens = 0
+    for _, chunk in ranked:
+        text, span = _trim_overlap(chunk, covered)
+        if not text or _normalize(text) in seen or any(_normalize(text) in section for section in seen):
+            duplicates += 1
+            continue
+
+        page = chunk.get("page_number")
+        header = f"[Document {chunk.get('document_id')}, page {page}]\n" if page is not None else ""
+        tokens = count_tokens(header) + count_tokens(text)
+        remaining = budget - used_tokens
+        if tokens > remaining:
+            if remaining - count_tokens(header) >= CONTEXT_MIN_PARTIAL_TOKENS:
+                text = _truncate(text, remaining - count_tokens(header))
+                sections.append(header + text)
+                used_tokens += count_tokens(header) + count_tokens(text)
+            break
+
+        sections.append(header + text)
+        seen.add(_normalize(text))
+        if span is not None:
+            covered.setdefault((chunk.get("document_id"), page), []).append(span)
+        used_tokens += tokens
+
+    stats = {
+        "retrieved": len(chunks),
+        "used": len(sections),
+        "duplicates": duplicates,
+        "context_tokens": used_tokens,
+    }
+    return "\n\n".join(sections), stats
+
+
+class PromptTokenStats:
+    """
+    Thread-safe record of the prompt size of each generation request.
+
+    Attributes:
+        window (int): Number of recent requests kept for percentiles.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.context_tokens = 0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, prompt_tokens: int, context_tokens: int):
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.context_tokens += context_tokens
+            self._recent.append(prompt_tokens)
+
+    def stats(self) -> dict:
+        """
+        Return totals, the mean and the recent median, 95th percentile and maximum of the prompt size.
+        """
+        with self._lock:
+            recent = sorted(self._recent)
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "context_tokens": self.context_tokens,
+                "mean_prompt_tokens": self.prompt_tokens / self.requests if self.requests else 0.0,
+                "p50_prompt_tokens": recent[len(recent) // 2] if recent else 0,
+                "p95_prompt_tokens": recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0,
+                "max_prompt_tokens": recent[-1] if recent else 0,
+            }
+
+
+prompt_token_stats = PromptTokenStats()
+
+
+def record_prompt(messages: list, context_stats: dict, prompt_tokens: int = None) -> int:
+    """
+    Record the prompt size of a generation request.
+
+    Args:
+        messages (list): The chat messages sent to the model.
+        context_stats (dict): The statistics returned by `build_context`.
+        prompt_tokens (int): The prompt tokens reported by the provider, if any;
+            otherwise the prompt is counted locally.
+
+    Returns:
+        int: The recorded prompt tokens.
+    """
+    if prompt_tokens is None:
+        prompt_tokens = sum(count_tokens(message["content"]) for message in messages)
+    prompt_token_stats.record(prompt_tokens, context_stats["context_tokens"])
+    return prompt_tokens
+
+
+def get_prompt_stats() -> dict:
+    """
+    Return the prompt size statistics of the generation requests.
+    """
+    return prompt_token_stats.stats()
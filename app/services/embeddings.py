@@ -0,0 +1,239 @@
+import asyncio
+import importlib.util
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+import openai
+from app.services.cache import DiskEmbeddingCache
+from app.services.providers import openai_provider
+
+# "openai" embeds with the OpenAI API; "local" runs a model on the CPU
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "64"))
+# Concurrent inference calls; the model already uses several cores per call
+LOCAL_EMBEDDING_CONCURRENCY = int(os.getenv("LOCAL_EMBEDDING_CONCURRENCY", "1"))
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache")
+
+# The model bundled with chromadb, usable without sentence-transformers
+ONNX_MODEL = "all-MiniLM-L6-v2"
+# Collections created before embedding models were configurable have no suffix
+LEGACY_OPENAI_MODEL = "text-embedding-ada-002"
+
+
+def _slug(value: str) -> str:
+    return "-" + re.sub(r"[^a-z0-9]+", "-", value.lower()).strip("-")[:40]
+
+
+class EmbeddingProvider(ABC):
+    """
+    Interface of an embedding backend.
+
+    Attributes:
+        name (str): Backend name.
+        model (str): Model name.
+        collection_suffix (str): Appended to vector store collection names, so
+            vectors of different models are never mixed in one collection.
+    """
+
+    name = "base"
+    collection_suffix = ""
+
+    def __init__(self, model: str):
+        self.model = model
+
+    @property
+    def version(self) -> str:
+        """
+        Identify the backend and model; embeddings are cached per version.
+        """
+        return f"{self.name}-{self.model}"
+
+    @abstractmethod
+    def embed(self, texts: list) -> np.ndarray:
+        """
+        Embed texts.
+
+        Args:
+            texts (list): Texts to embed.
+
+        Returns:
+            np.ndarray: One float32 row per text, in the same order as the input.
+        """
+
+    async def aembed(self, texts: list) -> np.ndarray:
+        """
+        Async variant of `embed`; runs it in a worker thread unless overridden.
+        """
+        return await asyncio.to_thread(self.embed, texts)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """
+    Embeds texts with the OpenAI embeddings endpoint through the shared provider policy.
+    """
+
+    name = "openai"
+
+    def __init__(self, model: str):
+        super().__init__(model)
+        # The legacy default keeps the unsuffixed collections it has always used
+        self.collection_suffix = "" if model == LEGACY_OPENAI_MODEL else _slug(model)
+
+    @staticmethod
+    def _vectors(response) -> np.ndarray:
+        data = sorted(response["data"], key=lambda item: item["index"])
+        return np.asarray([item["embedding"] for item in data], dtype=np.float32)
+
+    def embed(self, texts: list) -> np.ndarray:
+        response = openai_provider.call(
+            openai.Embedding.create, input=texts, model=self.model, request_timeout=openai_provider.timeout
+        )
+        return self._vectors(response)
+
+    async def aembed(self, texts: list) -> np.ndarray:
+        response = await openai_provider.acall(
+            openai.Embedding.acreate, input=texts, model=self.model, request_timeout=openai_provider.timeout,
+            hedge=True
+        )
+        return self._vectors(response)
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    Embeds texts on the CPU with batched inference.
+
+    Uses sentence-transformers when it is installed, which supports any of its
+    models. Otherwise uses the ONNX build of all-MiniLM-L6-v2 that ships with
+    chromadb. The model is loaded on first use (downloaded on the first run).
+    The two backends do not produce identical vectors, so the backend is part
+    of the version and the collection suffix.
+
+    Attributes:
+        batch_size (int): Texts per inference batch.
+        backend (str): "sentence-transformers" or "onnx".
+    """
+
+    name = "local"
+
+    def __init__(self, model: str = LOCAL_EMBEDDING_MODEL, batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE,
+                 max_concurrency: int = LOCAL_EMBEDDING_CONCURRENCY):
+        super().__init__(model)
+        self.batch_size = batch_size
+        has_sentence_transformers = importlib.util.find_spec("sentence_transformers") is not None
+        self.backend = "sentence-transformers" if has_sentence_transformers else "onnx"
+        self.collection_suffix = _slug(model) + ("" if has_sentence_transformers else "-onnx")
+        self._encode = None
+        self._load_lock = threading.Lock()
+        self._slots = threading.Semaphore(max_concurrency)
+
+    def _load(self):
+        with self._load_lock:
+            if self._encode is not None:
+                return self._encode
+            if self.backend == "sentence-transformers":
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(self.model, device="cpu")
+                self._encode = lambda texts: model.encode(
+                    texts, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True
+                )
+            elif self.model == ONNX_MODEL:
+                from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+                model = ONNXMiniLM_L6_V2()
+                self._encode = lambda texts: np.concatenate([
+                    np.asarray(model(texts[start:start + self.batch_size]))
+                    for start in range(0, len(texts), self.batch_size)
+                ])
+            else:
+                raise ValueError(f"Local embedding model '{self.model}' requires sentence-transformers; "
+                                 f"without it only '{ONNX_MODEL}' is available.")
+            return self._encode
+
+    @property
+    def version(self) -> str:
+        return f"{self.name}-{self.backend}-{self.model}"
+
+    def embed(self, texts: list) -> np.ndarray:
+        encode = self._encode or self._load()
+        with self._slots:
+            return np.asarray(encode(list(texts)), dtype=np.float32)
+
+
+def create_embedding_provider(name: str = EMBEDDING_PROVIDER) -> EmbeddingProvider:
+    """
+    Create an embedding backend by name.
+
+    Args:
+        name (str): "openai" or "local".
+
+    Returns:
+        EmbeddingProvider: The backend.
+    """
+    if name == "openai":
+        return OpenAIEmbeddingProvider(OPENAI_EMBEDDING_MODEL)
+    if name == "local":
+        return LocalEmbeddingProvider()
+    raise ValueError(f"Unknown embedding provider '{name}'; expected 'openai' or 'local'.")
+
+
+embedding_provider = create_embedding_provider()
+embedding_cache = (
+    DiskEmbeddingCache("embeddings", EMBEDDING_CACHE_PATH, embedding_provider.version) if EMBEDDING_CACHE else None
+)
+
+
+def collection_name_for(name: str) -> str:
+    """
+    Return the vector store collection that holds the current model's vectors for `name`.
+    """
+    return name + embedding_provider.collection_suffix
+
+
+def _split_cached(texts: list, cache):
+    # Look up each text; return the cached vectors and the distinct texts to embed
+    vectors = cache.get_many(texts) if cache is not None else [None] * len(texts)
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+    return vectors, missing
+
+
+def _merge(texts: list, vectors: list, missing: list, embedded, cache) -> list:
+    if missing:
+        if cache is not None:
+            cache.set_many(missing, embedded)
+        by_text = dict(zip(missing, embedded))
+        vectors = [vector if vector is not None else by_text[text] for text, vector in zip(texts, vectors)]
+    return [np.asarray(vector, dtype=np.float32).tolist() for vector in vectors]
+
+
+def embed_texts(texts: list, provider: EmbeddingProvider = None, cache: DiskEmbeddingCache = None) -> list:
+    """
+    Embed texts, embedding each distinct text not in the cache once.
+
+    Args:
+        texts (list): Texts to embed.
+        provider (EmbeddingProvider): Backend; defaults to the configured one.
+        cache (DiskEmbeddingCache): Cache; defaults to the configured one.
+
+    Returns:
+        list: One embedding per text, in the same order as the input.
+    """
+    provider = provider or embedding_provider
+    cache = cache if cache is not None else embedding_cache
+    vectors, missing = _split_cached(texts, cache)
+    embedded = provider.embed(missing) if missing else None
+    return _merge(texts, vectors, missing, embedded, cache)
+
+
+async def aembed_texts(texts: list, provider: EmbeddingProvider = None, cache: DiskEmbeddingCache = None) -> list:
+    """
+    Async variant of `embed_texts`.
+    """
+    provider = provider or embedding_provider
+    cache = cache if cache is not None else embedding_cache
+    vectors, missing = _split_cached(texts, cache)
+    embedded = await provider.aembed(missing) if missing else None
+    return _merge(texts, vectors, missing, embedded, cache)
@@ -0,0 +1,227 @@
+import hashlib
+import os
+import uuid
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from app.database import SessionLocal
+from app.crud.document_crud import mark_document_as_processed
+from app.crud.document_page_crud import (
+    create_document_pages, delete_pages_after, get_page_states, mark_page_range_as_processed,
+    update_document_pages
+)
+from app.services import embeddings
+from app.services.metrics import request_trace, stage
+from app.services.pdf_processing import count_pdf_pages, iter_pdf_pages
+from app.services.vector_store import delete_page_embeddings, get_chromadb_client, store_embeddings
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+MAX_TRACKED_JOBS = int(os.getenv("MAX_TRACKED_JOBS", "1000"))
+# Pages persisted and embedded together while the rest of the PDF is still parsing
+INGESTION_PAGE_GROUP = int(os.getenv("INGESTION_PAGE_GROUP", "32"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# In-memory job registry; progress that must survive a restart lives in the
+# Document/DocumentPage is_processed flags.
+_jobs = {}
+_jobs_by_document = {}
+_jobs_lock = threading.Lock()
+
+
+def hash_text(text: str) -> str:
+    """
+    Return the SHA-256 hex digest of a text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=INGESTION_WORKERS, thread_name_prefix="ingestion")
+        return _executor
+
+
+def _update_job(job_id: str, **fields):
+    with _jobs_lock:
+        _jobs[job_id].update(fields)
+
+
+def submit_ingestion_job(document_id: int, file_path: str) -> str:
+    """
+    Queue a document for background ingestion.
+
+    Args:
+        document_id (int): The ID of the document record.
+        file_path (str): Path to the uploaded PDF.
+
+    Returns:
+        str: The job ID.
+    """
+    job_id = uuid.uuid4().hex
+    with _jobs_lock:
+        _jobs[job_id] = {
+            "job_id": job_id,
+            "document_id": document_id,
+            "stage": "queued",
+            "pages_total": None,
+            "pages_parsed": 0,
+            "pages_unchanged": 0,
+            "pages_failed": 0,
+            "error": None,
+        }
+        _jobs_by_document[document_id] = job_id
+        # Forget the oldest finished jobs once the registry is full
+        for old_id in list(_jobs)[:max(0, len(_jobs) - MAX_TRACKED_JOBS)]:
+            if _jobs[old_id]["stage"] in ("completed", "failed"):
+                _jobs_by_document.pop(_jobs[old_id]["document_id"], None)
+                del _jobs[old_id]
+
+    _get_executor().submit(run_ingestion_pipeline, job_id, document_id, file_path)
+    return job_id
+
+
+def get_job(job_id: str) -> dict:
+    """
+    Return a snapshot of an ingestion job, or None if it is unknown.
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def is_job_active(document_id: int) -> bool:
+    """
+    Return whether an ingestion job for a document is queued or running.
+    """
+    job = get_document_job(document_id)
+    return job is not None and job["stage"] not in ("completed", "failed")
+
+
+def get_document_job(document_id: int) -> dict:
+    """
+    Return a snapshot of the latest ingestion job for a document, or None.
+    """
+    with _jobs_lock:
+        job_id = _jobs_by_document.get(document_id)
+    return get_job(job_id) if job_id else None
+
+
+def run_ingestion_pipeline(job_id: str, document_id: int, file_path: str):
+    """
+    Run the ingestion stages for a document: parse, persist pages, embed, index.
+
+    Pages are streamed from the parser in groups, so the first group is stored and
+    embedded while later pages are still being extracted. Ingestion is
+    incremental: a page whose text hash matches an already processed page of the
+    document is skipped, unless it was embedded by another embedding provider
+    version; changed pages replace their stored row and vector, and pages beyond
+    the end of a shorter revision are deleted. Pages are marked as
+    processed as soon as their embeddings are stored, and the document once every
+    page is done.
+
+    Args:
+        job_id (str): The ID of the job being run.
+        document_id (int): The ID of the document record.
+        file_path (str): Path to the uploaded PDF.
+    """
+    # Stages of the job are reported under the "ingestion" endpoint
+    with request_trace("ingestion"):
+        db = SessionLocal()
+        try:
+            _update_job(job_id, stage="parsing")
+            with stage("parse"):
+                pages_total = count_pdf_pages(file_path)
+            if not pages_total:
+                raise ValueError("Failed to extract pages from the PDF.")
+            _update_job(job_id, pages_total=pages_total)
+            embedding_version = embeddings.embedding_provider.version
+
+            def on_batch_stored(batch):
+                # Batches hold pages in order; pages inside the range that were not
+                # embedded are blank or unchanged and already processed
+                mark_page_range_as_processed(db, document_id, batch[0]["page_number"], batch[-1]["page_number"],
+                                             embedding_version)
+
+            client = get_chromadb_client()
+            existing_pages = get_page_states(db, document_id)
+            pages_parsed = 0
+            pages_failed = 0
+            pages_unchanged = 0
+            pages = iter_pdf_pages(file_path)
+            while True:
+                _update_job(job_id, stage="parsing")
+                with stage("parse"):
+                    group = list(islice(pages, INGESTION_PAGE_GROUP))
+                if not group:
+                    break
+                pages_parsed += len(group)
+                _update_job(job_id, stage="persisting", pages_parsed=pages_parsed)
+
+                new_pages = []
+                changed_pages = []
+                for page in group:
+                    page["content_hash"] = hash_text(page["content"])
+                    # Blank pages have nothing to embed, so they are stored as processed
+                    page["is_processed"] = not (page["content"] and page["content"].strip())
+                    page["embedding_version"] = embedding_version if page["is_processed"] else None
+                    existing = existing_pages.get(page["page_number"])
+                    if existing is None:
+                        new_pages.append(page)
+                    elif existing == (page["content_hash"], True, embedding_version):
+                        pages_unchanged += 1
+                    else:
+                        changed_pages.append(page)
+
+                with stage("persist_pages"):
+                    create_document_pages(db, document_id, new_pages)
+                    update_document_pages(db, document_id, changed_pages)
+                if changed_pages:
+                    delete_page_embeddings("documents", document_id,
+                                           page_numbers=[page["page_number"] for page in changed_pages])
+                documents_to_store = [
+                    {"document_id": document_id, "page_number": page["page_number"], "content": page["content"]}
+                    for page in sorted(new_pages + changed_pages, key=lambda page: page["page_number"])
+                    if not page["is_processed"]
+                ]
+
+                _update_job(job_id, stage="embedding", pages_unchanged=pages_unchanged)
+                stored = store_embeddings(client, collection_name="documents", documents=documents_to_store,
+                                          on_batch_stored=on_batch_stored)
+                pages_failed += len(documents_to_store) - stored
+                _update_job(job_id, pages_failed=pages_failed)
+            print(f"Pages stored and embedded for document ID: {document_id} ({pages_unchanged} unchanged).")
+
+            _update_job(job_id, stage="indexing")
+            if existing_pages and max(existing_pages) > pages_parsed:
+                # The new revision is shorter; drop the pages that no longer exist
+                delete_pages_after(db, document_id, pages_parsed)
+                delete_page_embeddings("documents", document_id, after_page=pages_parsed)
+            if not pages_failed:
+                mark_document_as_processed(db, document_id, embedding_version)
+                print(f"Document ID: {document_id} marked as processed.")
+
+            _update_job(job_id, stage="completed")
+
+        except Exception as e:
+            print(f"Error processing document {document_id}: {e}")
+            _update_job(job_id, stage="failed", error=str(e))
+        finally:
+            db.close()
+
+
+def shutdown_ingestion(wait: bool = True):
+    """
+    Stop the ingestion worker pool.
+
+    Args:
+        wait (bool): Whether to wait for running jobs to finish.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
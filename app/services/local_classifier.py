@@ -0,0 +1,145 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+LABELS = ["food", "weather", "unknown"]
+
+# Function words carry no topic, but every label would learn them from the seeds
+STOPWORDS = frozenset("""
+a about above after again all am an and any are as at be been before being below between both but by can
+could did do does doing down during each few for from further had has have having he her here hers him his
+how i if in into is it its itself just like me more most my no nor not now of off on once only or other our
+ours out over own same she should so some such than that the their them then there these they this those
+through to too under until up very was we were what when where which while who whom why will with would
+you your yours going get got gonna let lets please tell know want need make makes made thing things
+""".split())
+
+# Seed vocabulary for the topics, merged with the labels the LLM returns
+SEED_EXAMPLES = [
+    ("recipe cook cooking bake baking ingredients dish meal dinner lunch breakfast", "food"),
+    ("pasta rice bread chicken beef fish soup salad sauce cheese egg eggs vegetables", "food"),
+    ("prepare fry boil roast grill eat taste flavor spicy sweet dessert cake", "food"),
+    ("weather forecast temperature rain raining sunny snow snowing cloudy wind windy", "weather"),
+    ("humidity storm degrees celsius fahrenheit umbrella", "weather"),
+    ("warm chilly freezing thunder", "weather"),
+]
+
+
+def tokenize(text: str) -> list:
+    """
+    Split a message into lowercase word tokens, without stopwords.
+
+    Args:
+        text (str): Message text.
+
+    Returns:
+        list: Word tokens.
+    """
+    return [word for word in re.findall(r"[a-z']+", text.lower()) if word not in STOPWORDS]
+
+
+class NaiveBayesClassifier:
+    """
+    Multinomial naive Bayes over word unigrams.
+
+    Runs in-process in microseconds and can be updated one example at a time, so
+    labels returned by the LLM keep improving it while the app runs. The seed
+    examples alone only know the food and weather vocabulary, so predictions
+    are withheld until the LLM has labeled enough messages of every label.
+
+    Attributes:
+        alpha (float): Additive smoothing.
+        min_examples (int): Labeled examples needed for each label, "unknown"
+            included, before predictions are made.
+    """
+
+    def __init__(self, alpha: float = 1.0, seed_examples: list = SEED_EXAMPLES, min_examples: int = 20):
+        self.alpha = alpha
+        self.seed_examples = seed_examples
+        self.min_examples = min_examples
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._word_counts = {label: defaultdict(int) for label in LABELS}
+        self._total_words = dict.fromkeys(LABELS, 0)
+        self._doc_counts = dict.fromkeys(LABELS, 0)
+        self._vocabulary = set()
+        for text, label in self.seed_examples:
+            self._add(text, label)
+        # Examples added beyond the seeds, per label
+        self._learned = dict.fromkeys(LABELS, 0)
+
+    def _add(self, text: str, label: str):
+        if label not in self._word_counts:
+            return
+        for word, count in Counter(tokenize(text)).items():
+            self._word_counts[label][word] += count
+            self._total_words[label] += count
+            self._vocabulary.add(word)
+        self._doc_counts[label] += 1
+
+    def _learn(self, text: str, label: str):
+        self._add(text, label)
+        if label in self._learned:
+            self._learned[label] += 1
+
+    def fit(self, examples):
+        """
+        Train from scratch on (text, label) pairs, on top of the seed examples.
+
+        Args:
+            examples: Iterable of (text, label) pairs.
+        """
+        with self._lock:
+            self._reset()
+            for text, label in examples:
+                self._learn(text, label)
+
+    def update(self, text: str, label: str):
+        """
+        Add one labeled example.
+        """
+        with self._lock:
+            self._learn(text, label)
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether enough examples of every label have been learned to make predictions.
+        """
+        return all(count >= self.min_examples for count in self._learned.values())
+
+    def predict(self, text: str) -> tuple[str, float]:
+        """
+        Predict the label of a message.
+
+        Args:
+            text (str): Message text.
+
+        Returns:
+            tuple[str, float]: The most likely label and its posterior probability.
+                The confidence is 0.0 when none of the words have been seen before,
+                or while the classifier is not ready.
+        """
+        with self._lock:
+            if not self.ready:
+                return "unknown", 0.0
+            words = [word for word in tokenize(text) if word in self._vocabulary]
+            if not words:
+                return "unknown", 0.0
+
+            total_docs = sum(self._doc_counts.values())
+            vocabulary_size = len(self._vocabulary)
+            scores = {}
+            for label in LABELS:
+                score = math.log((self._doc_counts[label] + 1) / (total_docs + len(LABELS)))
+                denominator = self._total_words[label] + self.alpha * vocabulary_size
+                for word in words:
+                    score += math.log((self._word_counts[label].get(word, 0) + self.alpha) / denominator)
+                scores[label] = score
+
+        best = max(scores, key=scores.get)
+        normalizer = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / normalizer
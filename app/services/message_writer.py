@@ -0,0 +1,171 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from app.database import AsyncSessionLocal, SessionLocal
+from app.crud.message_crud import (
+    acreate_conversation_turn, conversation_turn_rows, create_conversation_turn, create_messages
+)
+
+MESSAGE_GROUP_COMMIT = os.getenv("MESSAGE_GROUP_COMMIT", "false").lower() == "true"
+MESSAGE_GROUP_COMMIT_WINDOW_MS = float(os.getenv("MESSAGE_GROUP_COMMIT_WINDOW_MS", "5"))
+MESSAGE_GROUP_COMMIT_MAX_BATCH = int(os.getenv("MESSAGE_GROUP_COMMIT_MAX_BATCH", "256"))
+
+
+class GroupCommitWriter:
+    """
+    Coalesces message inserts from concurrent requests into shared transactions.
+
+    Writes are queued to a single background thread, which collects everything
+    submitted within a short window and stores it with one INSERT and one commit,
+    so many concurrent chat turns cost one fsync instead of one each.
+
+    Attributes:
+        window (float): Seconds to wait for more writes after the first one arrives.
+        max_batch (int): Maximum number of queued writes per transaction.
+        batches (int): Number of transactions committed.
+        writes (int): Number of writes stored.
+    """
+
+    def __init__(self, session_factory=SessionLocal, window: float = MESSAGE_GROUP_COMMIT_WINDOW_MS / 1000,
+                 max_batch: int = MESSAGE_GROUP_COMMIT_MAX_BATCH):
+        self.session_factory = session_factory
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Write everything already queued, then stop the background thread.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, messages: list) -> Future:
+        """
+        Queue messages to be stored.
+
+        Args:
+            messages (list): Rows as accepted by `create_messages`.
+
+        Returns:
+            Future: Resolves to the stored messages, as returned by `create_messages`.
+        """
+        if self._thread is None:
+            raise RuntimeError("The message writer is not running.")
+        future = Future()
+        self._queue.put((messages, future))
+        return future
+
+    async def awrite(self, messages: list) -> list[dict]:
+        """
+        Queue messages to be stored and wait until they are committed.
+        """
+        return await asyncio.wrap_future(self.submit(messages))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch: list):
+        db = self.session_factory()
+        try:
+            stored = create_messages(db, [row for messages, _ in batch for row in messages])
+            self.batches += 1
+            self.writes += len(batch)
+            offset = 0
+            for messages, future in batch:
+                future.set_result(stored[offset:offset + len(messages)])
+                offset += len(messages)
+        except Exception as e:
+            print(f"Group commit of {len(batch)} writes failed, retrying them one by one: {e}")
+            db.rollback()
+            # Retry separately so one bad write does not fail the others
+            for messages, future in batch:
+                try:
+                    future.set_result(create_messages(db, messages))
+                    self.batches += 1
+                    self.writes += 1
+                except Exception as error:
+                    db.rollback()
+                    future.set_exception(error)
+        finally:
+            db.close()
+
+
+message_writer = GroupCommitWriter() if MESSAGE_GROUP_COMMIT else None
+
+
+def store_conversation_turn(user_content: str, ai_content: str, classification: str = None,
+                            classification_source: str = None, db=None) -> tuple[dict, dict]:
+    """
+    Store a user message and its AI response, through the group-commit writer when enabled.
+
+    Args:
+        user_content (str): The content of the user message.
+        ai_content (str): The content of the AI response.
+        classification (str): The label of the user message.
+        classification_source (str): The stage that produced the label.
+        db (Session): Session to write with when group commit is disabled; a new
+            session is opened if not given.
+
+    Returns:
+        tuple[dict, dict]: The stored user message and AI response.
+    """
+    if message_writer is not None:
+        rows = conversation_turn_rows(user_content, ai_content, classification, classification_source)
+        user_message, ai_message = message_writer.submit(rows).result()
+        return user_message, ai_message
+
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        return create_conversation_turn(db, user_content, ai_content, classification, classification_source)
+    finally:
+        if own_session:
+            db.close()
+
+
+async def astore_conversation_turn(user_content: str, ai_content: str, classification: str = None,
+                                   classification_source: str = None, db=None) -> tuple[dict, dict]:
+    """
+    Async variant of `store_conversation_turn`; `db` is an AsyncSession.
+    """
+    if message_writer is not None:
+        rows = conversation_turn_rows(user_content, ai_content, classification, classification_source)
+        user_message, ai_message = await message_writer.awrite(rows)
+        return user_message, ai_message
+    if db is not None:
+        return await acreate_conversation_turn(db, user_content, ai_content, classification, classification_source)
+    async with AsyncSessionLocal() as db:
+        return await acreate_conversation_turn(db, user_content, ai_content, classification, classification_source)
@@ -0,0 +1,193 @@
+import asyncio
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+# Requests carrying this header get a Server-Timing breakdown of their stages
+METRICS_TRACE_HEADER = os.getenv("METRICS_TRACE_HEADER", "X-Trace")
+# Log the stage breakdown of any request slower than this; unset to disable
+METRICS_SLOW_REQUEST_MS = float(os.getenv("METRICS_SLOW_REQUEST_MS")) if os.getenv("METRICS_SLOW_REQUEST_MS") else None
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUEST_SECONDS = Histogram(
+    "app_request_duration_seconds", "Duration of HTTP requests until the response starts.",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "app_stage_duration_seconds", "Duration of the stages of request handling and ingestion.",
+    ["endpoint", "stage"], buckets=LATENCY_BUCKETS
+)
+PROVIDER_SECONDS = Histogram(
+    "app_provider_attempt_duration_seconds",
+    "Duration of each attempt to call an external provider; for streams, the time to the first chunk.",
+    ["provider", "outcome"], buckets=LATENCY_BUCKETS
+)
+
+# Provider circuit states as gauge values
+CIRCUIT_STATES = {"closed": 0, "half-open": 1, "open": 2}
+
+
+class RequestTrace:
+    """
+    The stages of one request, collected for its Server-Timing header and logs.
+
+    Attributes:
+        endpoint (str): Route template the stages are reported under.
+        trace_id (str): Identifier echoed in the X-Trace-Id header and logs.
+        spans (list): (stage, seconds) pairs in completion order.
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.spans = []
+        self.start = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        """
+        Format the spans as a Server-Timing header value, durations in milliseconds.
+        """
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.spans]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def summary(self) -> str:
+        stages = " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in self.spans)
+        return f"Trace {self.trace_id} {self.endpoint}: {stages} total={self.elapsed() * 1000:.1f}ms"
+
+
+# Tasks and worker threads started by a request copy its context, so their
+# stages are attributed to the request too
+_current_trace = ContextVar("request_trace", default=None)
+
+
+@contextmanager
+def request_trace(endpoint: str):
+    """
+    Attribute the stages run inside the block to `endpoint`.
+
+    Args:
+        endpoint (str): Route template or background job name.
+
+    Yields:
+        RequestTrace: The trace collecting the stages.
+    """
+    trace = RequestTrace(endpoint)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a stage of the current request or background job.
+
+    Works around both blocking and awaited code. A stage cancelled before it
+    completes, e.g. speculative work that turned out not to be needed, is not
+    recorded.
+
+    Args:
+        name (str): Stage name, e.g. "classify" or "db_write".
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        raise
+    except BaseException:
+        _record_stage(name, time.perf_counter() - start)
+        raise
+    else:
+        _record_stage(name, time.perf_counter() - start)
+
+
+def _record_stage(name: str, seconds: float):
+    trace = _current_trace.get()
+    STAGE_SECONDS.labels(trace.endpoint if trace else "background", name).observe(seconds)
+    if trace is not None:
+        trace.spans.append((name, seconds))
+
+
+async def atimed(name: str, fn, *args, **kwargs):
+    """
+    Await `fn(*args, **kwargs)` as a stage; for work started with `asyncio.create_task`.
+
+    The coroutine is created only once the task runs, so a task cancelled
+    before it starts leaves nothing unawaited.
+    """
+    with stage(name):
+        return await fn(*args, **kwargs)
+
+
+def observe_provider(provider: str, outcome: str, seconds: float):
+    """
+    Record the duration of one attempt to call an external provider.
+
+    Args:
+        provider (str): Provider name.
+        outcome (str): "ok" or "error".
+        seconds (float): Duration of the attempt.
+    """
+    PROVIDER_SECONDS.labels(provider, outcome).observe(seconds)
+
+
+class StatsCollector:
+    """
+    Prometheus collector that exposes the application's stats dictionaries as
+    gauges when /metrics is scraped, so nothing is updated on the hot path.
+
+    Attributes:
+        pools (callable): Returns {engine: pool stats}, as from `get_pool_stats`.
+        caches (callable): Returns {cache: stats}, as from `get_cache_stats`.
+        providers (callable): Returns {provider: stats}, as from `get_provider_stats`.
+        prompts (callable): Returns the prompt size stats, as from `get_prompt_stats`.
+    """
+
+    def __init__(self, pools, caches, providers, prompts):
+        self.pools = pools
+        self.caches = caches
+        self.providers = providers
+        self.prompts = prompts
+
+    @staticmethod
+    def _gauges(prefix: str, label: str, stats: dict, documentation: str):
+        # One gauge per numeric field, with a sample per stats entry
+        families = {}
+        for name, fields in stats.items():
+            for field, value in fields.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                family = families.get(field)
+                if family is None:
+                    family = families[field] = GaugeMetricFamily(
+                        f"{prefix}_{field}", f"{documentation} ({field}).", labels=[label]
+                    )
+                family.add_metric([name], value)
+        return list(families.values())
+
+    def collect(self):
+        yield from self._gauges("app_db_pool", "engine", self.pools(), "Database connection pool")
+        yield from self._gauges("app_cache", "cache", self.caches(), "In-process cache")
+
+        providers = self.providers()
+        yield from self._gauges("app_provider", "provider", providers, "External provider")
+        circuit = GaugeMetricFamily("app_provider_circuit_state",
+                                    "Provider circuit state (0 closed, 1 half-open, 2 open).", labels=["provider"])
+        for name, fields in providers.items():
+            circuit.add_metric([name], CIRCUIT_STATES.get(fields.get("state"), 0))
+        yield circuit
+
+        for field, value in self.prompts().items():
+            yield GaugeMetricFamily(f"app_prompt_{field}", f"Prompt size of RAG generation requests ({field}).",
+                                    value=value)
@@ -1,6 +1,114 @@
+import mmap
 import os
+import threading
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from PyPDF2 import PdfReader
 
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # "spawn" keeps workers free of the parent's threads and open connections
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+@contextmanager
+def _open_pdf(pdf_path: str):
+    """
+    Open a PDF for reading through a read-only memory map.
+
+    PyPDF2 copies a file given by path into memory; given the map it reads pages
+    straight from the OS page cache, so memory use does not grow with file size.
+    """
+    with open(pdf_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield PdfReader(f)  # An empty file cannot be mapped; let PyPDF2 report it
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield PdfReader(mapped)
+
+
+def count_pdf_pages(pdf_path: str) -> int:
+    """
+    Count the pages of a PDF file without extracting any text.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+
+    Returns:
+        int: Number of pages.
+    """
+    with _open_pdf(pdf_path) as reader:
+        return len(reader.pages)
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> list:
+    """
+    Extract the text of pages [start, end) of a PDF.
+    """
+    with _open_pdf(pdf_path) as reader:
+        return [
+            {"page_number": i + 1, "content": reader.pages[i].extract_text()}
+            for i in range(start, end)
+        ]
+
+
+def iter_pdf_pages(pdf_path: str, workers: int = None, pages_per_task: int = None):
+    """
+    Extract the pages of a PDF, yielding each one as soon as it is parsed.
+
+    Page ranges are extracted in parallel on a process pool and yielded in page
+    order. Only a few ranges per worker are in flight at a time, so memory use
+    depends on the range size and not on the document size.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+        workers (int): Number of worker processes. Defaults to PDF_EXTRACT_WORKERS.
+        pages_per_task (int): Pages extracted per task. Defaults to PDF_PAGES_PER_TASK.
+
+    Yields:
+        dict: Page number and content of each page.
+    """
+    workers = workers or PDF_EXTRACT_WORKERS
+    pages_per_task = pages_per_task or PDF_PAGES_PER_TASK
+
+    total = count_pdf_pages(pdf_path)
+    ranges = deque((start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task))
+
+    # Small documents are not worth the inter-process round trip
+    if workers <= 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            yield from _extract_page_range(pdf_path, start, end)
+        return
+
+    pool = _get_pool()
+    pending = deque()
+    try:
+        while ranges or pending:
+            while ranges and len(pending) < workers * 2:
+                start, end = ranges.popleft()
+                pending.append(pool.submit(_extract_page_range, pdf_path, start, end))
+            yield from pending.popleft().result()
+    finally:
+        # Stop queued work if the consumer gives up early
+        for future in pending:
+            future.cancel()
+
+
 def split_pdf_into_pages(pdf_path: str) -> list:
     """
     Split a PDF file into pages and extract text content.
@@ -11,9 +119,15 @@ def split_pdf_into_pages(pdf_path: str) -> list:
     Returns:
         list: A list of dictionaries containing page number and content.
     """
-    reader = PdfReader(pdf_path)
-    pages = []
-    for i, page in enumerate(reader.pages):
-        text = page.extract_text()
-        pages.append({"page_number": i + 1, "content": text})
-    return pages
+    return list(iter_pdf_pages(pdf_path))
+
+
+def shutdown_pdf_workers():
+    """
+    Stop the PDF extraction process pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
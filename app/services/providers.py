@@ -0,0 +1,518 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+import aiohttp
+import httpx
+import openai
+import requests
+from groq import APIConnectionError as GroqConnectionError, AsyncGroq, Groq
+from requests.adapters import HTTPAdapter
+from app.services.metrics import observe_provider
+
+# Status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    TimeoutError,
+    ConnectionError,
+    requests.ConnectionError,
+    requests.Timeout,
+    httpx.TransportError,
+    aiohttp.ClientConnectionError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.TryAgain,
+    openai.error.ServiceUnavailableError,
+    GroqConnectionError,
+)
+
+_providers = {}
+
+
+class ProviderUnavailable(Exception):
+    """
+    Raised without calling the provider when its circuit is open or all of its
+    connection slots stay busy for longer than its timeout.
+    """
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Decide whether a failed provider call may succeed if it is repeated.
+    """
+    if isinstance(error, ProviderUnavailable):
+        return False
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class Provider:
+    """
+    Call policy shared by every call to one external API.
+
+    Each call holds one of `max_concurrency` slots, is bounded by `timeout`, and
+    is retried with exponential backoff and full jitter when the error is
+    transient. After `breaker_threshold` consecutive transient failures the
+    circuit opens: calls fail immediately with ProviderUnavailable for
+    `breaker_reset` seconds, after which a single trial call is let through.
+    Async calls marked as hedgeable start a second attempt if the first has not
+    finished after `hedge_after` seconds and use whichever finishes first.
+
+    Attributes:
+        name (str): Name the provider is reported under.
+        max_concurrency (int): Concurrent calls allowed, separately for threads and for each event loop.
+        timeout (float): Seconds a single attempt, or a wait for a free slot, may take.
+        retries (int): Extra attempts after a transient failure.
+        backoff (float): Base backoff in seconds, doubled on every retry.
+        backoff_max (float): Upper bound of the backoff in seconds.
+        hedge_after (float): Seconds before a hedged call starts its second attempt, or None to disable hedging.
+        breaker_threshold (int): Consecutive transient failures that open the circuit.
+        breaker_reset (float): Seconds the circuit stays open.
+    """
+
+    def __init__(self, name: str, max_concurrency: int = 16, timeout: float = 30.0, retries: int = 2,
+                 backoff: float = 0.5, backoff_max: float = 8.0, hedge_after: float = None,
+                 breaker_threshold: int = 5, breaker_reset: float = 30.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._async_semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.retried = 0
+        self.hedged = 0
+        self.rejected = 0
+        _providers[name] = self
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, **defaults) -> "Provider":
+        """
+        Create a provider, overriding the defaults with `<prefix>_MAX_CONCURRENCY`,
+        `<prefix>_TIMEOUT`, `<prefix>_RETRIES`, `<prefix>_HEDGE_AFTER_MS`,
+        `<prefix>_BREAKER_THRESHOLD` and `<prefix>_BREAKER_RESET`.
+        """
+        settings = dict(defaults)
+        for key, cast in [("max_concurrency", int), ("timeout", float), ("retries", int),
+                          ("breaker_threshold", int), ("breaker_reset", float)]:
+            value = os.getenv(f"{prefix}_{key.upper()}")
+            if value:
+                settings[key] = cast(value)
+        hedge_after_ms = os.getenv(f"{prefix}_HEDGE_AFTER_MS")
+        if hedge_after_ms:
+            settings["hedge_after"] = float(hedge_after_ms) / 1000
+        return cls(name, **settings)
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self._opened_at >= self.breaker_reset else "open"
+
+    def _count(self, **deltas):
+        # Counters are updated from threadpool workers and event loops alike
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def _before_attempt(self) -> bool:
+        """
+        Raise ProviderUnavailable if the circuit is open; return True for the
+        trial call of a half-open circuit.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                self.calls += 1
+                return False
+            if time.monotonic() - self._opened_at < self.breaker_reset or self._probing:
+                self.rejected += 1
+                raise ProviderUnavailable(f"The {self.name} circuit is open.")
+            self._probing = True  # Half-open: let one trial call through
+            self.calls += 1
+            return True
+
+    def _end_attempt(self, probe: bool):
+        with self._lock:
+            self.in_flight -= 1
+            if probe:
+                # A trial call that ended without an outcome (e.g. cancelled) must not block the next one
+                self._probing = False
+
+    def _record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def _record_failure(self):
+        with self._lock:
+            self.errors += 1
+            self._failures += 1
+            if self._probing or self._failures >= self.breaker_threshold:
+                if self._opened_at is None or self._probing:
+                    print(f"Opening the {self.name} circuit after {self._failures} consecutive failures.")
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def _backoff_delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+    def _handle_error(self, error: Exception, attempt: int) -> bool:
+        """
+        Record a failed attempt and return whether it should be retried.
+        """
+        if not is_retryable(error):
+            # The provider answered, so it is reachable; the request itself was bad
+            if not isinstance(error, ProviderUnavailable):
+                self._record_success()
+            return False
+        self._record_failure()
+        if attempt >= self.retries or self._opened_at is not None:
+            return False
+        self._count(retried=1)
+        return True
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Call a blocking client function under this provider's policy.
+
+        Args:
+            fn (callable): The client function, e.g. `openai.Embedding.create`.
+            *args, **kwargs: Arguments for `fn`. Client timeouts should also be
+                passed here, since a blocking call cannot be interrupted.
+
+        Returns:
+            The result of `fn`.
+        """
+        attempt = 0
+        while True:
+            if not self._semaphore.acquire(timeout=self.timeout):
+                self._count(rejected=1)
+                raise ProviderUnavailable(f"No free {self.name} connection slot.")
+            self._count(in_flight=1)
+            probe = False
+            start = None
+            try:
+                probe = self._before_attempt()
+                start = time.perf_counter()
+                self.bind_sync()
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if start is not None:
+                    observe_provider(self.name, "error", time.perf_counter() - start)
+                if not self._handle_error(e, attempt):
+                    raise
+                delay = self._backoff_delay(attempt)
+            else:
+                observe_provider(self.name, "ok", time.perf_counter() - start)
+                self._record_success()
+                return result
+            finally:
+                self._end_attempt(probe)
+                self._semaphore.release()
+            time.sleep(delay)
+            attempt += 1
+
+    def _get_async_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._async_semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def _aacquire(self):
+        try:
+            await asyncio.wait_for(self._get_async_semaphore().acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self._count(rejected=1)
+            raise ProviderUnavailable(f"No free {self.name} connection slot.") from None
+
+    async def _aattempt(self, fn, args, kwargs):
+        await self._aacquire()
+        self._count(in_flight=1)
+        probe = False
+        start = None
+        try:
+            probe = self._before_attempt()
+            start = time.perf_counter()
+            self.bind_async()
+            result = await asyncio.wait_for(fn(*args, **kwargs), self.timeout)
+            observe_provider(self.name, "ok", time.perf_counter() - start)
+            return result
+        except Exception:
+            # Calls rejected by the breaker and cancelled hedges are not recorded
+            if start is not None:
+                observe_provider(self.name, "error", time.perf_counter() - start)
+            raise
+        finally:
+            self._end_attempt(probe)
+            self._get_async_semaphore().release()
+
+    async def _ahedged(self, fn, args, kwargs):
+        first = asyncio.ensure_future(self._aattempt(fn, args, kwargs))
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        except asyncio.CancelledError:
+            # asyncio.wait does not cancel what it waits for
+            first.cancel()
+            raise
+        if done:
+            return first.result()
+
+        self._count(hedged=1)
+        pending = {first, asyncio.ensure_future(self._aattempt(fn, args, kwargs))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def acall(self, fn, *args, hedge: bool = False, **kwargs):
+        """
+        Await an async client function under this provider's policy.
+
+        Args:
+            fn (callable): The async client function, e.g. `openai.Embedding.acreate`.
+            hedge (bool): Allow a hedged second attempt. Only for idempotent calls.
+            *args, **kwargs: Arguments for `fn`.
+
+        Returns:
+            The result of `fn`.
+        """
+        attempt = 0
+        while True:
+            try:
+                if hedge and self.hedge_after is not None:
+                    result = await self._ahedged(fn, args, kwargs)
+                else:
+                    result = await self._aattempt(fn, args, kwargs)
+            except Exception as e:
+                if not self._handle_error(e, attempt):
+                    raise
+            else:
+                self._record_success()
+                return result
+            await asyncio.sleep(self._backoff_delay(attempt))
+            attempt += 1
+
+    async def astream(self, fn, *args, **kwargs):
+        """
+        Open a streamed response under this provider's policy and yield its chunks.
+
+        Opening the stream is retried like `acall`; once chunks have been yielded
+        nothing is retried. The connection slot is held until the stream ends,
+        and each chunk must arrive within the timeout.
+
+        Args:
+            fn (callable): The async client function that returns the stream.
+            *args, **kwargs: Arguments for `fn`.
+
+        Yields:
+            The chunks of the stream.
+        """
+        attempt = 0
+        while True:
+            await self._aacquire()
+            self._count(in_flight=1)
+            probe = False
+            try:
+                probe = self._before_attempt()
+                start = time.perf_counter()
+                self.bind_async()
+                try:
+                    stream = await asyncio.wait_for(fn(*args, **kwargs), self.timeout)
+                    iterator = stream.__aiter__()
+                    first = await asyncio.wait_for(iterator.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    observe_provider(self.name, "ok", time.perf_counter() - start)
+                    self._record_success()
+                    return
+                except Exception as e:
+                    observe_provider(self.name, "error", time.perf_counter() - start)
+                    if not self._handle_error(e, attempt):
+                        raise
+                    delay = self._backoff_delay(attempt)
+                else:
+                    observe_provider(self.name, "ok", time.perf_counter() - start)
+                    self._record_success()
+                    yield first
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(iterator.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            return
+                        yield chunk
+            finally:
+                self._end_attempt(probe)
+                self._get_async_semaphore().release()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def bind_sync(self):
+        """
+        Hook to attach pooled connections to the client before a blocking call.
+        """
+
+    def bind_async(self):
+        """
+        Hook to attach pooled async connections to the client before a call.
+        """
+
+    async def aclose(self):
+        """
+        Close pooled connections.
+        """
+
+    def stats(self) -> dict:
+        """
+        Return the provider counters.
+        """
+        with self._lock:
+            return {
+                "state": self.state,
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "calls": self.calls,
+                "errors": self.errors,
+                "retried": self.retried,
+                "hedged": self.hedged,
+                "rejected": self.rejected,
+            }
+
+
+class OpenAIProvider(Provider):
+    """
+    Provider for the OpenAI SDK, with pooled keep-alive connections.
+
+    The SDK opens a new aiohttp session for every async call unless one is set in
+    `openai.aiosession`, so a pooled session is bound for each event loop.
+
+    The SDK only accepts a pooled session for blocking calls through the
+    module-global `openai.requestssession`. The first blocking call made through
+    this provider sets it, so from then on every blocking `openai` call in the
+    process, including calls made outside this provider, uses this pool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session_bound = False
+        self._aiosessions = weakref.WeakKeyDictionary()
+
+    def bind_sync(self):
+        if not self._session_bound:
+            with self._lock:
+                openai.requestssession = self._session
+                self._session_bound = True
+
+    def bind_async(self):
+        loop = asyncio.get_running_loop()
+        session = self._aiosessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            session = self._aiosessions[loop] = aiohttp.ClientSession(connector=connector)
+        openai.aiosession.set(session)
+
+    async def aclose(self):
+        session = self._aiosessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+
+class GroqProvider(Provider):
+    """
+    Provider for the Groq SDK. The SDK's own retries are disabled so that only
+    this provider's policy applies.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client = None
+        self._async_client = None
+        self._client_lock = threading.Lock()
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+
+    @property
+    def client(self) -> Groq:
+        with self._client_lock:
+            if self._client is None:
+                self._client = Groq(
+                    api_key=os.getenv("GROQ_API_KEY"), timeout=self.timeout, max_retries=0,
+                    http_client=httpx.Client(limits=self._limits(), timeout=self.timeout)
+                )
+            return self._client
+
+    @property
+    def async_client(self) -> AsyncGroq:
+        with self._client_lock:
+            if self._async_client is None:
+                self._async_client = AsyncGroq(
+                    api_key=os.getenv("GROQ_API_KEY"), timeout=self.timeout, max_retries=0,
+                    http_client=httpx.AsyncClient(limits=self._limits(), timeout=self.timeout)
+                )
+            return self._async_client
+
+    async def aclose(self):
+        with self._client_lock:
+            client, self._client = self._client, None
+            async_client, self._async_client = self._async_client, None
+        if client is not None:
+            client.close()
+        if async_client is not None:
+            await async_client.close()
+
+
+openai_provider = OpenAIProvider.from_env(
+    "openai", "OPENAI", max_concurrency=32, timeout=30.0, retries=2, hedge_after=None
+)
+groq_provider = GroqProvider.from_env(
+    "groq", "GROQ", max_concurrency=16, timeout=30.0, retries=2, hedge_after=None
+)
+weather_provider = Provider.from_env(
+    "weather", "WEATHER_API", max_concurrency=16, timeout=10.0, retries=1, hedge_after=None
+)
+
+
+async def aclose_providers():
+    """
+    Close the pooled connections of every provider.
+    """
+    for provider in _providers.values():
+        await provider.aclose()
+
+
+def get_provider_stats() -> dict:
+    """
+    Return the counters of every provider, keyed by provider name.
+    """
+    return {name: provider.stats() for name, provider in _providers.items()}
@@ -1,99 +1,632 @@
-import openai
+import asyncio
+import hashlib
+import itertools
+import json
+from collections import Counter
+import os
+import threading
+import time
+import numpy as np
 import chromadb
 from chromadb.config import Settings
-import uuid  # For generating unique IDs
+from app.services.cache import LRUCache
+from app.services.chunking import chunk_documents
+from app.services import embeddings
+from app.services.embeddings import OPENAI_EMBEDDING_MODEL as EMBEDDING_MODEL, collection_name_for
+from app.services.metrics import stage
+from app.services.providers import ProviderUnavailable
+
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chromadb")
+# Set CHROMA_HOST to use a Chroma server, which multiple app workers can share
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+# Optional comma-separated "host:port" replicas that serve queries round-robin
+CHROMA_READ_HOSTS = [host for host in os.getenv("CHROMA_READ_HOSTS", "").split(",") if host]
+COLLECTION_METADATA = {"description": "Collection for document embeddings"}
+
+QUERY_EMBEDDING_CACHE_MB = float(os.getenv("QUERY_EMBEDDING_CACHE_MB", "64"))
+RETRIEVAL_CACHE_MB = float(os.getenv("RETRIEVAL_CACHE_MB", "16"))
+# Collection versions are tracked per process, so the TTL bounds staleness when
+# another worker writes to a shared Chroma server
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+# Candidates fetched from the index before reranking, and the MMR trade-off
+# between relevance (1.0) and diversity (0.0)
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.5"))
+
+# Embeddings are kept as float32 arrays, a quarter of the size of a list of floats
+query_embedding_cache = LRUCache(
+    "query_embedding",
+    maxsize=1_000_000,
+    max_bytes=int(QUERY_EMBEDDING_CACHE_MB * 1024 * 1024),
+    sizeof=lambda embedding: embedding.nbytes + 100
+)
+retrieval_cache = LRUCache(
+    "retrieval",
+    maxsize=1_000_000,
+    ttl=RETRIEVAL_CACHE_TTL,
+    max_bytes=int(RETRIEVAL_CACHE_MB * 1024 * 1024),
+    sizeof=lambda ids: sum(len(doc_id) + 50 for doc_id in ids) + 100
+)
+
+# Batching limits for the embeddings endpoint. Token counts are estimated, so the
+# budget is kept well below the provider's per-request limit.
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "50000"))
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "256"))
+EMBEDDING_BATCH_RETRIES = int(os.getenv("EMBEDDING_BATCH_RETRIES", "3"))
+EMBEDDING_RETRY_BACKOFF = float(os.getenv("EMBEDDING_RETRY_BACKOFF", "0.5"))
+
+
+class ChromaStore:
+    """
+    Process-wide ChromaDB client with cached collection handles.
+
+    The client is created once, at application startup or on first use, and each
+    collection is opened once, so queries and writes do no per-call setup. Queries
+    can be spread over read replicas when CHROMA_READ_HOSTS is set. Collection
+    names are suffixed per embedding model (see `collection_name_for`).
+
+    Attributes:
+        path (str): Directory of the embedded persistent store.
+        host (str): Chroma server host; when set it is used instead of `path`.
+        port (int): Chroma server port.
+        read_hosts (list): "host:port" replicas used for queries.
+    """
+
+    def __init__(self, path: str = CHROMA_PATH, host: str = CHROMA_HOST, port: int = CHROMA_PORT,
+                 read_hosts: list = CHROMA_READ_HOSTS):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.read_hosts = read_hosts
+        self._client = None
+        self._read_clients = []
+        self._read_cycle = None
+        self._collections = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self.host:
+            self._client = chromadb.HttpClient(host=self.host, port=self.port)
+        else:
+            self._client = chromadb.PersistentClient(path=self.path)
+        self._read_clients = []
+        for read_host in self.read_hosts:
+            host, _, port = read_host.partition(":")
+            self._read_clients.append(chromadb.HttpClient(host=host, port=int(port or self.port)))
+        self._read_cycle = itertools.cycle(range(len(self._read_clients)))
+
+    def start(self, warm_collections: tuple = ("documents",)):
+        """
+        Create the clients and open the given collections.
+
+        Args:
+            warm_collections (tuple): Collections to open and touch up front so the
+                first request does not pay for it.
+        """
+        try:
+            with self._lock:
+                if self._client is None:
+                    self._connect()
+            for name in warm_collections:
+                self.get_collection(name).count()
+                for replica in range(len(self._read_clients)):
+                    self._get_collection(name, replica).count()
+        except Exception as e:
+            print(f"Failed to initialize ChromaDB client: {e}")
+            raise
+
+    def close(self):
+        """
+        Drop the clients and collection handles.
+        """
+        with self._lock:
+            self._client = None
+            self._read_clients = []
+            self._collections.clear()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self.start(warm_collections=())
+        return self._client
+
+    def _get_collection(self, name: str, replica: int = None):
+        key = (name, replica)
+        collection = self._collections.get(key)
+        if collection is None:
+            client = self.client if replica is None else self._read_clients[replica]
+            with self._lock:
+                collection = self._collections.get(key)
+                if collection is None:
+                    collection = client.get_or_create_collection(name=collection_name_for(name),
+                                                                 metadata=COLLECTION_METADATA)
+                    self._collections[key] = collection
+        return collection
+
+    def get_collection(self, name: str, for_read: bool = False):
+        """
+        Return the cached handle of a collection, creating the collection if needed.
+
+        Args:
+            name (str): Collection name.
+            for_read (bool): Whether the handle is used only for queries, in which
+                case it may come from a read replica.
+
+        Returns:
+            Collection: ChromaDB collection handle.
+        """
+        if for_read and self._read_clients:
+            with self._lock:
+                replica = next(self._read_cycle)
+            return self._get_collection(name, replica)
+        return self._get_collection(name)
+
+    def version(self, name: str) -> int:
+        """
+        Return the write version of a collection, used to invalidate cached query results.
+        """
+        return self._versions.get(name, 0)
+
+    def bump_version(self, name: str):
+        """
+        Record that a collection was written to.
+        """
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+
+
+chroma_store = ChromaStore()
 
 
 def get_chromadb_client():
     """
-    Initialize and return a ChromaDB client for persistent storage.
+    Return the shared ChromaDB client.
 
     Returns:
-        PersistentClient: ChromaDB client instance.
+        ClientAPI: ChromaDB client instance.
     """
-    try:
-        client = chromadb.PersistentClient(path="./chromadb")
-        return client
-    
-    except Exception as e:
-        print(f"Failed to initialize ChromaDB client: {e}")
-        raise
+    return chroma_store.client
+
+
+def _get_collection(client, collection_name: str):
+    # Use the cached handle for the shared client; other clients (e.g. in benchmarks) are used as given
+    if client is None or client is chroma_store._client:
+        return chroma_store.get_collection(collection_name)
+    return client.get_or_create_collection(name=collection_name_for(collection_name), metadata=COLLECTION_METADATA)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimate the number of tokens in a text (about 4 characters per token).
+
+    Args:
+        text (str): Text to measure.
+
+    Returns:
+        int: Estimated token count, at least 1.
+    """
+    return max(1, len(text) // 4)
 
 
-def store_embeddings(client, collection_name, documents):
+def batch_documents(documents: list, max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+                    max_size: int = EMBEDDING_BATCH_MAX_SIZE) -> list:
+    """
+    Group documents into batches that fit a token budget for one embedding call.
+
+    Args:
+        documents (list): Documents with a "content" key.
+        max_tokens (int): Maximum estimated tokens per batch.
+        max_size (int): Maximum number of documents per batch.
+
+    Returns:
+        list: A list of batches, each a list of documents in their original order.
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for doc in documents:
+        tokens = estimate_tokens(doc["content"])
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_size):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(doc)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def embed_texts(texts: list) -> list:
+    """
+    Embed several texts with the configured embedding provider in one call,
+    reusing the cached embedding of any text embedded before.
+
+    Args:
+        texts (list): Texts to embed.
+
+    Returns:
+        list: One embedding per text, in the same order as the input.
+    """
+    return embeddings.embed_texts(texts)
+
+
+async def aembed_texts(texts: list) -> list:
+    """
+    Async variant of `embed_texts`.
+    """
+    return await embeddings.aembed_texts(texts)
+
+
+def embed_query(query: str) -> list:
+    """
+    Embed a query, reusing the embedding of an identical earlier query.
+
+    Args:
+        query (str): The query text.
+
+    Returns:
+        list: The query embedding.
+    """
+    embedding = query_embedding_cache.get(query)
+    if embedding is None:
+        embedding = np.asarray(embed_texts([query])[0], dtype=np.float32)
+        query_embedding_cache.set(query, embedding)
+    return embedding.tolist()
+
+
+async def aembed_query(query: str) -> list:
+    """
+    Async variant of `embed_query`.
+    """
+    embedding = query_embedding_cache.get(query)
+    if embedding is None:
+        embedding = np.asarray((await aembed_texts([query]))[0], dtype=np.float32)
+        query_embedding_cache.set(query, embedding)
+    return embedding.tolist()
+
+
+def chunk_embedding_id(document_id: int, page_number: int, chunk_index: int) -> str:
+    """
+    Return the deterministic vector ID of a page chunk, so re-ingesting a page
+    replaces its vectors instead of adding duplicates.
+    """
+    return f"doc{document_id}-page{page_number}-chunk{chunk_index}"
+
+
+def _store_batch(collection, batch: list):
+    """
+    Embed a batch of chunks and write them with a single bulk upsert.
+    """
+    with stage("embed"):
+        embeddings = embed_texts([chunk["content"] for chunk in batch])
+    with stage("vector_upsert"):
+        collection.upsert(
+            ids=[chunk_embedding_id(chunk["document_id"], chunk["page_number"], chunk["chunk_index"])
+                 for chunk in batch],
+            embeddings=embeddings,
+            documents=[chunk["content"] for chunk in batch],
+            metadatas=[{
+                "page_number": chunk["page_number"],
+                "document_id": chunk["document_id"],
+                "chunk_index": chunk["chunk_index"],
+                "char_start": chunk["char_start"],
+                "char_end": chunk["char_end"],
+            } for chunk in batch]
+        )
+
+
+def _store_batch_with_retry(collection, batch: list, on_batch_stored=None) -> int:
+    """
+    Store a batch, retrying with backoff and splitting it when it keeps failing.
+
+    A batch that still fails after its retries is split in half so that a single
+    bad page does not prevent the rest of the batch from being stored.
+
+    Returns:
+        int: Number of documents stored.
+    """
+    for attempt in range(EMBEDDING_BATCH_RETRIES):
+        try:
+            _store_batch(collection, batch)
+        except ProviderUnavailable:
+            raise  # Splitting the batch cannot help while the provider is down
+        except Exception as e:
+            error = e
+            if attempt < EMBEDDING_BATCH_RETRIES - 1:
+                time.sleep(EMBEDDING_RETRY_BACKOFF * (2 ** attempt))
+            continue
+        if on_batch_stored:
+            on_batch_stored(batch)
+        return len(batch)
+
+    if len(batch) == 1:
+        print(f"Failed to process document: {batch[0]['content'][:30]}. Error: {error}")
+        return 0
+
+    print(f"Batch of {len(batch)} documents failed, splitting. Error: {error}")
+    middle = len(batch) // 2
+    return (_store_batch_with_retry(collection, batch[:middle], on_batch_stored)
+            + _store_batch_with_retry(collection, batch[middle:], on_batch_stored))
+
+
+def store_embeddings(client, collection_name, documents, on_batch_stored=None):
     """
     Store embeddings in ChromaDB.
 
+    Pages are split into overlapping token windows (see `chunking.chunk_page`).
+    The chunks are grouped into token-budgeted batches; each batch is embedded
+    with one API call and written with one bulk upsert under deterministic chunk IDs.
+
     Args:
-        client: ChromaDB client instance.
+        client: ChromaDB client instance, or None for the shared client.
         collection_name: Name of the collection to store embeddings.
         documents: List of dictionaries, each containing:
             - content: Text content to embed.
             - page_number: Page number in the document.
             - document_id: ID of the document.
+        on_batch_stored: Optional callable invoked, in page order, with each list
+            of documents whose chunks have all been stored.
+
+    Returns:
+        int: Number of documents stored.
     """
     try:
-        collection = client.get_or_create_collection(
-            name=collection_name,
-            metadata={"description": "Collection for document embeddings"}
-        )
+        collection = _get_collection(client, collection_name)
+
+        # Empty pages have no chunks and are neither stored nor counted
+        chunks = chunk_documents(documents)
+        pages = {(doc["document_id"], doc["page_number"]): doc for doc in documents}
+        remaining = Counter((chunk["document_id"], chunk["page_number"]) for chunk in chunks)
 
-        for doc in documents:
-            try:
-                response = openai.Embedding.create(
-                    input=doc["content"],
-                    model="text-embedding-ada-002"
-                )
-                embedding = response["data"][0]["embedding"]
-                doc_id = str(uuid.uuid4())
-
-                collection.add(
-                    ids=[doc_id],
-                    embeddings=[embedding],
-                    documents=[doc["content"]],
-                    metadatas=[{
-                        "page_number": doc["page_number"],
-                        "document_id": doc["document_id"]
-                    }]
-                )
-
-            except Exception as e:
-                print(f"Failed to process document: {doc['content'][:30]}. Error: {e}")
-                continue
+        def on_stored(batch):
+            # Invalidate cached query results as soon as the collection changes
+            chroma_store.bump_version(collection_name)
+            completed = []
+            for chunk in batch:
+                key = (chunk["document_id"], chunk["page_number"])
+                remaining[key] -= 1
+                if remaining[key] == 0:
+                    completed.append(pages[key])
+            if completed and on_batch_stored:
+                on_batch_stored(completed)
+
+        for batch in batch_documents(chunks):
+            _store_batch_with_retry(collection, batch, on_stored)
+        return sum(1 for count in remaining.values() if count == 0)
 
     except Exception as e:
         print(f"Failed to store embeddings: {e}")
         raise
 
 
-def retrieve_relevant_documents(query: str, collection_name: str, top_k: int = 3):
+def delete_page_embeddings(collection_name: str, document_id: int, page_numbers: list = None,
+                           after_page: int = None):
     """
-    Retrieve the most relevant documents from ChromaDB.
+    Delete the vectors of some pages of a document.
+
+    Pages are matched on metadata rather than IDs, so vectors stored under older
+    random IDs are removed as well.
+
+    Args:
+        collection_name (str): ChromaDB collection name.
+        document_id (int): The ID of the document.
+        page_numbers (list): Pages whose vectors are deleted.
+        after_page (int): Delete the vectors of all pages after this page number.
+    """
+    conditions = [{"document_id": document_id}]
+    if page_numbers is not None:
+        conditions.append({"page_number": {"$in": list(page_numbers)}})
+    if after_page is not None:
+        conditions.append({"page_number": {"$gt": after_page}})
+    chroma_store.get_collection(collection_name).delete(where=_combine_conditions(conditions))
+    chroma_store.bump_version(collection_name)
+
+
+def _combine_conditions(conditions: list) -> dict:
+    # Chroma rejects an "$and" with fewer than two conditions
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def build_where(document_id: int = None, page_numbers: list = None, min_page: int = None,
+                max_page: int = None) -> dict:
+    """
+    Build a Chroma metadata filter that restricts retrieval to some documents or pages.
+
+    Args:
+        document_id (int): Only search this document.
+        page_numbers (list): Only search these pages.
+        min_page (int): Only search pages from this page number on.
+        max_page (int): Only search pages up to this page number.
+
+    Returns:
+        dict: The `where` filter, or None if no restriction is given.
+    """
+    conditions = []
+    if document_id is not None:
+        conditions.append({"document_id": document_id})
+    if page_numbers is not None:
+        conditions.append({"page_number": {"$in": list(page_numbers)}})
+    if min_page is not None:
+        conditions.append({"page_number": {"$gte": min_page}})
+    if max_page is not None:
+        conditions.append({"page_number": {"$lte": max_page}})
+    return _combine_conditions(conditions)
+
+
+def mmr_select(query_embedding, embeddings, top_k: int, mmr_lambda: float = RETRIEVAL_MMR_LAMBDA) -> list:
+    """
+    Select results by maximal marginal relevance.
+
+    Each step picks the candidate with the best trade-off between similarity to
+    the query and dissimilarity to the candidates already picked, so near-duplicate
+    chunks (e.g. overlapping windows) do not crowd out other relevant text.
+
+    Args:
+        query_embedding: The query embedding.
+        embeddings: The candidate embeddings.
+        top_k (int): Number of candidates to select.
+        mmr_lambda (float): Weight of relevance against diversity, from 0 to 1.
+
+    Returns:
+        list: (index, relevance) pairs of the selected candidates, in selection order.
+    """
+    candidates = np.asarray(embeddings, dtype=np.float32)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    relevance = candidates @ query
+
+    selected = []
+    redundancy = np.full(len(candidates), -np.inf)
+    available = np.ones(len(candidates), dtype=bool)
+    for _ in range(min(top_k, len(candidates))):
+        scores = relevance if not selected else mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        best = int(np.argmax(np.where(available, scores, -np.inf)))
+        selected.append((best, float(relevance[best])))
+        available[best] = False
+        redundancy = np.maximum(redundancy, candidates @ candidates[best])
+    return selected
+
+
+def _chunk_result(doc_id: str, content: str, metadata: dict, score: float) -> dict:
+    metadata = metadata or {}
+    return {
+        "id": doc_id,
+        "content": content,
+        "document_id": metadata.get("document_id"),
+        "page_number": metadata.get("page_number"),
+        "chunk_index": metadata.get("chunk_index"),
+        "char_start": metadata.get("char_start"),
+        "char_end": metadata.get("char_end"),
+        "score": score,
+    }
+
+
+def _query_chunks(collection_name: str, query_embedding: list, top_k: int, where: dict = None,
+                  fetch_k: int = RETRIEVAL_FETCH_K, mmr_lambda: float = RETRIEVAL_MMR_LAMBDA) -> list:
+    """
+    Run a filtered kNN query for `fetch_k` candidates and rerank them with MMR,
+    serving repeated queries from the retrieval cache.
+
+    Cached results hold only IDs and scores and are keyed on the collection's
+    write version, so results are never served from before the last write.
+    """
+    collection = chroma_store.get_collection(collection_name, for_read=True)
+    embedding_digest = hashlib.sha1(np.asarray(query_embedding, dtype=np.float32).tobytes()).hexdigest()
+    key = (embedding_digest, collection_name, chroma_store.version(collection_name), top_k,
+           json.dumps(where, sort_keys=True), fetch_k, mmr_lambda)
+
+    cached = retrieval_cache.get(key)
+    if cached is not None:
+        ids, scores = cached
+        results = collection.get(ids=ids, include=["documents", "metadatas"])
+        found = {doc_id: (content, metadata) for doc_id, content, metadata
+                 in zip(results["ids"], results["documents"], results["metadatas"])}
+        if all(doc_id in found for doc_id in ids):
+            return [_chunk_result(doc_id, *found[doc_id], score) for doc_id, score in zip(ids, scores)]
+
+    results = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=max(top_k, fetch_k),
+        where=where,
+        include=["documents", "metadatas", "embeddings"]
+    )
+    if not results.get("ids") or not results["ids"][0]:
+        return []
+
+    selected = mmr_select(query_embedding, results["embeddings"][0], top_k, mmr_lambda)
+    chunks = [
+        _chunk_result(results["ids"][0][i], results["documents"][0][i], results["metadatas"][0][i], score)
+        for i, score in selected
+    ]
+    retrieval_cache.set(key, ([chunk["id"] for chunk in chunks], [chunk["score"] for chunk in chunks]))
+    return chunks
+
+
+def retrieve_relevant_chunks(query: str, collection_name: str, top_k: int = 3, where: dict = None,
+                             fetch_k: int = RETRIEVAL_FETCH_K, mmr_lambda: float = RETRIEVAL_MMR_LAMBDA) -> list:
+    """
+    Retrieve the most relevant chunks from ChromaDB, with their source metadata.
 
     Args:
         query (str): The query text.
         collection_name (str): ChromaDB collection name.
-        top_k (int): Number of top results to return.
+        top_k (int): Number of chunks to return.
+        where (dict): Metadata filter, e.g. from `build_where`.
+        fetch_k (int): Number of nearest candidates to rerank.
+        mmr_lambda (float): Weight of relevance against diversity in the rerank.
 
     Returns:
-        list: List of relevant documents.
+        list: Chunks with "id", "content", "document_id", "page_number",
+            "chunk_index", "char_start", "char_end" and "score" (cosine similarity
+            to the query), in rerank order.
+    """
+    try:
+        query_embedding = embed_query(query)
+        return _query_chunks(collection_name, query_embedding, top_k, where, fetch_k, mmr_lambda)
+
+    except Exception as e:
+        print(f"Error during retrieval: {e}")
+        return []
+
+
+async def aretrieve_relevant_chunks(query: str, collection_name: str, top_k: int = 3, where: dict = None,
+                                    fetch_k: int = RETRIEVAL_FETCH_K, mmr_lambda: float = RETRIEVAL_MMR_LAMBDA,
+                                    query_embedding: list = None) -> list:
+    """
+    Async variant of `retrieve_relevant_chunks`.
+
+    Args:
+        query_embedding (list): Embedding of the query, if the caller already has it.
     """
     try:
-        query_embedding = openai.Embedding.create(
-            input=query,
-            model="text-embedding-ada-002"
-        )["data"][0]["embedding"]
-
-        client = get_chromadb_client()
-        collection = client.get_or_create_collection(collection_name)
-
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            include=["documents"]
+        if query_embedding is None:
+            query_embedding = await aembed_query(query)
+        # The Chroma client is synchronous, so the kNN query runs on a worker thread
+        return await asyncio.to_thread(
+            _query_chunks, collection_name, query_embedding, top_k, where, fetch_k, mmr_lambda
         )
-        return results["documents"][0] if "documents" in results and results["documents"] else []
-    
+
     except Exception as e:
         print(f"Error during retrieval: {e}")
         return []
+
+
+def retrieve_relevant_documents(query: str, collection_name: str, top_k: int = 3, where: dict = None):
+    """
+    Retrieve the most relevant documents from ChromaDB.
+
+    Args:
+        query (str): The query text.
+        collection_name (str): ChromaDB collection name.
+        top_k (int): Number of top results to return.
+        where (dict): Metadata filter, e.g. from `build_where`.
+
+    Returns:
+        list: List of relevant documents.
+    """
+    return [chunk["content"] for chunk in retrieve_relevant_chunks(query, collection_name, top_k, where)]
+
+
+async def aretrieve_relevant_documents(query: str, collection_name: str, top_k: int = 3,
+                                       query_embedding: list = None, where: dict = None):
+    """
+    Async variant of `retrieve_relevant_documents`.
+
+    Args:
+        query (str): The query text.
+        collection_name (str): ChromaDB collection name.
+        top_k (int): Number of top results to return.
+        query_embedding (list): Embedding of the query, if the caller already has it.
+        where (dict): Metadata filter, e.g. from `build_where`.
+
+    Returns:
+        list: List of relevant documents.
+    """
+    chunks = await aretrieve_relevant_chunks(query, collection_name, top_k, where, query_embedding=query_embedding)
+    return [chunk["content"] for chunk in chunks]
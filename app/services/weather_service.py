@@ -1,14 +1,188 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
 import requests
+import httpx
 import os
 from openai import ChatCompletion
+from requests.adapters import HTTPAdapter
+from app.services.cache import LRUCache
+from app.services.providers import ProviderUnavailable, openai_provider, weather_provider
 
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "http://api.weatherapi.com/v1/current.json")
+WEATHER_API_TIMEOUT = float(os.getenv("WEATHER_API_TIMEOUT", "10"))
+WEATHER_HTTP_POOL_SIZE = int(os.getenv("WEATHER_HTTP_POOL_SIZE", "10"))
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "300"))  # Seconds a reading is served as current
+WEATHER_CACHE_STALE_TTL = float(os.getenv("WEATHER_CACHE_STALE_TTL", "3600"))  # Seconds it may be served if the API fails
+WEATHER_ERROR = {"error": "Unable to fetch weather data"}
+WEATHER_REPORT_CACHE_TTL = float(os.getenv("WEATHER_REPORT_CACHE_TTL", str(WEATHER_CACHE_TTL)))
+# Readings are rounded to these steps before keying the report cache (0 keeps exact values)
+WEATHER_REPORT_TEMP_STEP = float(os.getenv("WEATHER_REPORT_TEMP_STEP", "1"))
+WEATHER_REPORT_HUMIDITY_STEP = float(os.getenv("WEATHER_REPORT_HUMIDITY_STEP", "5"))
+WEATHER_REPORT_WIND_STEP = float(os.getenv("WEATHER_REPORT_WIND_STEP", "5"))
+# Milliseconds to wait for the LLM before answering from a template; unset never uses the
+# template, 0 always does
+WEATHER_REPORT_LATENCY_BUDGET_MS = (
+    float(os.getenv("WEATHER_REPORT_LATENCY_BUDGET_MS")) if os.getenv("WEATHER_REPORT_LATENCY_BUDGET_MS") else None
+)
+
+# Readings are kept as (data, fetched_at) for the stale window, and treated as
+# current only for WEATHER_CACHE_TTL
+weather_cache = LRUCache("weather", maxsize=1024, ttl=max(WEATHER_CACHE_TTL, WEATHER_CACHE_STALE_TTL))
+
+# Fetches in progress, so concurrent requests for a city share one upstream call
+_inflight = {}
+_inflight_lock = threading.Lock()
+_ainflight = {}
+
+
+class WeatherReportCache(LRUCache):
+    """
+    LRU cache of generated weather reports that also counts the LLM calls it saves.
+
+    Attributes:
+        llm_calls (int): Reports generated by the LLM.
+        coalesced (int): Requests that waited for a report another request was generating.
+        template_reports (int): Reports answered from the template instead of the LLM.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.llm_calls = 0
+        self.coalesced = 0
+        self.template_reports = 0
+
+    def count(self, counter: str):
+        """
+        Increment a counter; reports are generated on threadpool threads and event loops alike.
+        """
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update({
+            "llm_calls": self.llm_calls,
+            "coalesced": self.coalesced,
+            "template_reports": self.template_reports,
+            "llm_calls_saved": self.hits + self.coalesced + self.template_reports,
+        })
+        return stats
+
+
+weather_report_cache = WeatherReportCache("weather_reports", maxsize=1024, ttl=WEATHER_REPORT_CACHE_TTL)
+_report_inflight = {}
+
+_session = None
+_session_lock = threading.Lock()
+_async_client = None
+
+
+def _get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WEATHER_HTTP_POOL_SIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None:
+        limits = httpx.Limits(
+            max_connections=WEATHER_HTTP_POOL_SIZE, max_keepalive_connections=WEATHER_HTTP_POOL_SIZE
+        )
+        _async_client = httpx.AsyncClient(timeout=WEATHER_API_TIMEOUT, limits=limits)
+    return _async_client
+
+
+async def aclose_weather_client():
+    """
+    Close the shared HTTP clients.
+    """
+    global _async_client, _session
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def normalize_city(city: str) -> str:
+    """
+    Normalize a city name for use as a cache key.
+    """
+    return " ".join(city.split()).casefold()
+
+
+def _cached_weather(key: str) -> tuple[dict, bool]:
+    """
+    Look up a cached reading.
+
+    Returns:
+        tuple[dict, bool]: The reading, or None, and whether it is still current.
+    """
+    entry = weather_cache.get(key)
+    if entry is None:
+        return None, False
+    data, fetched_at = entry
+    return data, time.monotonic() - fetched_at < WEATHER_CACHE_TTL
+
+
+def _fallback(error: Exception, stale: dict) -> dict:
+    print(f"Error fetching weather data: {error}")
+    if stale is not None:
+        print("Serving the last cached weather data.")
+        return stale
+    return dict(WEATHER_ERROR)
+
+
+def _fetch_weather(city: str) -> dict:
+    response = _get_session().get(WEATHER_API_URL, params={"key": WEATHER_API_KEY, "q": city},
+                                  timeout=WEATHER_API_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+async def _afetch_weather(city: str) -> dict:
+    response = await _get_async_client().get(WEATHER_API_URL, params={"key": WEATHER_API_KEY, "q": city})
+    response.raise_for_status()
+    return response.json()
+
+
+def _refresh_weather(key: str, city: str, stale: dict) -> dict:
+    try:
+        data = weather_provider.call(_fetch_weather, city)
+    except (requests.RequestException, ValueError, ProviderUnavailable) as e:
+        return _fallback(e, stale)
+    weather_cache.set(key, (data, time.monotonic()))
+    return data
+
+
+async def _arefresh_weather(key: str, city: str, stale: dict) -> dict:
+    try:
+        data = await weather_provider.acall(_afetch_weather, city)
+    except (httpx.HTTPError, ValueError, ProviderUnavailable, asyncio.TimeoutError) as e:
+        return _fallback(e, stale)
+    weather_cache.set(key, (data, time.monotonic()))
+    return data
 
 
 def get_weather_data(city: str = "New York") -> dict:
     """
     Fetch weather data for a given city using the weather API.
+
+    Readings are cached per city for WEATHER_CACHE_TTL seconds. Concurrent calls
+    for a city that is not cached share one upstream request, and if the API
+    fails the last reading is returned for up to WEATHER_CACHE_STALE_TTL seconds.
     
     Args:
         city (str): City name. Defaults to "New York".
@@ -16,20 +190,125 @@ def get_weather_data(city: str = "New York") -> dict:
     Returns:
         dict: Weather data or error message.
     """
+    key = normalize_city(city)
+    data, current = _cached_weather(key)
+    if current:
+        return data
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        return future.result()
+
     try:
-        url = f"http://api.weatherapi.com/v1/current.json?key={WEATHER_API_KEY}&q={city}"
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
-    
-    except requests.RequestException as e:
-        print(f"Error fetching weather data: {e}")
-        return {"error": "Unable to fetch weather data"}
+        result = _refresh_weather(key, city, data)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+
+async def aget_weather_data(city: str = "New York") -> dict:
+    """
+    Async variant of `get_weather_data`.
+
+    A caller that is cancelled does not cancel the shared fetch, which still
+    completes and fills the cache.
+
+    Args:
+        city (str): City name. Defaults to "New York".
+
+    Returns:
+        dict: Weather data or error message.
+    """
+    key = normalize_city(city)
+    data, current = _cached_weather(key)
+    if current:
+        return data
+
+    task = _ainflight.get(key)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(_arefresh_weather(key, city, data))
+        _ainflight[key] = task
+        task.add_done_callback(lambda done: _ainflight.pop(key, None) if _ainflight.get(key) is done else None)
+    return await asyncio.shield(task)
+
+
+def _build_weather_prompt(weather_data: dict) -> str:
+    # Extract relevant weather information
+    location = weather_data["location"]["name"]
+    temp_c = weather_data["current"]["temp_c"]
+    condition = weather_data["current"]["condition"]["text"]
+    humidity = weather_data["current"]["humidity"]
+    wind_kph = weather_data["current"]["wind_kph"]
+
+    # Create a structured prompt
+    return (
+        f"Generate a weather report for {location}:\n\n"
+        f"Temperature: {temp_c}°C\n"
+        f"Condition: {condition}\n"
+        f"Humidity: {humidity}%\n"
+        f"Wind Speed: {wind_kph} kph\n"
+    )
+
+
+def _build_weather_messages(weather_data: dict) -> list:
+    return [
+        {"role": "system", "content": "You are a weather assistant."},
+        {"role": "user", "content": _build_weather_prompt(weather_data)}
+    ]
+
+
+def _quantize(value, step: float):
+    return round(float(value) / step) * step if step else value
+
+
+def weather_report_key(weather_data: dict) -> tuple:
+    """
+    Key a weather report on the observed conditions, rounded so that readings
+    within the same step share a report.
+    """
+    current = weather_data["current"]
+    return (
+        normalize_city(weather_data["location"]["name"]),
+        _quantize(current["temp_c"], WEATHER_REPORT_TEMP_STEP),
+        current["condition"]["text"].casefold(),
+        _quantize(current["humidity"], WEATHER_REPORT_HUMIDITY_STEP),
+        _quantize(current["wind_kph"], WEATHER_REPORT_WIND_STEP),
+    )
+
+
+def template_weather_report(weather_data: dict) -> str:
+    """
+    Format a weather report without the LLM.
+    """
+    current = weather_data["current"]
+    return (
+        f"It is currently {current['condition']['text'].lower()} in {weather_data['location']['name']}, "
+        f"{current['temp_c']}°C with {current['humidity']}% humidity and winds of {current['wind_kph']} kph."
+    )
+
+
+def _template_response(weather_data: dict) -> str:
+    weather_report_cache.count("template_reports")
+    return template_weather_report(weather_data)
 
 
 def generate_weather_response(weather_data: dict) -> str:
     """
     Generate a natural language response for the weather data using GPT-4o.
+
+    Reports are cached on the rounded conditions (see `weather_report_key`). With
+    WEATHER_REPORT_LATENCY_BUDGET_MS=0 the template is used instead of the LLM.
+    Unlike `agenerate_weather_response`, a positive budget is not applied: a
+    blocking LLM call cannot be abandoned, so this waits for the report.
     
     Args:
         weather_data (dict): Weather data from the API.
@@ -41,34 +320,148 @@ def generate_weather_response(weather_data: dict) -> str:
         if "error" in weather_data:
             return "Unable to retrieve weather information at the moment."
 
-        # Extract relevant weather information
-        location = weather_data["location"]["name"]
-        temp_c = weather_data["current"]["temp_c"]
-        condition = weather_data["current"]["condition"]["text"]
-        humidity = weather_data["current"]["humidity"]
-        wind_kph = weather_data["current"]["wind_kph"]
-
-        # Create a structured prompt
-        prompt = (
-            f"Generate a weather report for {location}:\n\n"
-            f"Temperature: {temp_c}°C\n"
-            f"Condition: {condition}\n"
-            f"Humidity: {humidity}%\n"
-            f"Wind Speed: {wind_kph} kph\n"
-        )
+        key = weather_report_key(weather_data)
+        report = weather_report_cache.get(key)
+        if report is not None:
+            return report
+        if WEATHER_REPORT_LATENCY_BUDGET_MS == 0:
+            return _template_response(weather_data)
 
         # Send the prompt to GPT-4o
-        response = ChatCompletion.create(
+        response = openai_provider.call(
+            ChatCompletion.create,
             model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a weather assistant."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=_build_weather_messages(weather_data),
             max_tokens=100,
-            temperature=0.7
+            temperature=0.7,
+            request_timeout=openai_provider.timeout
         )
+        weather_report_cache.count("llm_calls")
 
-        return response["choices"][0]["message"]["content"]
+        report = response["choices"][0]["message"]["content"]
+        weather_report_cache.set(key, report)
+        return report
     except Exception as e:
         print(f"Error generating weather response: {e}")
         return "Unable to generate a weather response at the moment."
+
+
+async def _agenerate_report(weather_data: dict, key: tuple) -> str:
+    response = await openai_provider.acall(
+        ChatCompletion.acreate,
+        model="gpt-4",
+        messages=_build_weather_messages(weather_data),
+        max_tokens=100,
+        temperature=0.7,
+        request_timeout=openai_provider.timeout
+    )
+    weather_report_cache.count("llm_calls")
+    report = response["choices"][0]["message"]["content"]
+    weather_report_cache.set(key, report)
+    return report
+
+
+def _report_done(key: tuple, task: asyncio.Task):
+    if _report_inflight.get(key) is task:
+        del _report_inflight[key]
+    if not task.cancelled():
+        task.exception()  # Mark a failure as retrieved; waiters handle it themselves
+
+
+async def agenerate_weather_response(weather_data: dict) -> str:
+    """
+    Async variant of `generate_weather_response`.
+
+    Concurrent requests for the same conditions share one LLM call. With a
+    latency budget, the template answers if the LLM has not responded in time;
+    the LLM call still completes and fills the cache.
+
+    Args:
+        weather_data (dict): Weather data from the API.
+
+    Returns:
+        str: Generated natural language response.
+    """
+    try:
+        if "error" in weather_data:
+            return "Unable to retrieve weather information at the moment."
+
+        key = weather_report_key(weather_data)
+        report = weather_report_cache.get(key)
+        if report is not None:
+            return report
+        if WEATHER_REPORT_LATENCY_BUDGET_MS == 0:
+            return _template_response(weather_data)
+
+        task = _report_inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(_agenerate_report(weather_data, key))
+            _report_inflight[key] = task
+            task.add_done_callback(lambda done: _report_done(key, done))
+        else:
+            weather_report_cache.count("coalesced")
+
+        if WEATHER_REPORT_LATENCY_BUDGET_MS is None:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), WEATHER_REPORT_LATENCY_BUDGET_MS / 1000)
+        except asyncio.TimeoutError:
+            return _template_response(weather_data)
+    except Exception as e:
+        print(f"Error generating weather response: {e}")
+        return "Unable to generate a weather response at the moment."
+
+
+async def astream_weather_response(weather_data: dict):
+    """
+    Stream a natural language response for the weather data from GPT-4.
+
+    A cached report is sent as a single piece; a completed stream is cached.
+
+    Args:
+        weather_data (dict): Weather data from the API.
+
+    Yields:
+        str: Pieces of the generated response as they arrive.
+    """
+    if "error" in weather_data:
+        yield "Unable to retrieve weather information at the moment."
+        return
+
+    try:
+        key = weather_report_key(weather_data)
+    except (KeyError, TypeError) as e:
+        print(f"Error generating weather response: {e}")
+        yield "Unable to generate a weather response at the moment."
+        return
+    report = weather_report_cache.get(key)
+    if report is not None:
+        yield report
+        return
+    if WEATHER_REPORT_LATENCY_BUDGET_MS == 0:
+        yield _template_response(weather_data)
+        return
+
+    pieces = []
+    try:
+        stream = openai_provider.astream(
+            ChatCompletion.acreate,
+            model="gpt-4",
+            messages=_build_weather_messages(weather_data),
+            max_tokens=100,
+            temperature=0.7,
+            stream=True,
+            request_timeout=openai_provider.timeout
+        )
+        async for chunk in stream:
+            token = chunk["choices"][0]["delta"].get("content") if chunk["choices"] else None
+            if token:
+                pieces.append(token)
+                yield token
+        weather_report_cache.count("llm_calls")
+        if pieces:
+            weather_report_cache.set(key, "".join(pieces))
+    except Exception as e:
+        print(f"Error generating weather response: {e}")
+        if not pieces:
+            yield "Unable to generate a weather response at the moment."
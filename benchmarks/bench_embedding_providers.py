@@ -0,0 +1,90 @@
+"""
+Benchmark ingestion throughput of the remote and local embedding providers,
+with a cold and a warm on-disk embedding cache.
+
+The remote provider calls the fake provider server (see benchmarks/fake_providers.py)
+with the given latency. The local provider runs the model on this machine; the
+first run downloads it.
+
+Usage:
+    python -m benchmarks.bench_embedding_providers --pages 400 --latency-ms 80
+    python -m benchmarks.bench_embedding_providers --backends local --pages 2000
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from unittest import mock
+
+import openai
+
+from app.services import embeddings, vector_store
+from app.services.cache import DiskEmbeddingCache
+from benchmarks.bench_store_embeddings import FakeClient, FakeCollection
+from benchmarks.fake_providers import FakeProviderServer
+
+
+def ingest(provider, cache, documents) -> float:
+    """
+    Store the documents into a fake collection and return the elapsed seconds.
+    """
+    with mock.patch.object(embeddings, "embedding_provider", provider), \
+            mock.patch.object(embeddings, "embedding_cache", cache):
+        start = time.perf_counter()
+        vector_store.store_embeddings(FakeClient(FakeCollection(0)), "documents", documents)
+        return time.perf_counter() - start
+
+
+def query_latency(provider, queries: list) -> list:
+    """
+    Embed each query on its own without a cache and return the latencies in milliseconds.
+    """
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        provider.embed([query])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def run(name: str, documents: list, queries: list, cache_dir: str):
+    provider = embeddings.create_embedding_provider(name)
+    provider.embed(["warm up"])  # Load the model or open the connection pool outside the timings
+    cache = DiskEmbeddingCache(f"bench_{name}", cache_dir, provider.version)
+
+    cold = ingest(provider, cache, documents)
+    warm = ingest(provider, cache, documents)
+    latencies = query_latency(provider, queries)
+    print(f"{name:<8} cold {len(documents) / cold:9.1f} pages/sec   warm {len(documents) / warm:9.1f} pages/sec   "
+          f"query p50 {statistics.median(latencies):7.1f} ms   ({provider.version}, "
+          f"{cache.stats()['size']} cached vectors)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", default="openai,local", help="Comma-separated providers: openai, local.")
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--words-per-page", type=int, default=350)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="Latency of the fake remote endpoint.")
+    parser.add_argument("--port", type=int, default=9101)
+    args = parser.parse_args()
+
+    words = ["flour", "butter", "simmer", "garlic", "oven", "whisk", "salt", "pepper", "basil", "stock"]
+    documents = [
+        {"document_id": 1, "page_number": page + 1,
+         "content": " ".join(words[(page * 7 + i) % len(words)] for i in range(args.words_per_page)) + f" {page}."}
+        for page in range(args.pages)
+    ]
+    queries = [f"How long should I simmer the stock for recipe {i}?" for i in range(args.queries)]
+
+    with FakeProviderServer(port=args.port, latency_ms=args.latency_ms, jitter_ms=0) as server, \
+            tempfile.TemporaryDirectory() as cache_dir:
+        openai.api_base = f"{server.url}/v1"
+        openai.api_key = "fake"
+        for name in args.backends.split(","):
+            run(name.strip(), documents, queries, cache_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark document ingestion into the vector store against a local fake
+embedding backend, comparing the old per-page path with batched ingestion.
+
+Usage:
+    python -m benchmarks.bench_store_embeddings --pages 400 --latency-ms 50
+"""
+import argparse
+import time
+import uuid
+from unittest import mock
+
+import openai
+
+from app.services import embeddings, vector_store
+
+
+class FakeEmbeddingBackend:
+    """
+    Stand-in for openai.Embedding.create with a fixed per-call latency.
+    """
+
+    def __init__(self, latency: float, per_input_latency: float, dimensions: int = 1536):
+        self.latency = latency
+        self.per_input_latency = per_input_latency
+        self.dimensions = dimensions
+        self.calls = 0
+
+    def create(self, input, model, **kwargs):
+        texts = input if isinstance(input, list) else [input]
+        self.calls += 1
+        time.sleep(self.latency + self.per_input_latency * len(texts))
+        return {"data": [
+            {"index": i, "embedding": [float(len(text) % 7)] * self.dimensions}
+            for i, text in enumerate(texts)
+        ]}
+
+
+class FakeCollection:
+    """
+    Stand-in for a ChromaDB collection with a fixed per-write latency.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.writes = 0
+        self.count = 0
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.writes += 1
+        self.count += len(ids)
+        time.sleep(self.latency)
+
+
+class FakeClient:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get_or_create_collection(self, name, metadata=None):
+        return self.collection
+
+
+def store_embeddings_per_page(client, collection_name, documents):
+    """
+    The original ingestion loop: one embedding call and one add per page.
+    """
+    collection = client.get_or_create_collection(name=collection_name)
+    for doc in documents:
+        embedding = openai.Embedding.create(
+            input=doc["content"], model=vector_store.EMBEDDING_MODEL
+        )["data"][0]["embedding"]
+        collection.upsert(
+            ids=[str(uuid.uuid4())],
+            embeddings=[embedding],
+            documents=[doc["content"]],
+            metadatas=[{"page_number": doc["page_number"], "document_id": doc["document_id"]}]
+        )
+
+
+def run(label, store, documents, args):
+    backend = FakeEmbeddingBackend(args.latency_ms / 1000, args.per_input_ms / 1000)
+    collection = FakeCollection(args.write_latency_ms / 1000)
+    # The persistent embedding cache would turn repeated runs into cache hits
+    with mock.patch.object(openai.Embedding, "create", backend.create), \
+            mock.patch.object(embeddings, "embedding_cache", None):
+        start = time.perf_counter()
+        store(FakeClient(collection), "documents", documents)
+        elapsed = time.perf_counter() - start
+    print(f"{label:<10} {len(documents) / elapsed:10.1f} pages/sec "
+          f"({backend.calls} embedding calls, {collection.writes} writes, {elapsed:.2f}s)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--words-per-page", type=int, default=350)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fixed latency per embedding call.")
+    parser.add_argument("--per-input-ms", type=float, default=0.5, help="Extra latency per embedded text.")
+    parser.add_argument("--write-latency-ms", type=float, default=2.0, help="Latency per collection write.")
+    args = parser.parse_args()
+
+    page_text = " ".join(["ingredient"] * args.words_per_page)
+    documents = [
+        {"document_id": 1, "page_number": i + 1, "content": f"Page {i + 1}. {page_text}"}
+        for i in range(args.pages)
+    ]
+
+    before = run("per-page", store_embeddings_per_page, documents, args)
+    after = run("batched", vector_store.store_embeddings, documents, args)
+    print(f"speedup    {before / after:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Evaluate the local classifier offline against the labels GPT-4 assigned to
+stored messages.
+
+Messages are split into folds; for each fold the classifier is trained on the
+others and scored on it. For each confidence threshold the report shows how
+many LLM calls the local stage would avoid and how accurate it is on those.
+
+Usage:
+    python -m benchmarks.eval_local_classifier --folds 5 --thresholds 0.8 0.9 0.95
+"""
+import argparse
+
+from app.crud.message_crud import get_labeled_messages
+from app.database import Base, SessionLocal, engine, migrate_schema
+from app.services.classification import LOCAL_CLASSIFIER_MIN_EXAMPLES, TRUSTED_LABEL_SOURCES
+from app.services.local_classifier import NaiveBayesClassifier
+
+
+def cross_validate(examples: list, folds: int) -> list:
+    """
+    Return (llm_label, predicted_label, confidence) for every example.
+    """
+    predictions = []
+    for fold in range(folds):
+        train = [example for i, example in enumerate(examples) if i % folds != fold]
+        test = [example for i, example in enumerate(examples) if i % folds == fold]
+        classifier = NaiveBayesClassifier(min_examples=LOCAL_CLASSIFIER_MIN_EXAMPLES)
+        classifier.fit(train)
+        for text, label in test:
+            predicted, confidence = classifier.predict(text)
+            predictions.append((label, predicted, confidence))
+    return predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=None, help="Use only the most recent N labeled messages.")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.7, 0.8, 0.9, 0.95, 0.99])
+    args = parser.parse_args()
+
+    # A fresh or older database may lack the tables or the label columns
+    Base.metadata.create_all(bind=engine)
+    migrate_schema()
+    db = SessionLocal()
+    try:
+        examples = get_labeled_messages(db, TRUSTED_LABEL_SOURCES, limit=args.limit)
+    finally:
+        db.close()
+    if len(examples) < args.folds:
+        print(f"Not enough labeled messages to evaluate ({len(examples)} found).")
+        return
+
+    predictions = cross_validate(examples, args.folds)
+    overall = sum(label == predicted for label, predicted, _ in predictions) / len(predictions)
+    print(f"{len(predictions)} labeled messages, {args.folds}-fold accuracy without threshold: {overall:.3f}\n")
+    print(f"{'threshold':>9}  {'llm calls avoided':>17}  {'local accuracy':>14}  {'overall accuracy':>16}")
+    for threshold in args.thresholds:
+        confident = [(label, predicted) for label, predicted, confidence in predictions if confidence >= threshold]
+        correct = sum(label == predicted for label, predicted in confident)
+        avoided = len(confident) / len(predictions)
+        local_accuracy = correct / len(confident) if confident else 0.0
+        # Messages below the threshold go to the LLM, whose label is the reference
+        overall_accuracy = (correct + len(predictions) - len(confident)) / len(predictions)
+        print(f"{threshold:>9.2f}  {avoided:>17.1%}  {local_accuracy:>14.3f}  {overall_accuracy:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
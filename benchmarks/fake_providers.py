@@ -0,0 +1,234 @@
+"""
+Local fake of the OpenAI, Groq and WeatherAPI endpoints the app calls, with
+configurable latency, tail latency and error rate, for load tests that must not
+reach the real providers.
+
+Usage:
+    python -m benchmarks.fake_providers --port 9100 --latency-ms 80 --tail-prob 0.05 --tail-ms 2000
+
+Then start the app with:
+    OPENAI_API_BASE=http://127.0.0.1:9100/v1 GROQ_BASE_URL=http://127.0.0.1:9100 \\
+    WEATHER_API_URL=http://127.0.0.1:9100/v1/current.json OPENAI_API_KEY=fake GROQ_API_KEY=fake \\
+    uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WEATHER_WORDS = {"weather", "rain", "sunny", "snow", "cloudy", "wind", "temperature", "forecast", "sky", "hot", "cold"}
+
+
+def _fake_embedding(text: str, dimensions: int) -> list:
+    # Deterministic per text, so identical texts get identical vectors
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    return [rng.uniform(-1, 1) for _ in range(dimensions)]
+
+
+def _fake_reply(messages: list) -> str:
+    prompt = messages[-1]["content"] if messages else ""
+    if prompt.startswith("Classify this message:"):
+        message = prompt[len("Classify this message:"):].split("\n", 1)[0].lower()
+        return "weather" if any(word in message for word in WEATHER_WORDS) else "food"
+    if "weather report" in prompt:
+        return "Expect mild conditions with a light breeze throughout the day."
+    return "Boil salted water, cook the pasta until al dente, then toss it with the sauce."
+
+
+def create_app(latency_ms: float = 50.0, jitter_ms: float = 10.0, tail_prob: float = 0.0, tail_ms: float = 1000.0,
+               error_rate: float = 0.0, dimensions: int = 1536, token_delay_ms: float = 5.0) -> FastAPI:
+    """
+    Build the fake provider app.
+
+    Args:
+        latency_ms (float): Base latency of every response.
+        jitter_ms (float): Uniform random latency added on top of the base.
+        tail_prob (float): Probability that a request is slow.
+        tail_ms (float): Extra latency of a slow request.
+        error_rate (float): Probability that a request fails with 503.
+        dimensions (int): Length of the fake embeddings.
+        token_delay_ms (float): Delay between streamed tokens.
+
+    Returns:
+        FastAPI: The app; request counts are reported at GET /stats.
+    """
+    app = FastAPI(title="Fake providers")
+    app.state.requests = Counter()
+    app.state.errors = Counter()
+
+    async def simulate(endpoint: str):
+        app.state.requests[endpoint] += 1
+        delay = latency_ms + random.uniform(0, jitter_ms)
+        if random.random() < tail_prob:
+            delay += tail_ms
+        await asyncio.sleep(delay / 1000)
+        if random.random() < error_rate:
+            app.state.errors[endpoint] += 1
+            return JSONResponse(status_code=503, content={"error": {"message": "Injected failure", "type": "server_error"}})
+        return None
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        error = await simulate("embeddings")
+        if error is not None:
+            return error
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        tokens = sum(len(text.split()) for text in texts)
+        return {
+            "object": "list",
+            "model": body.get("model"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": _fake_embedding(text, dimensions)}
+                for i, text in enumerate(texts)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    async def chat_completions(request: Request, endpoint: str):
+        body = await request.json()
+        error = await simulate(endpoint)
+        if error is not None:
+            return error
+        reply = _fake_reply(body.get("messages", []))
+        created = int(time.time())
+        base = {"id": f"chatcmpl-fake-{created}", "created": created, "model": body.get("model")}
+
+        if not body.get("stream"):
+            prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+            completion_tokens = len(reply.split())
+            return {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            }
+
+        async def events():
+            words = reply.split(" ")
+            for i, word in enumerate(words):
+                delta = {"role": "assistant", "content": word if i == 0 else " " + word}
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(token_delay_ms / 1000)
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        return await chat_completions(request, "openai_chat")
+
+    @app.post("/openai/v1/chat/completions")
+    async def groq_chat(request: Request):
+        return await chat_completions(request, "groq_chat")
+
+    @app.get("/v1/current.json")
+    async def weather(q: str = "New York"):
+        error = await simulate("weather")
+        if error is not None:
+            return error
+        rng = random.Random(q.lower())
+        return {
+            "location": {"name": q.title(), "country": "Fakeland"},
+            "current": {
+                "temp_c": round(rng.uniform(-5, 30), 1),
+                "condition": {"text": rng.choice(["Sunny", "Partly cloudy", "Light rain", "Overcast"])},
+                "humidity": rng.randint(20, 95),
+                "wind_kph": round(rng.uniform(0, 40), 1),
+            },
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": dict(app.state.requests), "errors": dict(app.state.errors)}
+
+    return app
+
+
+class FakeProviderServer:
+    """
+    Run the fake provider app with uvicorn on a background thread.
+
+    Usage:
+        with FakeProviderServer(port=9100, latency_ms=20) as server:
+            env = server.environment()
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100, **options):
+        self.host = host
+        self.port = port
+        self.app = create_app(**options)
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning"))
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def environment(self) -> dict:
+        """
+        Return the environment variables that point the app at this server.
+        """
+        return {
+            "OPENAI_API_BASE": f"{self.url}/v1",
+            "OPENAI_API_KEY": "fake",
+            "GROQ_BASE_URL": self.url,
+            "GROQ_API_KEY": "fake",
+            "WEATHER_API_URL": f"{self.url}/v1/current.json",
+            "WEATHER_API_KEY": "fake",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError(f"The fake provider server failed to start on port {self.port}.")
+            time.sleep(0.05)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Base latency of every response.")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Uniform random extra latency.")
+    parser.add_argument("--tail-prob", type=float, default=0.0, help="Probability that a request is slow.")
+    parser.add_argument("--tail-ms", type=float, default=1000.0, help="Extra latency of a slow request.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 503 response.")
+    parser.add_argument("--dimensions", type=int, default=1536, help="Length of the fake embeddings.")
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.jitter_ms, args.tail_prob, args.tail_ms, args.error_rate, args.dimensions)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""
+Load test the service end to end against local fake OpenAI, Groq and WeatherAPI
+servers, and write the results as JSON for comparison between commits.
+
+The app is started with uvicorn in a subprocess, on a temporary SQLite database,
+Chroma store and upload directory, with every provider pointed at the fake
+server (see benchmarks/fake_providers.py). Each scenario sends a fixed number of
+requests at a fixed concurrency:
+    post_messages   POST /messages/ with a mix of food and weather questions
+    get_messages    GET /messages/ pages
+    post_documents  POST /documents/ with synthetic PDFs, then waits for ingestion
+
+Usage:
+    python -m benchmarks.load_test --concurrency 16 --requests 500 --output results.json
+    python -m benchmarks.load_test --latency-ms 200 --error-rate 0.02 --env MESSAGE_GROUP_COMMIT=true
+    python -m benchmarks.load_test --compare baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks.fake_providers import FakeProviderServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("post_messages", "get_messages", "post_documents")
+
+FOOD_QUESTIONS = [
+    "How do I cook pasta al dente?",
+    "What goes well with roasted salmon?",
+    "How long should I simmer a tomato sauce?",
+    "Can I replace butter with olive oil when baking?",
+    "What is a good vegetarian lasagna filling?",
+]
+WEATHER_QUESTIONS = [
+    "What is the weather like today?",
+    "Will it rain this afternoon?",
+    "Is it sunny outside right now?",
+    "How cold is it going to be tonight?",
+]
+RECIPE_WORDS = ["flour", "butter", "garlic", "basil", "simmer", "whisk", "oven", "salt", "pepper", "stock",
+                "onion", "roast", "knead", "dough", "sauce", "lemon", "thyme", "braise", "sugar", "cream"]
+
+
+def synthetic_pdf(pages: list) -> bytes:
+    """
+    Build a minimal PDF with one line of Helvetica text per page.
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    font_id = 3 + 2 * len(pages)
+    for i, text in enumerate(pages):
+        escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        stream = f"BT /F1 10 Tf 40 760 Td ({escaped}) Tj ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+                       f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+def synthetic_document(index: int, pages: int, words_per_page: int) -> bytes:
+    rng = random.Random(index)
+    return synthetic_pdf([
+        f"Recipe {index} page {page + 1}. " + " ".join(rng.choice(RECIPE_WORDS) for _ in range(words_per_page)) + "."
+        for page in range(pages)
+    ])
+
+
+def percentiles(latencies: list) -> dict:
+    """
+    Return the mean, p50, p95, p99 and maximum of latencies in milliseconds (nearest rank).
+    """
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p * len(ordered))) - 1))]
+
+    return {
+        "mean": sum(ordered) / len(ordered),
+        "p50": rank(0.50),
+        "p95": rank(0.95),
+        "p99": rank(0.99),
+        "max": ordered[-1],
+    }
+
+
+def read_rss_mb(pid: int) -> dict:
+    """
+    Return the current and peak resident set size of a process from /proc, or None off Linux.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            fields = dict(line.split(":", 1) for line in status if ":" in line)
+    except OSError:
+        return None
+    return {
+        "rss": int(fields["VmRSS"].split()[0]) / 1024,
+        "peak": int(fields["VmHWM"].split()[0]) / 1024,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_revision() -> dict:
+    """
+    Return the commit and whether the working tree has uncommitted changes.
+    """
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+
+    try:
+        return {"sha": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"sha": None, "dirty": None}
+
+
+class AppProcess:
+    """
+    Run app.main:app with uvicorn in a subprocess on temporary storage.
+
+    Attributes:
+        port (int): Port the app listens on.
+        env (dict): Extra environment variables for the app.
+        workdir (str): Directory for the database, Chroma store, uploads and log.
+    """
+
+    def __init__(self, port: int, env: dict, workdir: str):
+        self.port = port
+        self.workdir = workdir
+        self.log_path = os.path.join(workdir, "app.log")
+        self.env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'load.db')}",
+            "CHROMA_PATH": os.path.join(workdir, "chromadb"),
+            "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+            "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache"),
+            "PYTHONUNBUFFERED": "1",
+            **env,
+        }
+        self.process = None
+        self._log = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float = 60.0):
+        self._log = open(self.log_path, "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--log-level", "warning"],
+            cwd=REPO_ROOT, env=self.env, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"The app exited during startup; see {self.log_path}:\n{self.log_tail()}")
+            try:
+                if httpx.get(f"{self.url}/", timeout=1.0).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"The app did not start within {timeout:.0f}s; see {self.log_path}.")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self._log is not None:
+            self._log.close()
+
+    def log_text(self) -> str:
+        with open(self.log_path, errors="replace") as log:
+            return log.read()
+
+    def log_tail(self, lines: int = 20) -> str:
+        return "\n".join(self.log_text().splitlines()[-lines:])
+
+
+def db_write_metrics(metrics_text: str) -> dict:
+    """
+    Return the count and total seconds of the db_write stages, per endpoint, from /metrics.
+    """
+    totals = {}
+    for family in text_string_to_metric_families(metrics_text):
+        if family.name != "app_stage_duration_seconds":
+            continue
+        for sample in family.samples:
+            if sample.labels.get("stage") == "db_write" and sample.name.endswith(("_count", "_sum")):
+                entry = totals.setdefault(sample.labels["endpoint"], {"count": 0.0, "sum": 0.0})
+                entry["count" if sample.name.endswith("_count") else "sum"] += sample.value
+    return totals
+
+
+class Scenario:
+    """
+    Send requests of one kind at a fixed concurrency and measure them.
+
+    Attributes:
+        name (str): One of SCENARIOS.
+        app (AppProcess): The app under test.
+        args (argparse.Namespace): Load test options.
+        first_index (int): Index of the first request; PDFs and unique messages are derived from it.
+    """
+
+    def __init__(self, name: str, app: AppProcess, args, first_index: int = 0):
+        self.name = name
+        self.app = app
+        self.args = args
+        self.first_index = first_index
+        self.latencies = []
+        self.statuses = Counter()
+        self.failures = Counter()
+        self.document_ids = []
+        self.rss_samples = []
+        self.pool_samples = []
+
+    async def request(self, client: httpx.AsyncClient, index: int) -> httpx.Response:
+        if self.name == "post_messages":
+            questions = WEATHER_QUESTIONS if random.random() < self.args.weather_share else FOOD_QUESTIONS
+            content = random.choice(questions)
+            if random.random() < self.args.unique_share:
+                content = f"{content} ({index})"  # Defeats the classification and retrieval caches
+            return await client.post("/messages/", params={"content": content})
+        if self.name == "get_messages":
+            return await client.get("/messages/", params={"limit": self.args.page_size})
+        pdf = synthetic_document(index, self.args.pdf_pages, self.args.words_per_page)
+        response = await client.post("/documents/", files={"file": (f"load-{index}.pdf", pdf, "application/pdf")})
+        if response.status_code == 202:
+            self.document_ids.append(response.json()["document_id"])
+        return response
+
+    async def _worker(self, client: httpx.AsyncClient, indexes):
+        for index in indexes:
+            start = time.perf_counter()
+            try:
+                response = await self.request(client, index)
+            except httpx.HTTPError as e:
+                self.failures[type(e).__name__] += 1
+                continue
+            self.latencies.append((time.perf_counter() - start) * 1000)
+            self.statuses[response.status_code] += 1
+
+    async def _sample(self, client: httpx.AsyncClient, stop: asyncio.Event):
+        # Memory and pool usage while the load runs
+        while not stop.is_set():
+            rss = read_rss_mb(self.app.process.pid)
+            if rss is not None:
+                self.rss_samples.append(rss)
+            try:
+                self.pool_samples.append((await client.get("/db/stats")).json())
+            except (httpx.HTTPError, ValueError):
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), self.args.sample_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _wait_for_ingestion(self, client: httpx.AsyncClient) -> dict:
+        start = time.perf_counter()
+        pending = set(self.document_ids)
+        pages = 0
+        while pending and time.perf_counter() - start < self.args.ingestion_timeout:
+            for document_id in list(pending):
+                status = (await client.get(f"/documents/{document_id}/status")).json()
+                job = status.get("job") or {}
+                if status["is_processed"] or job.get("stage") in ("completed", "failed"):
+                    pending.discard(document_id)
+                    pages += status["pages_processed"]
+            await asyncio.sleep(0.2)
+        elapsed = time.perf_counter() - start
+        return {"documents": len(self.document_ids), "unfinished": len(pending), "pages_processed": pages,
+                "seconds_after_upload": elapsed}
+
+    async def run(self) -> dict:
+        limits = httpx.Limits(max_connections=self.args.concurrency + 4, max_keepalive_connections=self.args.concurrency + 4)
+        async with httpx.AsyncClient(base_url=self.app.url, timeout=self.args.request_timeout, limits=limits) as client:
+            metrics_before = db_write_metrics((await client.get("/metrics")).text)
+            log_offset = len(self.app.log_text())
+            rss_before = read_rss_mb(self.app.process.pid)
+
+            indexes = iter(range(self.first_index, self.first_index + self.args.requests))
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(self._sample(client, stop))
+            start = time.perf_counter()
+            await asyncio.gather(*(self._worker(client, indexes) for _ in range(self.args.concurrency)))
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await sampler
+
+            ingestion = await self._wait_for_ingestion(client) if self.name == "post_documents" else None
+            metrics_after = db_write_metrics((await client.get("/metrics")).text)
+            rss_after = read_rss_mb(self.app.process.pid)
+
+        completed = len(self.latencies)
+        result = {
+            "requests": self.args.requests,
+            "concurrency": self.args.concurrency,
+            "completed": completed,
+            "errors": sum(count for status, count in self.statuses.items() if status >= 400) + sum(self.failures.values()),
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "failures": dict(self.failures),
+            "seconds": elapsed,
+            "rps": completed / elapsed if elapsed else 0.0,
+            "latency_ms": percentiles(self.latencies),
+            "memory_mb": {
+                "rss_before": rss_before and rss_before["rss"],
+                "rss_after": rss_after and rss_after["rss"],
+                "rss_max_sampled": max((sample["rss"] for sample in self.rss_samples), default=None),
+                "peak": rss_after and rss_after["peak"],
+            },
+            "sqlite": self._contention(metrics_before, metrics_after, self.app.log_text()[log_offset:]),
+        }
+        if ingestion is not None:
+            result["ingestion"] = ingestion
+        return result
+
+    def _contention(self, before: dict, after: dict, log: str) -> dict:
+        """
+        Summarize database write latency, pool pressure and lock errors during the scenario.
+        """
+        writes = sum(entry["count"] for entry in after.values()) - sum(entry["count"] for entry in before.values())
+        seconds = sum(entry["sum"] for entry in after.values()) - sum(entry["sum"] for entry in before.values())
+        pools = [sample.get("sync", {}) for sample in self.pool_samples]
+        async_pools = [sample.get("async", {}) for sample in self.pool_samples]
+        return {
+            "db_writes": int(writes),
+            "db_write_mean_ms": seconds / writes * 1000 if writes else None,
+            "locked_errors": log.count("database is locked"),
+            "pool_timeouts": log.count("QueuePool limit"),
+            "max_checked_out_sync": max((pool.get("checked_out", 0) for pool in pools), default=None),
+            "max_checked_out_async": max((pool.get("checked_out", 0) for pool in async_pools), default=None),
+            "max_overflow_async": max((pool.get("overflow", 0) for pool in async_pools), default=None),
+        }
+
+
+def print_summary(name: str, result: dict, baseline: dict = None):
+    latency = result["latency_ms"]
+    line = (f"{name:<15} {result['rps']:8.1f} req/s  p50 {latency.get('p50', 0):8.1f}  p95 {latency.get('p95', 0):8.1f}  "
+            f"p99 {latency.get('p99', 0):8.1f} ms  errors {result['errors']:4d}  "
+            f"rss {result['memory_mb']['rss_after'] or 0:7.1f} MB  locked {result['sqlite']['locked_errors']}")
+    print(line)
+    if baseline is not None:
+        old = baseline["rps"] or 1e-9
+        old_p95 = baseline["latency_ms"].get("p95") or 1e-9
+        print(f"{'':<15} vs baseline: rps {(result['rps'] / old - 1) * 100:+.1f}%, "
+              f"p95 {(latency.get('p95', 0) / old_p95 - 1) * 100:+.1f}%")
+    if "ingestion" in result:
+        ingestion = result["ingestion"]
+        print(f"{'':<15} ingestion: {ingestion['pages_processed']} pages of {ingestion['documents']} documents "
+              f"finished {ingestion['seconds_after_upload']:.1f}s after upload ({ingestion['unfinished']} unfinished)")
+
+
+def parse_env(pairs: list) -> dict:
+    env = {}
+    for pair in pairs:
+        key, separator, value = pair.partition("=")
+        if not separator:
+            raise SystemExit(f"--env expects KEY=VALUE, got '{pair}'.")
+        env[key] = value
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run, in order.")
+    parser.add_argument("--requests", type=int, default=300, help="Requests per scenario.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once.")
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--weather-share", type=float, default=0.3, help="Share of weather questions.")
+    parser.add_argument("--unique-share", type=float, default=0.5, help="Share of messages made unique to miss the caches.")
+    parser.add_argument("--page-size", type=int, default=100, help="Limit of GET /messages/.")
+    parser.add_argument("--pdf-pages", type=int, default=5, help="Pages per synthetic PDF.")
+    parser.add_argument("--words-per-page", type=int, default=120)
+    parser.add_argument("--ingestion-timeout", type=float, default=120.0, help="Seconds to wait for uploads to be ingested.")
+    parser.add_argument("--seed-documents", type=int, default=2, help="PDFs ingested before the scenarios, so food questions find context.")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="Seconds between memory and pool samples.")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Base latency of the fake providers.")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--tail-prob", type=float, default=0.0, help="Probability that a provider call is slow.")
+    parser.add_argument("--tail-ms", type=float, default=1000.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a provider 503.")
+    parser.add_argument("--dimensions", type=int, default=256, help="Length of the fake embeddings.")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE passed to the app; repeatable.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare with.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}; choose from {', '.join(SCENARIOS)}.")
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    fake = FakeProviderServer(port=free_port(), latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                              tail_prob=args.tail_prob, tail_ms=args.tail_ms, error_rate=args.error_rate,
+                              dimensions=args.dimensions)
+    results = {
+        "git": git_revision(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "scenarios": {},
+    }
+    with fake, tempfile.TemporaryDirectory(prefix="load-test-") as workdir:
+        app = AppProcess(free_port(), {**fake.environment(), **parse_env(args.env)}, workdir).start()
+        try:
+            if args.seed_documents:
+                seed_args = argparse.Namespace(**{**vars(args), "requests": args.seed_documents, "concurrency": 1})
+                # Seed documents get their own indexes so the scenario's uploads are not duplicates
+                seeded = asyncio.run(Scenario("post_documents", app, seed_args, first_index=10 ** 6).run())
+                print(f"Seeded {seeded['ingestion']['pages_processed']} pages from {args.seed_documents} documents.")
+
+            for name in scenarios:
+                result = asyncio.run(Scenario(name, app, args).run())
+                results["scenarios"][name] = result
+                print_summary(name, result, baseline and baseline["scenarios"].get(name))
+
+            results["fake_providers"] = httpx.get(f"{fake.url}/stats").json()
+        finally:
+            app.stop()
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
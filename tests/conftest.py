@@ -0,0 +1,4 @@
+import os
+
+# Keep app.database from pointing its engines at ./test.db while the tests import it
+os.environ.setdefault("DATABASE_URL", "sqlite://")
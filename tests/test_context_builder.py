@@ -0,0 +1,63 @@
+from app.services.chunking import count_tokens
+from app.services.context_builder import build_context
+
+
+def _words(prefix: str, count: int) -> str:
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+def test_chunks_are_packed_within_the_budget():
+    chunks = [{"content": _words(f"c{n}w", 400), "score": 1 - n / 10} for n in range(5)]
+
+    for budget in (100, 450, 1000):
+        context, stats = build_context(chunks, budget=budget)
+        assert count_tokens(context) <= budget
+        assert stats["context_tokens"] == count_tokens(context)
+
+
+def test_chunks_are_added_in_order_of_score():
+    chunks = [{"content": "low relevance", "score": 0.1}, {"content": "high relevance", "score": 0.9}]
+
+    context, stats = build_context(chunks, budget=100)
+
+    assert context == "high relevance\n\nlow relevance"
+    assert stats["used"] == 2
+
+
+def test_truncated_chunk_stays_within_the_budget():
+    chunks = [{"content": _words("a", 60), "score": 0.9}, {"content": _words("b", 200), "score": 0.5}]
+
+    context, stats = build_context(chunks, budget=120)
+
+    assert context.endswith(" ...")
+    assert stats["used"] == 2
+    assert stats["context_tokens"] == count_tokens(context) == 120
+
+
+def test_too_little_room_left_stops_packing():
+    chunks = [{"content": _words("a", 90), "score": 0.9}, {"content": _words("b", 200), "score": 0.5}]
+
+    context, stats = build_context(chunks, budget=100)
+
+    assert context == _words("a", 90)
+    assert stats["used"] == 1
+
+
+def test_duplicates_and_overlapping_windows_are_included_once():
+    page = _words("w", 100)
+    first_end = len(_words("w", 60))
+    second_start = len(_words("w", 40)) + 1
+    chunks = [
+        {"content": page[:first_end], "score": 0.9, "document_id": 1, "page_number": 1,
+         "char_start": 0, "char_end": first_end},
+        {"content": page[second_start:], "score": 0.8, "document_id": 1, "page_number": 1,
+         "char_start": second_start, "char_end": len(page)},
+        {"content": page[:first_end], "score": 0.7},
+    ]
+
+    context, stats = build_context(chunks, budget=1000)
+
+    assert stats["duplicates"] == 1
+    assert context.count("w50 ") == 1
+    assert "w99" in context
+    assert stats["context_tokens"] == count_tokens(context)
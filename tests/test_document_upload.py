@@ -0,0 +1,143 @@
+import asyncio
+from types import SimpleNamespace
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.database import Base, get_async_db
+from app.models import Document
+from app.routers import documents
+
+PDF = b"%PDF-1.4 first revision"
+REVISION = b"%PDF-1.4 second revision"
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    """
+    Run requests against the documents router, backed by a temporary database and
+    with ingestion jobs recorded instead of run.
+    """
+    database = tmp_path / "documents.db"
+    engine = create_engine(f"sqlite:///{database}")
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.chdir(tmp_path)
+
+    jobs = []
+    active = set()
+    monkeypatch.setattr(documents, "submit_ingestion_job", lambda document_id, file_path: jobs.append(document_id)
+                        or f"job-{len(jobs)}")
+    monkeypatch.setattr(documents, "is_job_active", lambda document_id: document_id in active)
+
+    async def send(*requests):
+        # The async engine is bound to the event loop of this call
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{database}")
+        session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+
+        async def get_test_db():
+            async with session_factory() as db:
+                yield db
+
+        app = FastAPI()
+        app.include_router(documents.router)
+        app.dependency_overrides[get_async_db] = get_test_db
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                return await asyncio.gather(*(
+                    client.post("/documents/", files={"file": (name, content, "application/pdf")},
+                                data={} if document_id is None else {"document_id": str(document_id)})
+                    for name, content, document_id in requests
+                ))
+        finally:
+            await async_engine.dispose()
+
+    def post(name: str, content: bytes, document_id: int = None) -> httpx.Response:
+        return asyncio.run(send((name, content, document_id)))[0]
+
+    def post_concurrently(*requests) -> list[httpx.Response]:
+        return asyncio.run(send(*((name, content, None) for name, content in requests)))
+
+    def count_documents() -> int:
+        with engine.connect() as connection:
+            return connection.scalar(select(func.count(Document.id)))
+
+    yield SimpleNamespace(post=post, post_concurrently=post_concurrently, jobs=jobs, active=active,
+                          count_documents=count_documents)
+    engine.dispose()
+
+
+def test_concurrent_identical_uploads_create_one_document(uploads, monkeypatch):
+    create_document = documents.acreate_document
+
+    async def slow_create_document(*args, **kwargs):
+        # Hold the first upload between its duplicate lookup and its insert
+        await asyncio.sleep(0.3)
+        return await create_document(*args, **kwargs)
+
+    monkeypatch.setattr(documents, "acreate_document", slow_create_document)
+
+    responses = uploads.post_concurrently(("a.pdf", PDF), ("b.pdf", PDF))
+
+    assert sorted(response.status_code for response in responses) == [202, 409]
+    assert uploads.count_documents() == 1
+    assert uploads.jobs == [1]
+    rejected = next(response for response in responses if response.status_code == 409)
+    assert rejected.json()["detail"] == "An identical file is being uploaded; retry shortly."
+
+
+def test_retried_identical_upload_reuses_the_document(uploads):
+    document_id = uploads.post("a.pdf", PDF).json()["document_id"]
+
+    response = uploads.post("b.pdf", PDF)
+
+    assert response.status_code == 202
+    assert response.json()["document_id"] == document_id
+    assert uploads.count_documents() == 1
+
+
+def test_identical_upload_of_a_document_being_processed_queues_no_job(uploads):
+    document_id = uploads.post("a.pdf", PDF).json()["document_id"]
+    uploads.active.add(document_id)
+
+    response = uploads.post("a.pdf", PDF)
+
+    assert response.json() == {"message": "Document already uploaded.", "document_id": document_id, "job_id": None}
+    assert uploads.jobs == [document_id]
+
+
+def test_revision_updates_its_document(uploads):
+    document_id = uploads.post("report.pdf", PDF).json()["document_id"]
+
+    response = uploads.post("report-v2.pdf", REVISION, document_id=document_id)
+
+    assert response.status_code == 202
+    assert response.json()["document_id"] == document_id
+    assert uploads.jobs == [document_id, document_id]
+    assert uploads.count_documents() == 1
+
+
+def test_same_file_name_without_document_id_creates_a_new_document(uploads):
+    first_id = uploads.post("report.pdf", PDF).json()["document_id"]
+
+    second_id = uploads.post("report.pdf", REVISION).json()["document_id"]
+
+    assert second_id != first_id
+    assert uploads.count_documents() == 2
+
+
+def test_revision_of_a_document_being_processed_is_rejected(uploads):
+    document_id = uploads.post("report.pdf", PDF).json()["document_id"]
+    uploads.active.add(document_id)
+
+    response = uploads.post("report.pdf", REVISION, document_id=document_id)
+
+    assert response.status_code == 409
+    assert uploads.jobs == [document_id]
+
+
+def test_revision_of_an_unknown_document_is_not_found(uploads):
+    response = uploads.post("report.pdf", PDF, document_id=42)
+
+    assert response.status_code == 404
+    assert uploads.count_documents() == 0
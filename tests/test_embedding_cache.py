@@ -0,0 +1,74 @@
+import numpy as np
+from app.services.cache import DiskEmbeddingCache
+
+
+def _vectors(*values):
+    return np.array([[value] * 4 for value in values], dtype=np.float32)
+
+
+def _cache(tmp_path, name):
+    return DiskEmbeddingCache(name, str(tmp_path), "test-model")
+
+
+def test_vectors_round_trip_across_instances(tmp_path):
+    _cache(tmp_path, "test_round_trip").set_many(["a", "b"], _vectors(1, 2))
+
+    reopened = _cache(tmp_path, "test_round_trip_reopened")
+    a, missing, b = reopened.get_many(["a", "c", "b"])
+
+    assert missing is None
+    np.testing.assert_array_equal(a, _vectors(1)[0])
+    np.testing.assert_array_equal(b, _vectors(2)[0])
+
+
+def test_torn_tail_is_ignored_and_overwritten(tmp_path):
+    cache = _cache(tmp_path, "test_torn_tail")
+    cache.set_many(["a", "b"], _vectors(1, 2))
+    # An append interrupted mid-write: part of a vector and part of a key
+    with open(cache._file("vectors.f32"), "ab") as vectors_file:
+        vectors_file.write(b"\x00" * 6)
+    with open(cache._file("keys.bin"), "ab") as keys_file:
+        keys_file.write(DiskEmbeddingCache.key("c")[:5])
+
+    reopened = _cache(tmp_path, "test_torn_tail_reopened")
+    assert len(reopened) == 2
+    assert reopened.get_many(["c"]) == [None]
+
+    reopened.set_many(["c"], _vectors(3))
+
+    a, b, c = _cache(tmp_path, "test_torn_tail_check").get_many(["a", "b", "c"])
+    np.testing.assert_array_equal(a, _vectors(1)[0])
+    np.testing.assert_array_equal(b, _vectors(2)[0])
+    np.testing.assert_array_equal(c, _vectors(3)[0])
+    assert reopened._size("vectors.f32") == 3 * 4 * 4
+    assert reopened._size("keys.bin") == 3 * DiskEmbeddingCache.KEY_BYTES
+
+
+def test_orphan_vector_does_not_shift_later_rows(tmp_path):
+    cache = _cache(tmp_path, "test_orphan")
+    cache.set_many(["a"], _vectors(1))
+    # A crash after the vector was written but before its key
+    with open(cache._file("vectors.f32"), "ab") as vectors_file:
+        vectors_file.write(_vectors(9).tobytes())
+
+    cache.set_many(["b"], _vectors(2))
+
+    a, b = _cache(tmp_path, "test_orphan_check").get_many(["a", "b"])
+    np.testing.assert_array_equal(a, _vectors(1)[0])
+    np.testing.assert_array_equal(b, _vectors(2)[0])
+
+
+def test_clear_by_another_process_invalidates_the_index(tmp_path):
+    writer = _cache(tmp_path, "test_clear_writer")
+    reader = _cache(tmp_path, "test_clear_reader")
+    writer.set_many(["a", "b"], _vectors(1, 2))
+    assert reader.get_many(["a"])[0] is not None
+
+    # Cleared and refilled with more rows than the reader had indexed
+    writer.clear()
+    writer.set_many(["c", "d", "e"], _vectors(3, 4, 5))
+
+    a, c, e = reader.get_many(["a", "c", "e"])
+    assert a is None
+    np.testing.assert_array_equal(c, _vectors(3)[0])
+    np.testing.assert_array_equal(e, _vectors(5)[0])
@@ -0,0 +1,131 @@
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.crud.document_crud import create_document, get_document
+from app.models import DocumentPage
+from app.services import ingestion
+
+
+class FakeVectorStore:
+    """
+    Records what the pipeline embeds and deletes instead of calling ChromaDB.
+    """
+
+    def __init__(self):
+        self.stored = []
+        self.deleted = []
+
+    def store_embeddings(self, client, collection_name, documents, on_batch_stored=None, **kwargs):
+        self.stored.extend(document["page_number"] for document in documents)
+        if documents and on_batch_stored is not None:
+            on_batch_stored(documents)
+        return len(documents)
+
+    def delete_page_embeddings(self, collection_name, document_id, page_numbers=None, after_page=None):
+        self.deleted.append((page_numbers, after_page))
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    # A file database, so the ingestion worker thread and the test see the same rows
+    engine = create_engine(f"sqlite:///{tmp_path / 'ingestion.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(ingestion, "SessionLocal", factory)
+    yield factory
+    engine.dispose()
+
+
+@pytest.fixture
+def vector_store(monkeypatch):
+    store = FakeVectorStore()
+    monkeypatch.setattr(ingestion, "get_chromadb_client", lambda: None)
+    monkeypatch.setattr(ingestion, "store_embeddings", store.store_embeddings)
+    monkeypatch.setattr(ingestion, "delete_page_embeddings", store.delete_page_embeddings)
+    return store
+
+
+@pytest.fixture
+def pdf(monkeypatch):
+    # Page texts by file path, standing in for the PDF parser
+    files = {}
+    monkeypatch.setattr(ingestion, "count_pdf_pages", lambda path: len(files[path]))
+    monkeypatch.setattr(ingestion, "iter_pdf_pages", lambda path: iter(
+        {"page_number": number, "content": content} for number, content in enumerate(files[path], start=1)
+    ))
+    return files
+
+
+def _ingest(document_id: int, file_path: str) -> dict:
+    job_id = ingestion.submit_ingestion_job(document_id, file_path)
+    ingestion.shutdown_ingestion(wait=True)
+    return ingestion.get_job(job_id)
+
+
+def _pages(db, document_id: int) -> dict[int, tuple[str, bool]]:
+    pages = db.scalars(select(DocumentPage).filter(DocumentPage.document_id == document_id)).all()
+    return {page.page_number: (page.content, page.is_processed) for page in pages}
+
+
+def test_pipeline_stores_embeds_and_marks_pages(session_factory, vector_store, pdf):
+    pdf["v1.pdf"] = ["first page", "   ", "third page"]
+    with session_factory() as db:
+        document_id = create_document(db, title="report.pdf", file_path="v1.pdf").id
+
+    job = _ingest(document_id, "v1.pdf")
+
+    assert job["stage"] == "completed"
+    assert job["pages_total"] == 3
+    assert job["pages_parsed"] == 3
+    # The blank page has nothing to embed
+    assert vector_store.stored == [1, 3]
+    with session_factory() as db:
+        assert get_document(db, document_id).is_processed
+        assert _pages(db, document_id) == {1: ("first page", True), 2: ("   ", True), 3: ("third page", True)}
+
+
+def test_pipeline_fails_the_job_for_an_empty_pdf(session_factory, vector_store, pdf):
+    pdf["empty.pdf"] = []
+    with session_factory() as db:
+        document_id = create_document(db, title="empty.pdf", file_path="empty.pdf").id
+
+    job = _ingest(document_id, "empty.pdf")
+
+    assert job["stage"] == "failed"
+    assert job["error"]
+    with session_factory() as db:
+        assert not get_document(db, document_id).is_processed
+
+
+def test_revision_reembeds_changed_pages_and_drops_removed_ones(session_factory, vector_store, pdf):
+    pdf["v1.pdf"] = ["intro", "old body", "appendix", "index"]
+    pdf["v2.pdf"] = ["intro", "new body"]
+    with session_factory() as db:
+        document_id = create_document(db, title="report.pdf", file_path="v1.pdf", content_hash="v1").id
+    _ingest(document_id, "v1.pdf")
+    vector_store.stored.clear()
+
+    job = _ingest(document_id, "v2.pdf")
+
+    assert job["stage"] == "completed"
+    assert job["pages_unchanged"] == 1
+    assert vector_store.stored == [2]
+    assert vector_store.deleted == [([2], None), (None, 2)]
+    with session_factory() as db:
+        assert get_document(db, document_id).is_processed
+        assert _pages(db, document_id) == {1: ("intro", True), 2: ("new body", True)}
+
+
+def test_unchanged_revision_embeds_nothing(session_factory, vector_store, pdf):
+    pdf["v1.pdf"] = ["intro", "body"]
+    with session_factory() as db:
+        document_id = create_document(db, title="report.pdf", file_path="v1.pdf", content_hash="v1").id
+    _ingest(document_id, "v1.pdf")
+    vector_store.stored.clear()
+
+    job = _ingest(document_id, "v1.pdf")
+
+    assert job["pages_unchanged"] == 2
+    assert vector_store.stored == []
+    assert vector_store.deleted == []
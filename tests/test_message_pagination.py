@@ -0,0 +1,97 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.crud.message_crud import create_messages, get_messages_page
+from app.models import Message
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def _insert_at(db, timestamp: str, content: str):
+    # Written as text in the format SQLite uses for CURRENT_TIMESTAMP
+    db.execute(text("INSERT INTO messages (content, is_ai, timestamp) VALUES (:content, 0, :timestamp)"),
+               {"content": content, "timestamp": timestamp})
+    db.commit()
+
+
+def test_pages_split_rows_with_equal_timestamps(db):
+    # One statement, so every row gets the same CURRENT_TIMESTAMP
+    stored = create_messages(db, [{"content": f"m{i}", "is_ai": False} for i in range(5)])
+    assert len({message["timestamp"] for message in stored}) == 1
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = get_messages_page(db, limit=2, after_id=cursor)
+        seen.extend(message["id"] for message in page)
+        if cursor is None:
+            break
+        assert len(page) == 2
+
+    assert seen == [message["id"] for message in stored]
+
+
+def test_last_full_page_has_no_cursor(db):
+    create_messages(db, [{"content": f"m{i}", "is_ai": False} for i in range(4)])
+
+    page, cursor = get_messages_page(db, limit=2)
+    assert cursor == page[-1]["id"]
+    page, cursor = get_messages_page(db, limit=2, after_id=cursor)
+    assert len(page) == 2
+    assert cursor is None
+
+
+def test_since_and_until_compare_with_whole_second_timestamps(db):
+    _insert_at(db, "2024-01-01 09:59:59", "before")
+    _insert_at(db, "2024-01-01 10:00:00", "at since")
+    _insert_at(db, "2024-01-01 10:30:00", "between")
+    _insert_at(db, "2024-01-01 11:00:00", "at until")
+
+    page, cursor = get_messages_page(db, since=datetime(2024, 1, 1, 10), until=datetime(2024, 1, 1, 11))
+
+    assert [message["content"] for message in page] == ["at since", "between"]
+    assert cursor is None
+
+
+def test_since_and_until_keep_fractional_seconds(db):
+    _insert_at(db, "2024-01-01 12:00:00.200000", "early in the second")
+    _insert_at(db, "2024-01-01 12:00:00.800000", "late in the second")
+    _insert_at(db, "2024-01-01 12:00:01", "next second")
+
+    page, _ = get_messages_page(db, since=datetime(2024, 1, 1, 12, 0, 0, 700000))
+    assert [message["content"] for message in page] == ["late in the second", "next second"]
+
+    page, _ = get_messages_page(db, until=datetime(2024, 1, 1, 12, 0, 0, 700000))
+    assert [message["content"] for message in page] == ["early in the second"]
+
+
+def test_deleted_cursor_row_continues_after_its_id(db):
+    stored = create_messages(db, [{"content": f"m{i}", "is_ai": False} for i in range(4)])
+    page, cursor = get_messages_page(db, limit=2)
+    db.query(Message).filter(Message.id == cursor).delete()
+    db.commit()
+
+    page, cursor = get_messages_page(db, limit=2, after_id=cursor)
+
+    assert [message["id"] for message in page] == [message["id"] for message in stored[2:]]
+    assert cursor is None
+
+
+def test_fields_are_projected(db):
+    create_messages(db, [{"content": "hello", "is_ai": True}])
+
+    page, _ = get_messages_page(db, fields=["content"])
+
+    assert page == [{"id": page[0]["id"], "content": "hello"}]
@@ -0,0 +1,85 @@
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.crud.message_crud import conversation_turn_rows
+from app.models import Message
+from app.services.message_writer import GroupCommitWriter
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    # A file database, so the writer thread and the test see the same rows
+    engine = create_engine(f"sqlite:///{tmp_path / 'messages.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _turns(count: int) -> list[list[dict]]:
+    return [conversation_turn_rows(f"question {i}", f"answer {i}", "food", "local") for i in range(count)]
+
+
+def test_concurrent_writes_share_one_commit(session_factory):
+    writer = GroupCommitWriter(session_factory, window=0.5)
+    writer.start()
+    try:
+        futures = [writer.submit(rows) for rows in _turns(10)]
+        results = [future.result(timeout=5) for future in futures]
+    finally:
+        writer.stop()
+
+    assert writer.batches == 1
+    assert writer.writes == 10
+    for i, (user_message, ai_message) in enumerate(results):
+        assert user_message["content"] == f"question {i}"
+        assert ai_message["content"] == f"answer {i}"
+        assert ai_message["is_ai"] and ai_message["id"] == user_message["id"] + 1
+
+    with session_factory() as db:
+        assert db.scalar(select(Message.content).order_by(Message.id.desc()).limit(1)) == "answer 9"
+        assert len(db.scalars(select(Message.id)).all()) == 20
+        assert db.get(Message, results[0][0]["id"]).classification_source == "local"
+
+
+def test_batches_are_capped_at_max_batch(session_factory):
+    writer = GroupCommitWriter(session_factory, window=0.5, max_batch=4)
+    writer.start()
+    try:
+        futures = [writer.submit(rows) for rows in _turns(10)]
+        for future in futures:
+            future.result(timeout=5)
+    finally:
+        writer.stop()
+
+    assert writer.batches == 3
+    assert writer.writes == 10
+
+
+def test_failed_write_does_not_fail_the_rest_of_its_batch(session_factory):
+    writer = GroupCommitWriter(session_factory, window=0.5)
+    writer.start()
+    try:
+        good = writer.submit(conversation_turn_rows("question", "answer"))
+        bad = writer.submit([{"content": None, "is_ai": False}])
+        user_message, ai_message = good.result(timeout=5)
+        with pytest.raises(Exception):
+            bad.result(timeout=5)
+    finally:
+        writer.stop()
+
+    assert ai_message["content"] == "answer"
+    with session_factory() as db:
+        assert db.scalars(select(Message.content).order_by(Message.id)).all() == ["question", "answer"]
+
+
+def test_stop_writes_everything_already_queued(session_factory):
+    writer = GroupCommitWriter(session_factory, window=5)
+    writer.start()
+    futures = [writer.submit(rows) for rows in _turns(3)]
+    writer.stop()
+
+    assert all(future.done() for future in futures)
+    assert writer.writes == 3
+    with pytest.raises(RuntimeError):
+        writer.submit(conversation_turn_rows("question", "answer"))
@@ -0,0 +1,86 @@
+import pytest
+from app.services import providers
+from app.services.providers import Provider, ProviderUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(providers.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def provider():
+    return Provider("test-breaker", retries=0, breaker_threshold=2, breaker_reset=30.0)
+
+
+def fail():
+    raise ConnectionError("unreachable")
+
+
+def succeed():
+    return "ok"
+
+
+def test_circuit_opens_after_consecutive_failures(provider, clock):
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            provider.call(fail)
+    assert provider.state == "open"
+
+    calls = []
+    with pytest.raises(ProviderUnavailable):
+        provider.call(lambda: calls.append(1))
+    assert calls == []
+    assert provider.stats()["rejected"] == 1
+
+
+def test_non_retryable_errors_do_not_open_the_circuit(provider, clock):
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            provider.call(lambda: (_ for _ in ()).throw(ValueError("bad request")))
+    assert provider.state == "closed"
+
+
+def test_failed_trial_call_reopens_the_circuit(provider, clock):
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            provider.call(fail)
+
+    clock.now += 30.0
+    assert provider.state == "half-open"
+    with pytest.raises(ConnectionError):
+        provider.call(fail)
+    assert provider.state == "open"
+
+    # The reset period starts again from the failed trial
+    clock.now += 29.0
+    with pytest.raises(ProviderUnavailable):
+        provider.call(succeed)
+
+
+def test_successful_trial_call_closes_the_circuit(provider, clock):
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            provider.call(fail)
+    clock.now += 30.0
+
+    def trial():
+        # Only one trial call is let through while the circuit is half-open
+        with pytest.raises(ProviderUnavailable):
+            provider.call(succeed)
+        return "ok"
+
+    assert provider.call(trial) == "ok"
+    assert provider.state == "closed"
+    assert provider.call(succeed) == "ok"
+    assert provider.stats()["in_flight"] == 0
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.services import weather_service
+
+READING = {"location": {"name": "Lagos"}, "current": {"temp_c": 30}}
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        if self.data is None:
+            raise ValueError("Invalid JSON")
+        return self.data
+
+
+class FakeSession:
+    """
+    Stands in for the pooled requests.Session; holds every call for `delay` seconds.
+    """
+
+    def __init__(self, data=READING, delay=0.0):
+        self.data = data
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return FakeResponse(self.data)
+
+
+class FakeAsyncClient:
+    def __init__(self, data=READING, delay=0.0):
+        self.data = data
+        self.delay = delay
+        self.calls = 0
+
+    async def get(self, url, params=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return FakeResponse(self.data)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    weather_service.weather_cache.clear()
+    yield
+    weather_service.weather_cache.clear()
+
+
+def test_concurrent_fetches_for_a_city_share_one_call(monkeypatch):
+    session = FakeSession(delay=0.2)
+    monkeypatch.setattr(weather_service, "_get_session", lambda: session)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda city: results.append(weather_service.get_weather_data(city)), args=(city,))
+        for city in ["Lagos", "lagos", " Lagos "] * 3
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert session.calls == 1
+    assert results == [READING] * 9
+    # Served from the cache once the shared call has completed
+    assert weather_service.get_weather_data("LAGOS") == READING
+    assert session.calls == 1
+
+
+def test_concurrent_async_fetches_for_a_city_share_one_call(monkeypatch):
+    client = FakeAsyncClient(delay=0.1)
+    monkeypatch.setattr(weather_service, "_get_async_client", lambda: client)
+
+    async def fetch_all():
+        return await asyncio.gather(*(weather_service.aget_weather_data("Lagos") for _ in range(10)))
+
+    assert asyncio.run(fetch_all()) == [READING] * 10
+    assert client.calls == 1
+
+
+def test_failed_refresh_serves_the_stale_reading(monkeypatch):
+    # Fetched long enough ago to be stale, but still within the stale window
+    fetched_at = time.monotonic() - weather_service.WEATHER_CACHE_TTL - 1
+    weather_service.weather_cache.set("lagos", (READING, fetched_at))
+    session = FakeSession(data=None)
+    monkeypatch.setattr(weather_service, "_get_session", lambda: session)
+    client = FakeAsyncClient(data=None)
+    monkeypatch.setattr(weather_service, "_get_async_client", lambda: client)
+
+    assert weather_service.get_weather_data("Lagos") == READING
+    assert asyncio.run(weather_service.aget_weather_data("Lagos")) == READING
+    assert session.calls == 1
+    assert client.calls == 1
+
+
+def test_failed_fetch_without_a_reading_returns_the_error(monkeypatch):
+    session = FakeSession(data=None)
+    monkeypatch.setattr(weather_service, "_get_session", lambda: session)
+
+    assert weather_service.get_weather_data("Lagos") == weather_service.WEATHER_ERROR